@@ -0,0 +1,303 @@
+"""
+四川麻将对局存档分析
+重置游戏前把整场对局按列存为 NumPy 数组（每场一个 .npz 文件），
+跨场次的查询（一段时间内各玩家胜率、最赚钱的番型等）全部向量化计算（需要安装numpy）
+"""
+
+import argparse
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖
+    np = None
+
+from mahjong_engine import hand_from_record
+
+ARCHIVE_DIR = "mahjong_archive"
+# 记录时间的格式为 "%Y-%m-%d %H:%M:%S"；按正则解析比 strptime 快得多
+TIME_PATTERN = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2}) (\d{1,2}):(\d{1,2}):(\d{1,2})')
+# 番型位掩码和胡家位掩码均为 int64
+MAX_FAN_NAMES = 63
+MAX_SEATS = 63
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("对局存档分析需要安装numpy: pip install numpy")
+
+
+def timestamp_epoch(timestamp: str) -> int:
+    """记录时间转为Unix时间戳，无法解析时返回 0"""
+    match = TIME_PATTERN.fullmatch(timestamp) if isinstance(timestamp, str) else None
+    if match is None:
+        return 0
+    try:
+        return int(time.mktime(datetime(*map(int, match.groups())).timetuple()))
+    except (OverflowError, ValueError):
+        return 0
+
+
+# ---------- 写入 ----------
+def session_columns(history: Iterable[Dict], players: List[str]) -> Dict:
+    """把一场对局的记录转换为按列存放的数组
+
+    players 为本场最终的玩家名单（中途改名时按座位对应），
+    记录中多于 players 的玩家按姓名追加为新的座位；
+    番型按本场出现的顺序编号（fan_names），fan_mask 的第 i 位表示 fan_names[i]；
+    查叫、刮风下雨等结算记录的 settlement 为 True，胡家、番型为空
+    """
+    _require_numpy()
+    players = list(players)
+    n_seats = len(players)
+    if n_seats > MAX_SEATS:
+        raise ValueError(f"玩家过多（最多{MAX_SEATS}人）")
+    extra_seats: Dict[str, int] = {}
+    fan_names: Dict[str, int] = {}
+    modes: Dict[str, int] = {}
+    columns = {name: [] for name in ('round', 'hand', 'winner_mask', 'pao', 'fan_mask',
+                                     'mode', 'settlement', 'time', 'deltas')}
+
+    for rec in history:
+        seat_of = {}
+        for i, p in enumerate(rec['scores']):
+            if i < n_seats:
+                seat_of[p] = i
+                continue
+            if p not in extra_seats:
+                if len(players) >= MAX_SEATS:
+                    raise ValueError(f"玩家过多（最多{MAX_SEATS}人）")
+                extra_seats[p] = len(players)
+                players.append(p)
+            seat_of[p] = extra_seats[p]
+        deltas = [0] * len(players)
+        for p, sc in rec['scores'].items():
+            deltas[seat_of[p]] = sc
+        hand = hand_from_record(rec)
+        winner_mask = fan_mask = 0
+        pao = -1
+        if not rec.get('settlement'):
+            for w in hand['winners']:
+                if w in seat_of:
+                    winner_mask |= 1 << seat_of[w]
+            for name in hand['types']:
+                if name not in fan_names:
+                    if len(fan_names) >= MAX_FAN_NAMES:
+                        raise ValueError(f"番型过多（最多{MAX_FAN_NAMES}种）")
+                    fan_names[name] = len(fan_names)
+                fan_mask |= 1 << fan_names[name]
+            pao = seat_of.get(hand['pao'], -1)
+
+        columns['round'].append(rec['round'])
+        columns['hand'].append(rec.get('hand_num', 1))
+        columns['winner_mask'].append(winner_mask)
+        columns['pao'].append(pao)
+        columns['fan_mask'].append(fan_mask)
+        columns['mode'].append(modes.setdefault(hand['mode'], len(modes)))
+        columns['settlement'].append(bool(rec.get('settlement')))
+        columns['time'].append(timestamp_epoch(rec.get('timestamp')))
+        columns['deltas'].append(deltas)
+
+    return {
+        'round': np.array(columns['round'], dtype=np.int32),
+        'hand': np.array(columns['hand'], dtype=np.int32),
+        'winner_mask': np.array(columns['winner_mask'], dtype=np.int64),
+        'pao': np.array(columns['pao'], dtype=np.int8),
+        'fan_mask': np.array(columns['fan_mask'], dtype=np.int64),
+        'mode': np.array(columns['mode'], dtype=np.int8),
+        'settlement': np.array(columns['settlement'], dtype=bool),
+        'time': np.array(columns['time'], dtype=np.int64),
+        'deltas': np.array([row + [0] * (len(players) - len(row)) for row in columns['deltas']],
+                           dtype=np.int64).reshape(-1, len(players)),
+        'players': np.array(players, dtype=str),
+        'fan_names': np.array(list(fan_names), dtype=str),
+        'modes': np.array(list(modes), dtype=str),
+    }
+
+
+def archive_session(history: Iterable[Dict], players: List[str],
+                    directory: str = ARCHIVE_DIR) -> Optional[str]:
+    """把一场对局写入存档目录，返回文件路径（没有记录时不写入，返回 None）"""
+    columns = session_columns(history, players)
+    if not len(columns['round']):
+        return None
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(directory, f"session_{stamp}.npz")
+    n = 1
+    while os.path.exists(path):
+        n += 1
+        path = os.path.join(directory, f"session_{stamp}_{n}.npz")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **columns)
+    os.replace(tmp_path, path)
+    return path
+
+
+# ---------- 读取 ----------
+class Archive:
+    """全部场次拼接后的列式数据
+
+    玩家、番型、模式在各场次中的编号统一映射为全局编号（players / fan_names / modes），
+    session_players 为每场各座位的全局玩家编号（座位为空时为 -1）；
+    各列按场次顺序拼接，同一场的记录是连续的，按玩家汇总时先按场次分段求和
+    """
+
+    def __init__(self, sessions: List[Dict]):
+        _require_numpy()
+        self.players = sorted({str(p) for s in sessions for p in s['players']})
+        self.fan_names = list(dict.fromkeys(str(f) for s in sessions for f in s['fan_names']))
+        self.modes = sorted({str(m) for s in sessions for m in s['modes']})
+        width = max([len(s['players']) for s in sessions] or [4])
+        player_index = {p: i for i, p in enumerate(self.players)}
+        fan_index = {f: i for i, f in enumerate(self.fan_names)}
+        mode_index = {m: i for i, m in enumerate(self.modes)}
+
+        parts = {name: [] for name in ('session', 'round', 'hand', 'winner_mask', 'pao',
+                                       'fan_mask', 'mode', 'settlement', 'time', 'deltas')}
+        self.session_players = np.full((len(sessions), width), -1, dtype=np.int64)
+        for i, s in enumerate(sessions):
+            n = len(s['round'])
+            self.session_players[i, :len(s['players'])] = [player_index[str(p)]
+                                                           for p in s['players']]
+            deltas = np.zeros((n, width), dtype=np.int64)
+            deltas[:, :s['deltas'].shape[1]] = s['deltas']
+            # 本场番型位 -> 全局番型位
+            fan_mask = np.zeros(n, dtype=np.int64)
+            for bit, name in enumerate(s['fan_names']):
+                fan_mask |= ((s['fan_mask'] >> bit) & 1) << fan_index[str(name)]
+
+            parts['session'].append(np.full(n, i, dtype=np.int32))
+            parts['deltas'].append(deltas)
+            parts['fan_mask'].append(fan_mask)
+            modes = np.array([mode_index[str(m)] for m in s['modes']], dtype=np.int8)
+            parts['mode'].append(modes[s['mode']] if len(modes) else s['mode'])
+            for name in ('round', 'hand', 'winner_mask', 'pao', 'settlement', 'time'):
+                parts[name].append(s[name])
+
+        for name, arrays in parts.items():
+            if arrays:
+                value = np.concatenate(arrays)
+            elif name == 'deltas':
+                value = np.zeros((0, width), dtype=np.int64)
+            else:
+                value = np.zeros(0, dtype=np.int64)
+            setattr(self, name, value)
+        self.n_sessions = len(sessions)
+        self.width = width
+
+    def __len__(self) -> int:
+        return len(self.round)
+
+    def select(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+               mode: Optional[str] = None, hands_only: bool = True):
+        """返回满足条件的行的布尔掩码；hands_only 时排除查叫、刮风下雨等结算记录"""
+        mask = ~self.settlement if hands_only else np.ones(len(self), dtype=bool)
+        if since is not None:
+            mask &= self.time >= int(since.timestamp())
+        if until is not None:
+            mask &= self.time < int(until.timestamp())
+        if mode is not None:
+            if mode not in self.modes:
+                return np.zeros(len(self), dtype=bool)
+            mask &= self.mode == self.modes.index(mode)
+        return mask
+
+    def _is_winner(self, rows):
+        seats = np.arange(self.width, dtype=np.int8)
+        return (self.winner_mask[rows, None] >> seats) & 1 == 1
+
+    def _by_player(self, rows, values):
+        """把选中行的 values（行数×座位）按玩家求和"""
+        totals = np.zeros(len(self.players), dtype=np.int64)
+        sessions = self.session[rows]
+        if not len(sessions):
+            return totals
+        starts = np.flatnonzero(np.r_[True, sessions[1:] != sessions[:-1]])
+        sums = np.add.reduceat(values, starts, axis=0, dtype=np.int64)
+        ids = self.session_players[sessions[starts]]
+        seated = ids >= 0
+        np.add.at(totals, ids[seated], sums[seated])
+        return totals
+
+    def win_rate(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 mode: Optional[str] = None) -> Dict[str, Tuple[int, int, float]]:
+        """各玩家的 (参与手数, 胡牌次数, 胜率)"""
+        rows = self.select(since, until, mode)
+        won = self._is_winner(rows)
+        hands = self._by_player(rows, np.ones((1, self.width), dtype=bool).repeat(len(won), 0))
+        wins = self._by_player(rows, won)
+        return {p: (int(h), int(w), w / h if h else 0.0)
+                for p, h, w in zip(self.players, hands, wins) if h}
+
+    def player_totals(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                      mode: Optional[str] = None) -> Dict[str, int]:
+        """各玩家的累计得分（包含查叫、刮风下雨等结算记录）"""
+        rows = self.select(since, until, mode, hands_only=False)
+        totals = self._by_player(rows, self.deltas[rows])
+        return {p: int(t) for p, t in zip(self.players, totals)}
+
+    def fan_profit(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                   mode: Optional[str] = None) -> List[Tuple[str, int, int]]:
+        """各番型的 (番型, 出现手数, 胡家总收入)，按收入从高到低排列"""
+        rows = self.select(since, until, mode)
+        # 胡牌记录中只有胡家得分为正
+        gain = np.maximum(self.deltas[rows], 0).sum(axis=1)
+        fan_mask = self.fan_mask[rows]
+        result = []
+        for bit, name in enumerate(self.fan_names):
+            has = (fan_mask & (1 << bit)) != 0
+            result.append((name, int(np.count_nonzero(has)), int(gain[has].sum())))
+        result.sort(key=lambda item: item[2], reverse=True)
+        return result
+
+
+def load_archive(directory: str = ARCHIVE_DIR) -> Archive:
+    """读取存档目录中的全部场次"""
+    _require_numpy()
+    sessions = []
+    if os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith('.npz'):
+                with np.load(os.path.join(directory, filename)) as data:
+                    sessions.append({name: data[name] for name in data.files})
+    return Archive(sessions)
+
+
+# ---------- 命令行 ----------
+def format_report(archive: Archive, since: Optional[datetime] = None) -> str:
+    lines = [f"共{archive.n_sessions}场 {len(archive)}条记录"
+             + (f"，统计 {since.strftime('%Y-%m-%d')} 以来" if since else "")]
+    lines.append("\n胜率:")
+    rates = sorted(archive.win_rate(since).items(), key=lambda item: item[1][2], reverse=True)
+    for p, (hands, wins, rate) in rates:
+        lines.append(f"  {p}: {wins}/{hands} {rate:.1%}")
+    lines.append("\n累计得分:")
+    for p, total in sorted(archive.player_totals(since).items(), key=lambda item: item[1],
+                           reverse=True):
+        lines.append(f"  {p}: {total:+d}")
+    lines.append("\n番型收益:")
+    for name, count, gain in archive.fan_profit(since):
+        lines.append(f"  {name}: {count}手 {gain:+d}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="四川麻将对局存档分析")
+    parser.add_argument("--dir", default=ARCHIVE_DIR, help="存档目录")
+    parser.add_argument("--months", type=int, default=None, help="只统计最近几个月")
+    args = parser.parse_args()
+
+    since = None
+    if args.months:
+        since = datetime.now() - timedelta(days=30 * args.months)
+    print(format_report(load_archive(args.dir), since))
+
+
+if __name__ == "__main__":
+    main()
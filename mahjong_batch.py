@@ -0,0 +1,129 @@
+"""
+四川麻将批量结算
+基于NumPy的向量化结算，用于整季历史记录的重新计分（需要安装numpy）
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖
+    np = None
+
+from mahjong_engine import INT64_MAX, get_rules, hand_from_record, lookup_fan, type_mask
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("批量结算需要安装numpy: pip install numpy")
+
+
+def settle_arrays(winner_mask, pao, total_fan, zimo,
+                  n_players: int = 4, base: int = 1, cap: Optional[int] = None):
+    """向量化结算，返回 N×P 的分数矩阵
+
+    winner_mask: 每手胡家的座位位掩码（第i位表示第i个玩家胡牌）
+    pao:         点炮玩家座位号，-1 表示无点炮
+    total_fan:   总番数
+    zimo:        是否自摸（自摸或无点炮时按自摸结算）
+    cap:         封顶番数，None 表示不封顶
+
+    两种模式共用同一公式：传统模式只有一名胡家，胡家收取
+    单家分值 × 未胡家人数，与血流成河自摸结算一致。
+    """
+    _require_numpy()
+    winner_mask = np.asarray(winner_mask, dtype=np.int64)
+    pao = np.asarray(pao, dtype=np.int64)
+    total_fan = np.asarray(total_fan, dtype=np.int64)
+    zimo = np.asarray(zimo, dtype=bool) | (pao < 0)
+
+    if cap is not None:
+        total_fan = np.minimum(total_fan, cap)
+
+    # 单手最大分数 = 单家分值 × (人数-1)，超出 int64 时报错而不是溢出
+    if total_fan.size:
+        max_fan = int(total_fan.max())
+        if base * (2 ** max_fan) * max(n_players - 1, 1) > INT64_MAX:
+            raise ValueError(f"番数过大（{max_fan}番），超出int64范围，请设置封顶番数")
+
+    seats = np.arange(n_players, dtype=np.int64)
+    is_winner = (winner_mask[:, None] >> seats) & 1 == 1
+    n_winners = is_winner.sum(axis=1)
+    n_losers = n_players - n_winners
+    final = np.int64(base) << total_fan
+
+    # 自摸：每个胡家从每个未胡家收取分数
+    zimo_scores = np.where(is_winner,
+                           (final * n_losers)[:, None],
+                           -(final * n_winners)[:, None])
+
+    # 点炮：点炮玩家承担所有胡家的分数，其他人不计分
+    is_pao = seats == pao[:, None]
+    pao_scores = np.where(is_winner, final[:, None], 0)
+    pao_scores = np.where(is_pao, -(final * n_winners)[:, None], pao_scores)
+
+    return np.where(zimo[:, None], zimo_scores, pao_scores)
+
+
+def history_to_arrays(history: Iterable[Dict]) -> Dict:
+    """把 game_history 记录转换为结算所需的数组
+
+    total_fan 已按各记录所属模式的封顶番数截断；
+    查叫等结算记录不是一手牌，对应行不计分，
+    其原始分数放在 settlement_scores 中（按基础分1记录）
+    """
+    _require_numpy()
+    winner_mask: List[int] = []
+    pao: List[int] = []
+    total_fan: List[int] = []
+    zimo: List[bool] = []
+    settlement: List[bool] = []
+    settlement_scores: List[List[int]] = []
+    n_players = 0
+
+    for rec in history:
+        n_players = max(n_players, len(rec['scores']))
+        settlement_scores.append(list(rec['scores'].values()))
+        settlement.append(bool(rec.get('settlement')))
+        if rec.get('settlement'):
+            winner_mask.append(0)
+            pao.append(-1)
+            total_fan.append(0)
+            zimo.append(True)
+            continue
+
+        hand = hand_from_record(rec)
+        seats = {p: i for i, p in enumerate(hand['players'])}
+        entry = lookup_fan(hand['mode'], type_mask(hand['mode'], hand['types']))
+
+        mask = 0
+        for w in hand['winners']:
+            mask |= 1 << seats[w]
+        winner_mask.append(mask)
+        pao.append(seats[hand['pao']] if hand['pao'] else -1)
+        cap = get_rules(hand['mode']).cap
+        total_fan.append(entry.total_fan if cap is None else min(entry.total_fan, cap))
+        zimo.append(entry.is_zimo)
+
+    return {
+        'winner_mask': np.array(winner_mask, dtype=np.int64),
+        'pao': np.array(pao, dtype=np.int64),
+        'total_fan': np.array(total_fan, dtype=np.int64),
+        'zimo': np.array(zimo, dtype=bool),
+        'settlement': np.array(settlement, dtype=bool),
+        'settlement_scores': np.array([row + [0] * (n_players - len(row))
+                                       for row in settlement_scores],
+                                      dtype=np.int64).reshape(-1, n_players or 4),
+        'n_players': n_players or 4,
+    }
+
+
+def rescore_history(history: Iterable[Dict], base: int = 1, cap: Optional[int] = None):
+    """按新的基础分（和封顶番数）重新结算全部历史，返回 N×P 分数矩阵"""
+    arrays = history_to_arrays(history)
+    scores = settle_arrays(arrays['winner_mask'], arrays['pao'],
+                           arrays['total_fan'], arrays['zimo'],
+                           arrays['n_players'], base, cap)
+    # 结算记录的分数与基础分成正比
+    return np.where(arrays['settlement'][:, None],
+                    arrays['settlement_scores'] * base, scores)
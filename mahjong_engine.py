@@ -0,0 +1,287 @@
+"""
+四川麻将计分引擎
+纯Python实现，不依赖tkinter，可在无界面环境下单手或批量计分
+"""
+
+import re
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from mahjong_rules import FanEntry, RuleSet, load_rule_sets
+
+MODE_TRADITIONAL = "传统"
+MODE_XUELIU = "血流成河"
+
+# 编译后的规则（内置规则 + house_rules 目录中的俱乐部规则）
+# 无法加载的俱乐部规则文件记在 SKIPPED_RULES 中：[(文件, 原因)]
+SKIPPED_RULES: List[Tuple[str, str]] = []
+RULE_SETS: Dict[str, RuleSet] = load_rule_sets(skipped=SKIPPED_RULES)
+
+# 各模式的胡牌类型及番数（顺序即界面显示顺序）
+SCORE_TYPES: Dict[str, Dict[str, int]] = {mode: rules.types for mode, rules in RULE_SETS.items()}
+
+SEVEN_PAIR_TYPES = ['七对', '龙七对', '清七对', '清龙七对']
+
+# 积分以 int64 存放，单手分数和累计积分都不能超出该范围
+INT64_MAX = 2 ** 63 - 1
+INT64_MIN = -2 ** 63
+
+
+# ---------- 番型 ----------
+def get_rules(mode: str) -> RuleSet:
+    rules = RULE_SETS.get(mode)
+    if rules is None:
+        raise ValueError(f"未知的计分模式: {mode}")
+    return rules
+
+
+def type_bits(mode: str) -> Dict[str, int]:
+    """各胡牌类型对应的位（按界面顺序从低位开始）"""
+    return dict(get_rules(mode).bits)
+
+
+def type_mask(mode: str, selected: Iterable[str]) -> int:
+    """把所选胡牌类型编码为位掩码"""
+    bits = get_rules(mode).bits
+    mask = 0
+    for name in selected:
+        if name not in bits:
+            raise ValueError(f"未知的胡牌类型: {name}")
+        mask |= bits[name]
+    return mask
+
+
+def lookup_fan(mode: str, mask: int) -> FanEntry:
+    """按位掩码查表，得到合法性、总番数、描述和错误信息"""
+    table = get_rules(mode).table
+    if not 0 <= mask < len(table):
+        raise ValueError(f"无效的胡牌类型掩码: {mask}")
+    return table[mask]
+
+
+def collect_fan_info(mode: str, selected: Iterable[str]):
+    """统计所选胡牌类型的总番数，返回 (总番数, 描述列表, 是否自摸)"""
+    entry = lookup_fan(mode, type_mask(mode, selected))
+    if not entry.valid:
+        raise ValueError(entry.error)
+    desc = entry.description.split(' + ') if entry.description else []
+    return entry.total_fan, desc, entry.is_zimo
+
+
+FAN_TABLES: Dict[str, List[FanEntry]] = {mode: rules.table for mode, rules in RULE_SETS.items()}
+
+
+def set_limits(mode: str, base: Optional[int] = None, cap: Optional[int] = -1):
+    """修改某个模式的底分和封顶番数（cap 为 None 表示不封顶，省略时保持不变）"""
+    rules = get_rules(mode)
+    if base is None:
+        base = rules.base
+    if cap == -1:
+        cap = rules.cap
+    if not isinstance(base, int) or base < 1:
+        raise ValueError("底分必须为正整数")
+    if cap is not None and (not isinstance(cap, int) or cap < 0):
+        raise ValueError("封顶番数必须为非负整数")
+    RULE_SETS[mode] = rules._replace(base=base, cap=cap)
+
+
+# ---------- 结算 ----------
+def score_fan(mode: str, types: Union[int, Iterable[str]], base: Optional[int] = None) -> Dict:
+    """一手牌与胡家、点炮无关的部分：番型、番数和单家分值
+
+    返回 description / total_fan / final / is_zimo / types；番型不合法时抛出 ValueError
+    """
+    rules = get_rules(mode)
+    mask = types if isinstance(types, int) else type_mask(mode, types)
+    entry = lookup_fan(mode, mask)
+    if not entry.valid:
+        raise ValueError(entry.error)
+    if entry.total_fan == 0:
+        raise ValueError("请选择至少一种胡牌类型")
+    if base is None:
+        base = rules.base
+    capped = entry.total_fan if rules.cap is None else min(entry.total_fan, rules.cap)
+    return {
+        'description': entry.description,
+        'total_fan': entry.total_fan,
+        'capped': capped,
+        'final': base * (2 ** capped),
+        'is_zimo': entry.is_zimo,
+        'types': list(entry.types),
+    }
+
+
+def settle_hand(players: List[str], mode: str, winners: List[str], fan: Dict,
+                pao: str = "") -> Dict:
+    """按 score_fan 的结果在胡家、点炮玩家之间分配分数，返回值同 score_hand"""
+    rules = get_rules(mode)
+    winners = [p for p in players if p in winners]
+    rules.check_winners(winners)
+
+    pao = pao or ""
+    if pao and pao not in players:
+        raise ValueError(f"未知的点炮玩家: {pao}")
+
+    is_zimo = fan['is_zimo']
+    round_scores = rules.settle(players, winners, fan['final'], is_zimo, pao)
+    if any(not INT64_MIN <= sc <= INT64_MAX for sc in round_scores.values()):
+        raise ValueError(f"分数超出范围（{fan['capped']}番，单家{fan['final']}分），"
+                         f"请在规则中设置封顶番数")
+
+    return {
+        'winners': winners,
+        'description': fan['description'],
+        'scores': round_scores,
+        'total_fan': fan['total_fan'],
+        'final': fan['final'],
+        'pao': "" if is_zimo else pao,
+        'is_zimo': is_zimo or not pao,
+        'types': list(fan['types']),
+    }
+
+
+def score_hand(players: List[str], mode: str, winners: List[str],
+               types: Union[int, Iterable[str]], pao: str = "",
+               base: Optional[int] = None) -> Dict:
+    """计算一手牌的分数分配
+
+    types 可以是胡牌类型名称列表，也可以是 type_mask() 得到的位掩码；
+    base 默认取规则中的底分，单家分值按规则封顶。
+    返回结果字典，包含 winners / description / scores / total_fan /
+    final / pao / is_zimo / types；输入不合法时抛出 ValueError
+    """
+    get_rules(mode).check_winners([p for p in players if p in winners])
+    return settle_hand(players, mode, winners, score_fan(mode, types, base), pao)
+
+
+def score_hands(hands: Iterable[Dict], players: Optional[List[str]] = None,
+                mode: Optional[str] = None, base: Optional[int] = None,
+                strict: bool = True) -> List[Optional[Dict]]:
+    """批量计分
+
+    hands 为列表或迭代器，每手是包含 winners / types / pao 的字典，
+    可选 players / mode 覆盖默认值。strict=False 时不合法的手返回 None
+    """
+    results = []
+    for i, hand in enumerate(hands):
+        hand_players = hand.get('players') or players
+        hand_mode = hand.get('mode') or mode
+        try:
+            if not hand_players or not hand_mode:
+                raise ValueError("缺少玩家或计分模式")
+            results.append(score_hand(hand_players, hand_mode,
+                                      _as_list(hand.get('winners')),
+                                      hand.get('types', []),
+                                      hand.get('pao', ""),
+                                      hand.get('base', base)))
+        except ValueError as e:
+            if strict:
+                raise ValueError(f"第{i + 1}手: {e}") from e
+            results.append(None)
+    return results
+
+
+# ---------- 积分账本 ----------
+class ScoreLedger:
+    """各玩家的累计积分
+
+    按座位顺序存放在定长 int64 数组（array('q')）中，可直接交给NumPy做数组运算；
+    用法与 {玩家: 积分} 字典相同，累计积分超出 int64 时抛出 ValueError 且不做修改
+    """
+
+    def __init__(self, players: List[str], totals: Optional[Iterable[int]] = None):
+        self.players = list(players)
+        self.seats = {p: i for i, p in enumerate(self.players)}
+        totals = list(totals) if totals is not None else [0] * len(self.players)
+        if len(totals) != len(self.players):
+            raise ValueError("积分数量与玩家数量不一致")
+        self.totals = array('q', self._checked(totals))
+
+    @staticmethod
+    def _checked(values: List[int]) -> List[int]:
+        for v in values:
+            if not INT64_MIN <= v <= INT64_MAX:
+                raise ValueError(f"累计积分超出int64范围: {v}")
+        return values
+
+    def apply(self, deltas: Dict[str, int], sign: int = 1):
+        """把一手的分数变化计入账本（sign=-1 为撤销），越界时整手都不计入"""
+        new_totals = list(self.totals)
+        for p, sc in deltas.items():
+            new_totals[self.seats[p]] += sign * sc
+        self.totals = array('q', self._checked(new_totals))
+
+    def as_array(self):
+        """零拷贝的 NumPy int64 视图"""
+        import numpy as np
+        return np.frombuffer(self.totals, dtype=np.int64)
+
+    # 与字典相同的读写方式
+    def __getitem__(self, player: str) -> int:
+        return self.totals[self.seats[player]]
+
+    def __setitem__(self, player: str, value: int):
+        self.totals[self.seats[player]] = self._checked([value])[0]
+
+    def __contains__(self, player) -> bool:
+        return player in self.seats
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.players)
+
+    def __len__(self) -> int:
+        return len(self.players)
+
+    def get(self, player: str, default: int = 0) -> int:
+        return self[player] if player in self.seats else default
+
+    def keys(self) -> List[str]:
+        return list(self.players)
+
+    def values(self) -> List[int]:
+        return list(self.totals)
+
+    def items(self) -> List[Tuple[str, int]]:
+        return list(zip(self.players, self.totals))
+
+    def copy(self) -> Dict[str, int]:
+        return dict(self.items())
+
+
+# ---------- 历史记录 ----------
+_DESC_PATTERN = re.compile(r"(\S+?)\((\d+)番\)")
+
+
+def hand_from_record(rec: Dict, mode: Optional[str] = None) -> Dict:
+    """从 game_history 记录还原计分输入，兼容旧版只含描述的记录"""
+    players = list(rec['scores'].keys())
+    winners = _as_list(rec.get('winner'))
+    types = rec.get('types')
+    if types is None:
+        types = [name for name, _ in _DESC_PATTERN.findall(rec.get('description', ''))]
+
+    pao = rec.get('pao')
+    if pao is None:
+        # 旧记录未保存点炮玩家：非自摸时只有点炮玩家失分
+        losing = [p for p, sc in rec['scores'].items() if sc < 0]
+        pao = losing[0] if '自摸' not in types and len(losing) == 1 else ""
+
+    if mode is None:
+        mode = rec.get('mode')
+    if mode is None:
+        xueliu_only = set(SCORE_TYPES[MODE_XUELIU]) - set(SCORE_TYPES[MODE_TRADITIONAL])
+        if len(winners) > 1 or xueliu_only & set(types):
+            mode = MODE_XUELIU
+        else:
+            mode = MODE_TRADITIONAL
+
+    return {'players': players, 'mode': mode, 'winners': winners,
+            'types': types, 'pao': pao}
+
+
+def _as_list(winners) -> List[str]:
+    if not winners:
+        return []
+    if isinstance(winners, str):
+        return [w for w in winners.split(',') if w]
+    return list(winners)
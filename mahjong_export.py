@@ -0,0 +1,206 @@
+"""
+四川麻将结果导出
+历史记录逐条流经生成器，写成文本、CSV、JSONL 或自带样式的 HTML 报告，
+不需要把全部记录读入内存；ExportWorker 在后台线程中导出并回报进度
+"""
+
+import csv
+import html
+import io
+import json
+import os
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+# 每导出多少条记录回报一次进度
+PROGRESS_EVERY = 500
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def _hand_info(rec: Dict) -> str:
+    return f"第{rec.get('hand_num', 1)}手 " if rec.get('hand_num', 1) > 1 else ""
+
+
+def _seat_scores(rec: Dict, n_players: int) -> List[int]:
+    """按座位顺序取分数（玩家改名后旧记录中的姓名不同）"""
+    scores = list(rec['scores'].values())
+    return scores + [0] * (n_players - len(scores))
+
+
+# ---------- 格式 ----------
+# 每种格式为 (记录, 汇总信息) -> 逐段文本 的生成器；
+# 汇总信息包含 players / standings（[(玩家, 积分)]，已按名次排序）/ rounds / exported_at
+def txt_chunks(records: Iterable[Dict], meta: Dict) -> Iterator[str]:
+    yield "四川麻将积分记录\n" + "=" * 30 + "\n"
+    yield f"导出时间: {meta['exported_at']}\n"
+    yield f"总局数: {meta['rounds']}\n\n"
+    yield "最终排名:\n"
+    for i, (p, sc) in enumerate(meta['standings'], 1):
+        yield f"{i}. {p}: {sc}\n"
+    yield "\n详细记录:\n"
+    for rec in records:
+        status = " [进行中]" if not rec.get('round_ended', True) else ""
+        lines = [f"\n第{rec['round']}局{_hand_info(rec)}- {rec['timestamp']}{status}\n",
+                 f"类型: {rec['description']}, 胡牌: {rec['winner']}\n"]
+        lines.extend(f"  {p}: {sc:+d}\n" for p, sc in rec['scores'].items())
+        yield ''.join(lines)
+
+
+def csv_chunks(records: Iterable[Dict], meta: Dict) -> Iterator[str]:
+    """CSV（带BOM，Excel可直接打开），玩家分数按座位排列"""
+    players = meta['players']
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> str:
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    writer.writerow(["局", "手", "时间", "模式", "胡家", "点炮", "番型", "结算", "描述", "已结束"]
+                    + players)
+    yield '\ufeff' + flush()
+    for rec in records:
+        writer.writerow([rec['round'], rec.get('hand_num', 1), rec.get('timestamp', ''),
+                         rec.get('mode', ''), rec.get('winner', ''), rec.get('pao') or '',
+                         ' '.join(rec.get('types') or []), rec.get('settlement', ''),
+                         rec.get('description', ''), int(rec.get('round_ended', True))]
+                        + _seat_scores(rec, len(players)))
+        yield flush()
+
+
+def jsonl_chunks(records: Iterable[Dict], meta: Dict) -> Iterator[str]:
+    """每行一条记录，与存档中的记录格式相同"""
+    for rec in records:
+        yield json.dumps(rec, ensure_ascii=False) + "\n"
+
+
+_HTML_STYLE = """
+body { font-family: Arial, sans-serif; color: #2C3E50; background: #F8F9FA; margin: 24px; }
+h1 { color: #4A90E2; }
+table { border-collapse: collapse; background: #FFFFFF; margin-bottom: 24px; }
+th, td { border: 1px solid #BDC3C7; padding: 4px 10px; font-size: 13px; }
+th { background: #ECF0F1; }
+td.num { text-align: right; }
+.pos { color: #27AE60; }
+.neg { color: #E74C3C; }
+.open { color: #F39C12; }
+"""
+
+
+def html_chunks(records: Iterable[Dict], meta: Dict) -> Iterator[str]:
+    """不依赖外部文件的HTML报告：排名表 + 详细记录表"""
+    esc = html.escape
+    players = meta['players']
+
+    def score_cell(sc: int) -> str:
+        cls = 'pos' if sc > 0 else 'neg' if sc < 0 else ''
+        return f'<td class="num {cls}">{sc:+d}</td>'
+
+    yield ("<!DOCTYPE html>\n<html lang=\"zh\">\n<head>\n<meta charset=\"utf-8\">\n"
+           f"<title>四川麻将积分记录</title>\n<style>{_HTML_STYLE}</style>\n</head>\n<body>\n"
+           "<h1>🀄 四川麻将积分记录</h1>\n"
+           f"<p>导出时间: {esc(meta['exported_at'])} · 总局数: {meta['rounds']}</p>\n"
+           "<h2>最终排名</h2>\n<table>\n<tr><th>名次</th><th>玩家</th><th>积分</th></tr>\n")
+    for i, (p, sc) in enumerate(meta['standings'], 1):
+        yield f"<tr><td>{i}</td><td>{esc(p)}</td>{score_cell(sc)}</tr>\n"
+    yield ("</table>\n<h2>详细记录</h2>\n<table>\n<tr><th>局</th><th>时间</th><th>描述</th>"
+           "<th>胡家</th>" + ''.join(f"<th>{esc(p)}</th>" for p in players) + "</tr>\n")
+    for rec in records:
+        status = ' <span class="open">进行中</span>' if not rec.get('round_ended', True) else ""
+        cells = ''.join(score_cell(sc) for sc in _seat_scores(rec, len(players)))
+        yield (f"<tr><td>第{rec['round']}局{esc(_hand_info(rec))}{status}</td>"
+               f"<td>{esc(rec.get('timestamp', ''))}</td><td>{esc(rec.get('description', ''))}</td>"
+               f"<td>{esc(rec.get('winner', ''))}</td>{cells}</tr>\n")
+    yield "</table>\n</body>\n</html>\n"
+
+
+EXPORT_FORMATS: Dict[str, Callable[[Iterable[Dict], Dict], Iterator[str]]] = {
+    '.txt': txt_chunks,
+    '.csv': csv_chunks,
+    '.jsonl': jsonl_chunks,
+    '.html': html_chunks,
+}
+
+
+def export_records(records: Iterable[Dict], path: str, meta: Dict,
+                   progress: Optional[Callable[[int], None]] = None,
+                   cancelled: Optional[threading.Event] = None) -> int:
+    """按扩展名选择格式逐条写入 path，返回导出的记录数
+
+    先写临时文件，完成后再替换，取消或出错时不会留下不完整的文件
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {ext or '无扩展名'}")
+    count = 0
+
+    def counted() -> Iterator[Dict]:
+        nonlocal count
+        for rec in records:
+            if cancelled is not None and cancelled.is_set():
+                raise ExportCancelled()
+            yield rec
+            count += 1
+            if progress and count % PROGRESS_EVERY == 0:
+                progress(count)
+
+    tmp_path = path + ".tmp"
+    try:
+        # csv 模块自己写 \r\n 行尾；其余格式沿用系统默认的换行
+        newline = '' if ext == '.csv' else None
+        with open(tmp_path, 'w', encoding='utf-8', newline=newline) as f:
+            for chunk in EXPORT_FORMATS[ext](counted(), meta):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    if progress and count % PROGRESS_EVERY:
+        progress(count)
+    return count
+
+
+class ExportWorker:
+    """后台导出线程
+
+    进度、完成和出错都通过 schedule（一般为 root.after）回到主线程处理
+    """
+
+    def __init__(self, records: Iterable[Dict], path: str, meta: Dict, schedule: Callable,
+                 on_progress: Callable[[int], None], on_done: Callable[[str, int], None],
+                 on_error: Callable[[Exception], None]):
+        self.records = records
+        self.path = path
+        self.meta = meta
+        self.schedule = schedule
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="mahjong-export", daemon=True)
+        self.thread.start()
+
+    def is_alive(self) -> bool:
+        return self.thread.is_alive()
+
+    def cancel(self, timeout: float = 2.0):
+        """取消导出并等待线程退出"""
+        self.cancelled.set()
+        self.thread.join(timeout)
+
+    def _run(self):
+        try:
+            count = export_records(self.records, self.path, self.meta,
+                                   lambda n: self.schedule(lambda: self.on_progress(n)),
+                                   self.cancelled)
+        except ExportCancelled:
+            return
+        except Exception as e:
+            self.schedule(lambda e=e: self.on_error(e))
+            return
+        self.schedule(lambda: self.on_done(self.path, count))
@@ -0,0 +1,293 @@
+"""
+四川麻将历史记录索引与统计
+随追加、撤销增量维护，避免在整个 game_history 上反复扫描
+"""
+
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from mahjong_engine import hand_from_record, lookup_fan, type_mask
+
+
+class RoundIndex:
+    """局索引：局号 → 手牌范围，以及当前未结束的局
+
+    位置均为在完整历史中的绝对下标，向前分页加载更早的记录时不会变化
+    """
+
+    def __init__(self):
+        self.rounds: Dict[int, List[int]] = {}  # 局号 -> [首手位置, 手数]
+        self.start = 0   # 已索引的第一条记录位置
+        self.end = 0     # 已索引的最后一条记录之后的位置
+        self.last_round: Optional[int] = None
+        self.open_round: Optional[int] = None
+
+    def rebuild(self, history: List[Dict], start: int = 0):
+        """根据已加载的历史重建索引，start 为第一条记录的绝对位置"""
+        self.rounds = {}
+        self.start = self.end = start
+        self.last_round = self.open_round = None
+        for rec in history:
+            self.append(rec)
+
+    def append(self, rec: Dict):
+        round_num = rec['round']
+        entry = self.rounds.get(round_num)
+        if entry is None:
+            self.rounds[round_num] = [self.end, 1]
+        else:
+            entry[1] += 1
+        self.end += 1
+        self.last_round = round_num
+        self.open_round = None if rec.get('round_ended', True) else round_num
+
+    def prepend(self, records: List[Dict]):
+        """记录更早加载进来的一页记录"""
+        for rec in reversed(records):
+            self.start -= 1
+            entry = self.rounds.get(rec['round'])
+            if entry is None:
+                self.rounds[rec['round']] = [self.start, 1]
+            else:
+                entry[0] = self.start
+                entry[1] += 1
+
+    def pop(self, removed: Dict, last: Optional[Dict]):
+        """撤销最后一条记录，last 为撤销后的最后一条记录"""
+        entry = self.rounds[removed['round']]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.rounds[removed['round']]
+        self.end -= 1
+        if last is None:
+            self.last_round = self.open_round = None
+        else:
+            self.last_round = last['round']
+            self.open_round = None if last.get('round_ended', True) else last['round']
+
+    def end_round(self, round_num: int):
+        if self.open_round == round_num:
+            self.open_round = None
+
+    def hand_count(self, round_num: int) -> int:
+        entry = self.rounds.get(round_num)
+        return entry[1] if entry else 0
+
+    def hand_range(self, round_num: int) -> Tuple[int, int]:
+        """返回该局在完整历史中的 [起, 止) 位置"""
+        first, count = self.rounds[round_num]
+        return first, first + count
+
+
+class _TimelineBlock:
+    """一段连续记录的前缀和，prefix[0] 为该段第一手之前的累计积分"""
+
+    __slots__ = ('prefix', 'peak', 'trough')
+
+    def __init__(self, base: Tuple[int, ...]):
+        self.prefix: List[Tuple[int, ...]] = [base]
+        self.peak: List[Tuple[int, ...]] = [base]
+        self.trough: List[Tuple[int, ...]] = [base]
+
+    def push(self, deltas: List[int]):
+        totals = tuple(t + d for t, d in zip(self.prefix[-1], deltas))
+        self.prefix.append(totals)
+        self.peak.append(tuple(map(max, self.peak[-1], totals)))
+        self.trough.append(tuple(map(min, self.trough[-1], totals)))
+
+    def pop(self):
+        self.prefix.pop()
+        self.peak.pop()
+        self.trough.pop()
+
+
+class ScoreTimeline:
+    """积分前缀和：每手之后各座位的累计积分
+
+    按块存放：启动时加载的记录和之后追加的记录在最后一块，每向前加载一页
+    就在最前面加一块，已有的块不需要改动；块内维护到每个位置为止的最高、
+    最低积分，撤销时直接弹出即可
+    """
+
+    def __init__(self, n_players: int = 4):
+        self.n_players = n_players
+        self._reset(0, (0,) * n_players)
+
+    def _reset(self, start: int, base: Tuple[int, ...]):
+        self.starts: List[int] = [start]   # 各块第一手的绝对位置
+        self.blocks: List[_TimelineBlock] = [_TimelineBlock(base)]
+
+    def rebuild(self, history: List[Dict], totals: List[int], start: int = 0):
+        """根据已加载的历史和当前总分重建，start 为第一条记录的绝对位置"""
+        base = list(totals)
+        for rec in history:
+            for seat, sc in enumerate(rec['scores'].values()):
+                base[seat] -= sc
+        self.n_players = len(base)
+        self._reset(start, tuple(base))
+        for rec in history:
+            self.append(rec)
+
+    def prepend(self, records: List[Dict]):
+        """加载了更早的一页记录，在最前面加一块（只与该页的条数有关）"""
+        if not records:
+            return
+        base = list(self.blocks[0].prefix[0])
+        for rec in records:
+            for seat, sc in enumerate(rec['scores'].values()):
+                base[seat] -= sc
+        block = _TimelineBlock(tuple(base))
+        for rec in records:
+            block.push(list(rec['scores'].values()))
+        self.blocks.insert(0, block)
+        self.starts.insert(0, self.starts[0] - len(records))
+
+    def append(self, rec: Dict):
+        self.blocks[-1].push(list(rec['scores'].values()))
+
+    def pop(self):
+        if len(self.blocks[-1].prefix) == 1 and len(self.blocks) > 1:
+            # 最后一块已撤销空，之后从前一块撤销
+            self.blocks.pop()
+            self.starts.pop()
+        if len(self.blocks[-1].prefix) > 1:
+            self.blocks[-1].pop()
+
+    @property
+    def start(self) -> int:
+        return self.starts[0]
+
+    @property
+    def end(self) -> int:
+        return self.starts[-1] + len(self.blocks[-1].prefix) - 1
+
+    def _locate(self, pos: int) -> Tuple[int, int]:
+        """位置所在的块和块内下标"""
+        b = bisect_right(self.starts, pos) - 1
+        return b, pos - self.starts[b]
+
+    def totals_at(self, pos: int) -> Optional[Tuple[int, ...]]:
+        """前 pos 手结束后的累计积分，未加载到该位置时返回 None"""
+        if not self.start <= pos <= self.end:
+            return None
+        b, i = self._locate(pos)
+        return self.blocks[b].prefix[i]
+
+    def standings_at_round(self, index: RoundIndex, round_num: int) -> Optional[Tuple[int, ...]]:
+        """第 round_num 局结束时的累计积分（第0局即开局）"""
+        if round_num <= 0:
+            return self.totals_at(0)
+        if round_num in index.rounds:
+            return self.totals_at(index.hand_range(round_num)[1])
+        return None
+
+    def round_delta(self, index: RoundIndex, first: int, last: int) -> Optional[Tuple[int, ...]]:
+        """第 first 局结束到第 last 局结束之间各座位的积分变化"""
+        before = self.standings_at_round(index, first)
+        after = self.standings_at_round(index, last)
+        if before is None or after is None:
+            return None
+        return tuple(b - a for a, b in zip(before, after))
+
+    def peak_trough(self, pos: Optional[int] = None) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        """已加载范围内到第 pos 手（默认最新）为止各座位的最高和最低累计积分"""
+        b, i = self._locate(self.end if pos is None else pos)
+        peak, trough = self.blocks[b].peak[i], self.blocks[b].trough[i]
+        for block in self.blocks[:b]:
+            peak = tuple(map(max, peak, block.peak[-1]))
+            trough = tuple(map(min, trough, block.trough[-1]))
+        return peak, trough
+
+
+class PlayerStats:
+    """各座位的统计：胡牌、点炮、自摸、番数、连胡、局均分
+
+    每追加一手只改动该手涉及的计数，并记下被改动字段的旧值，
+    撤销时按记录还原，不需要重新扫描历史；
+    连胡、局数与记录顺序有关，向前加载的更早记录不计入统计
+    """
+
+    FIELDS = ('wins', 'zimo', 'pao', 'fan_sum', 'max_fan', 'streak', 'best_streak', 'score_sum')
+
+    def __init__(self, n_players: int = 4):
+        self.rebuild([], n_players)
+
+    def rebuild(self, history: List[Dict], n_players: Optional[int] = None):
+        if n_players is not None:
+            self.n_players = n_players
+        self.seats: List[Dict[str, int]] = [dict.fromkeys(self.FIELDS, 0)
+                                            for _ in range(self.n_players)]
+        self.rounds = 0
+        self.last_round: Optional[int] = None
+        self.undo: List[Tuple] = []  # 每手的 (旧局数, 旧局号, [(座位, 字段, 旧值)])
+        for rec in history:
+            self.append(rec)
+
+    def append(self, rec: Dict):
+        changes: List[Tuple[int, str, int]] = []
+
+        def put(seat: int, field: str, value: int):
+            changes.append((seat, field, self.seats[seat][field]))
+            self.seats[seat][field] = value
+
+        self.undo.append((self.rounds, self.last_round, changes))
+        if rec['round'] != self.last_round:
+            self.rounds += 1
+            self.last_round = rec['round']
+
+        seat_of = {p: i for i, p in enumerate(rec['scores'])}
+        for seat, sc in enumerate(rec['scores'].values()):
+            if sc:
+                put(seat, 'score_sum', self.seats[seat]['score_sum'] + sc)
+        if rec.get('settlement'):
+            return  # 杠、查叫等不是胡牌
+
+        hand = hand_from_record(rec)
+        try:
+            entry = lookup_fan(hand['mode'], type_mask(hand['mode'], hand['types']))
+            total_fan, is_zimo = entry.total_fan, entry.is_zimo or not hand['pao']
+        except ValueError:  # 规则已被删除或修改
+            total_fan, is_zimo = 0, not hand['pao']
+        winners = {seat_of[w] for w in hand['winners'] if w in seat_of}
+        for seat, stats in enumerate(self.seats):
+            if seat in winners:
+                put(seat, 'wins', stats['wins'] + 1)
+                put(seat, 'fan_sum', stats['fan_sum'] + total_fan)
+                if total_fan > stats['max_fan']:
+                    put(seat, 'max_fan', total_fan)
+                if is_zimo:
+                    put(seat, 'zimo', stats['zimo'] + 1)
+                put(seat, 'streak', stats['streak'] + 1)
+                if stats['streak'] > stats['best_streak']:
+                    put(seat, 'best_streak', stats['streak'])
+            elif stats['streak']:
+                put(seat, 'streak', 0)
+        if not is_zimo and hand['pao'] in seat_of:
+            seat = seat_of[hand['pao']]
+            put(seat, 'pao', self.seats[seat]['pao'] + 1)
+
+    @property
+    def hands(self) -> int:
+        """已计入统计的手数"""
+        return len(self.undo)
+
+    def pop(self):
+        if not self.undo:
+            return
+        self.rounds, self.last_round, changes = self.undo.pop()
+        for seat, field, old in reversed(changes):
+            self.seats[seat][field] = old
+
+    def row(self, seat: int) -> Dict:
+        """某个座位的统计结果"""
+        stats = self.seats[seat]
+        wins = stats['wins']
+        return {
+            'wins': wins,
+            'pao': stats['pao'],
+            'zimo_rate': stats['zimo'] / wins if wins else 0.0,
+            'avg_fan': stats['fan_sum'] / wins if wins else 0.0,
+            'max_fan': stats['max_fan'],
+            'best_streak': stats['best_streak'],
+            'avg_score': stats['score_sum'] / self.rounds if self.rounds else 0.0,
+        }
@@ -0,0 +1,296 @@
+"""
+四川麻将旧数据批量导入
+把各台机器上的旧存档（mahjong_scores.json）和导出的文本结果（mahjong_results_*.txt）
+在进程池中并行解析、校验，按 (时间, 局, 手) 去重后写入跨场次存档（每个文件一场）
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from mahjong_archive import ARCHIVE_DIR, archive_session, load_archive, timestamp_epoch
+from mahjong_engine import INT64_MAX, INT64_MIN
+from mahjong_ledger import EVENT_KINDS, HU
+from mahjong_storage import apply_event
+
+# 按目录导入时只读取这两类文件
+SAVE_PATTERN = re.compile(r'^mahjong_scores.*\.json$')
+EXPORT_PATTERN = re.compile(r'^mahjong_results_.*\.txt$')
+
+# 文本导出中每条记录的标题行、类型行和分数行
+_TITLE = re.compile(r'^第(\d+)局(?:第(\d+)手 )?- (.*?)( \[进行中\])?$')
+_TYPE_PREFIX = "类型: "
+_WINNER_SEP = ", 胡牌: "
+_SCORE = re.compile(r'^  (.+): ([+-]\d+)$')
+
+Key = Tuple[int, int, int]
+
+
+def find_files(paths: Iterable[str]) -> List[str]:
+    """展开目录（递归查找旧存档和导出文件），直接给出的文件原样保留"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in names
+                             if SAVE_PATTERN.match(name) or EXPORT_PATTERN.match(name))
+        else:
+            files.append(path)
+    return sorted(set(files))
+
+
+# ---------- 解析 ----------
+def _settlement(description: str) -> Optional[str]:
+    """旧记录没有 settlement 字段时按描述的前缀识别结算记录"""
+    for kind in EVENT_KINDS:
+        if kind != HU and description.startswith(kind + ": "):
+            return kind
+    return None
+
+
+def parse_save(path: str) -> Tuple[List[str], List[Dict], List[Tuple[str, str]]]:
+    """只读地读取JSON存档（含历史文件和日志），返回 (玩家, 全部记录, 无法解析的记录)
+
+    不经过 JsonJournalStore：它会截掉日志中不完整的末行，导入时不能改动源文件，
+    末行不完整只记为拒绝
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    state = {
+        'players': data.get('players'),
+        'scores': data.get('scores') or {},
+        'game_history': data.get('game_history', []),
+        'current_round': data.get('current_round', 0),
+    }
+    if data.get('history_file'):
+        with open(os.path.join(os.path.dirname(path), data['history_file']), 'rb') as f:
+            state['game_history'] = [json.loads(line) for line in f if line.strip()]
+
+    rejected = []
+    journal_file = os.path.splitext(path)[0] + '.journal.jsonl'
+    if os.path.exists(journal_file):
+        with open(journal_file, 'rb') as f:
+            lines = f.readlines()
+        for lineno, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line.decode('utf-8'))
+            except ValueError:
+                # 写入中途崩溃只会损坏最后一行
+                if lineno == len(lines):
+                    rejected.append((f"日志第{lineno}行", "日志末行不完整"))
+                    break
+                raise ValueError(f"日志第{lineno}行无法解析")
+            if event['seq'] <= data.get('journal_seq', 0):
+                continue
+            if event['type'] == 'undo' and not state['game_history']:
+                rejected.append((f"日志第{lineno}行", "撤销时没有可撤销的记录"))
+                continue
+            apply_event(state, event)
+    players = state['players'] or list(state['scores'])
+    return players, state['game_history'], rejected
+
+
+def parse_export(path: str) -> Tuple[List[str], List[Dict], List[str], List[Tuple[str, str]]]:
+    """读取文本导出，返回 (玩家, 记录, 各记录所在行, 无法解析的记录)
+
+    导出中没有模式、番型、点炮等字段，记分引擎按描述推断；
+    玩家按最后一条记录中的座位顺序
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    if not lines or lines[0] != "四川麻将积分记录" or "详细记录:" not in lines:
+        raise ValueError("不是四川麻将导出文件")
+
+    # 每条记录从标题行开始，到下一个标题行为止
+    blocks: List[Tuple[int, List[str]]] = []
+    for lineno, line in enumerate(lines[lines.index("详细记录:") + 1:],
+                                  lines.index("详细记录:") + 2):
+        if _TITLE.match(line):
+            blocks.append((lineno, [line]))
+        elif line.strip():
+            if not blocks:
+                raise ValueError(f"第{lineno}行: 无法识别的内容")
+            blocks[-1][1].append(line)
+
+    records, positions, rejected = [], [], []
+    for lineno, block in blocks:
+        title = _TITLE.match(block[0])
+        if len(block) < 2 or not block[1].startswith(_TYPE_PREFIX) or _WINNER_SEP not in block[1]:
+            rejected.append((f"第{lineno}行", "缺少类型行"))
+            continue
+        description, _, winner = block[1][len(_TYPE_PREFIX):].rpartition(_WINNER_SEP)
+        scores = {}
+        for line in block[2:]:
+            match = _SCORE.match(line)
+            if match is None:
+                break
+            scores[match.group(1)] = int(match.group(2))
+        else:
+            records.append({
+                'round': int(title.group(1)),
+                'hand_num': int(title.group(2) or 1),
+                'scores': scores,
+                'timestamp': title.group(3),
+                'description': description,
+                'winner': winner,
+                'round_ended': not title.group(4),
+            })
+            positions.append(f"第{lineno}行")
+            continue
+        rejected.append((f"第{lineno}行", "分数行格式错误"))
+    players = list(records[-1]['scores']) if records else []
+    return players, records, positions, rejected
+
+
+def validate_record(rec: Dict, n_players: int) -> Optional[str]:
+    """检查一条记录，有问题时返回原因（时间在计算去重键时检查）"""
+    if not isinstance(rec, dict):
+        return "不是记录"
+    for field in ('round', 'hand_num'):
+        value = rec.get(field, 1)
+        if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+            return f"{field} 无效"
+    scores = rec.get('scores')
+    if not isinstance(scores, dict) or not scores:
+        return "缺少分数"
+    if len(scores) > n_players:
+        return "玩家人数与存档不一致"
+    values = list(scores.values())
+    if any(not isinstance(sc, int) or isinstance(sc, bool) for sc in values):
+        return "分数不是整数"
+    if any(not INT64_MIN <= sc <= INT64_MAX for sc in values):
+        return "分数超出范围"
+    if sum(values):
+        return f"分数之和为{sum(values):+d}，不为零"
+    return None
+
+
+def parse_file(path: str) -> Dict:
+    """解析并校验一个文件（进程池中执行）
+
+    返回 {'path', 'players', 'records', 'keys', 'rejected', 'error'}，
+    keys 为各记录的去重键 (时间戳, 局, 手)，rejected 为 [(位置, 原因)]
+    """
+    result = {'path': path, 'players': [], 'records': [], 'keys': [], 'rejected': [],
+              'error': None}
+    try:
+        if path.lower().endswith('.json'):
+            players, records, rejected = parse_save(path)
+            positions = [f"第{i + 1}条" for i in range(len(records))]
+        else:
+            players, records, positions, rejected = parse_export(path)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        result['error'] = str(e) or type(e).__name__
+        return result
+
+    for rec, where in zip(records, positions):
+        reason = validate_record(rec, len(players))
+        epoch = 0 if reason else timestamp_epoch(rec.get('timestamp'))
+        if not epoch:
+            rejected.append((where, reason or "时间格式错误"))
+            continue
+        settlement = rec.get('settlement') or _settlement(rec.get('description', ''))
+        if settlement:
+            rec['settlement'] = settlement
+        result['records'].append(rec)
+        result['keys'].append((epoch, rec['round'], rec.get('hand_num', 1)))
+    result['players'] = players
+    result['rejected'] = rejected
+    return result
+
+
+# ---------- 合并 ----------
+def archive_keys(directory: str) -> Set[Key]:
+    """存档中已有记录的去重键，重复导入同一批文件时不会重复写入"""
+    if not os.path.isdir(directory):
+        return set()
+    archive = load_archive(directory)
+    return set(zip(archive.time.tolist(), archive.round.tolist(), archive.hand.tolist()))
+
+
+def import_files(paths: Iterable[str], directory: str = ARCHIVE_DIR,
+                 workers: Optional[int] = None, dry_run: bool = False) -> Dict:
+    """并行解析全部文件，去重后每个文件写入一场存档，返回导入报告
+
+    workers 为进程数（默认等于CPU核数，1 表示在当前进程中解析）；
+    多个文件含有同一条记录时保留时间最早的文件中的那条；dry_run 时只统计不写入
+    """
+    started = time.perf_counter()
+    files = find_files(paths)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(files) <= 1:
+        results = [parse_file(path) for path in files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(files) // (workers * 4))
+            results = list(pool.map(parse_file, files, chunksize=chunksize))
+    parsed = time.perf_counter()
+
+    report = {'files': len(files), 'failed': [], 'records': 0, 'imported': 0, 'duplicates': 0,
+              'rejected': [], 'sessions': [], 'parse_seconds': parsed - started}
+    seen = archive_keys(directory)
+    # 先写入时间较早的文件，跨文件的重复记录保留最早的来源
+    results.sort(key=lambda r: (min(r['keys']) if r['keys'] else (INT64_MAX,), r['path']))
+    for result in results:
+        if result['error']:
+            report['failed'].append((result['path'], result['error']))
+            continue
+        report['rejected'].extend((result['path'], where, reason)
+                                  for where, reason in result['rejected'])
+        report['records'] += len(result['records']) + len(result['rejected'])
+        records = []
+        for rec, key in zip(result['records'], result['keys']):
+            if key in seen:
+                report['duplicates'] += 1
+                continue
+            seen.add(key)
+            records.append(rec)
+        report['imported'] += len(records)
+        if records and not dry_run:
+            report['sessions'].append(archive_session(records, result['players'], directory))
+
+    report['seconds'] = time.perf_counter() - started
+    return report
+
+
+def format_report(report: Dict, limit: int = 20) -> str:
+    seconds = max(report['seconds'], 1e-9)
+    lines = [f"文件: {report['files']}个（失败{len(report['failed'])}个）  "
+             f"记录: {report['records']}条  导入: {report['imported']}条  "
+             f"重复: {report['duplicates']}条  拒绝: {len(report['rejected'])}条",
+             f"写入存档: {len(report['sessions'])}场",
+             f"用时: {report['seconds']:.2f}秒（解析{report['parse_seconds']:.2f}秒）  "
+             f"速度: {report['records'] / seconds:.0f}条/秒  "
+             f"{report['files'] / seconds:.1f}个文件/秒"]
+    if report['failed']:
+        lines += ["", "无法读取的文件:"]
+        lines += [f"  {path}: {error}" for path, error in report['failed'][:limit]]
+    if report['rejected']:
+        lines += ["", "拒绝的记录:"]
+        lines += [f"  {path} {where}: {reason}"
+                  for path, where, reason in report['rejected'][:limit]]
+        if len(report['rejected']) > limit:
+            lines.append(f"  ……另有{len(report['rejected']) - limit}条")
+    return '\n'.join(lines)
+
+
+# ---------- 命令行 ----------
+def main():
+    parser = argparse.ArgumentParser(description="批量导入旧存档和导出的文本结果")
+    parser.add_argument("paths", nargs='+', help="文件或目录（目录中递归查找）")
+    parser.add_argument("--dir", default=ARCHIVE_DIR, help="存档目录")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="只校验和统计，不写入存档")
+    args = parser.parse_args()
+
+    print(format_report(import_files(args.paths, args.dir, args.workers, args.dry_run)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+四川麻将局内账本
+一局中的胡牌、刮风下雨、呼叫转移、查叫、查花猪按事件逐条追加，
+累计积分随事件增量更新，本局汇总在需要显示时才计算
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from mahjong_engine import INT64_MAX, get_rules
+from mahjong_rules import DEFAULT_HUAZHU_FAN
+
+# 事件类型（保存在记录的 settlement 字段中，胡牌记录没有该字段）
+HU = '胡牌'
+GUAFENG = '刮风'
+XIAYU = '下雨'
+TRANSFER = '呼叫转移'
+CHAJIAO = '查叫'
+HUAZHU = '查花猪'
+EVENT_KINDS = (HU, GUAFENG, XIAYU, TRANSFER, CHAJIAO, HUAZHU)
+
+# 杠的类型 -> (事件类型, 每家支付的底分倍数)
+KONG_TYPES: Dict[str, Tuple[str, int]] = {
+    '直杠': (GUAFENG, 2),   # 点杠的玩家一家支付
+    '补杠': (GUAFENG, 1),   # 其他玩家各付
+    '暗杠': (XIAYU, 2),     # 其他玩家各付
+}
+
+
+def event_kind(rec: Dict) -> str:
+    return rec.get('settlement') or HU
+
+
+def make_event(round_num: int, hand_num: int, mode: str, kind: str,
+               scores: Dict[str, int], description: str, winner: str = "") -> Dict:
+    """生成一条局内事件记录，格式与胡牌记录相同，可直接写入 game_history"""
+    if kind not in EVENT_KINDS or kind == HU:
+        raise ValueError(f"未知的事件类型: {kind}")
+    return {
+        'round': round_num,
+        'hand_num': hand_num,
+        'scores': dict(scores),
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'description': description,
+        'winner': winner,
+        'mode': mode,
+        'types': [],
+        'pao': "",
+        'round_ended': kind in (CHAJIAO, HUAZHU),
+        'settlement': kind,
+    }
+
+
+# ---------- 事件分数 ----------
+def kong_scores(players: List[str], mode: str, player: str, kong_type: str,
+                from_player: str = "", payers: Optional[List[str]] = None) -> Tuple[str, Dict[str, int], str]:
+    """杠牌的分数，返回 (事件类型, 分数, 描述)
+
+    直杠由 from_player（点杠的玩家）支付，补杠、暗杠由 payers
+    （默认为其他所有玩家）各付
+    """
+    if kong_type not in KONG_TYPES:
+        raise ValueError(f"未知的杠: {kong_type}")
+    if player not in players:
+        raise ValueError(f"未知的玩家: {player}")
+    kind, times = KONG_TYPES[kong_type]
+    each = get_rules(mode).base * times
+
+    if kong_type == '直杠':
+        if from_player not in players or from_player == player:
+            raise ValueError("请选择点杠的玩家")
+        payers = [from_player]
+    elif payers is None:
+        payers = [p for p in players if p != player]
+    elif player in payers:
+        raise ValueError("杠牌玩家不能自己付分")
+
+    scores = {p: 0 for p in players}
+    for p in payers:
+        scores[p] -= each
+        scores[player] += each
+    desc = f"{kind}: {player}{kong_type}"
+    if kong_type == '直杠':
+        desc += f"（{from_player}点杠）"
+    return kind, scores, desc
+
+
+def transfer_scores(players: List[str], kong: Dict, winner: str) -> Tuple[Dict[str, int], str]:
+    """呼叫转移：杠后点炮时，杠牌玩家把这次杠的收入转给胡家
+
+    kong 为对应的刮风/下雨事件记录
+    """
+    if event_kind(kong) not in (GUAFENG, XIAYU):
+        raise ValueError("呼叫转移只能转移杠的收入")
+    gainer = kong['winner']
+    if winner == gainer:
+        raise ValueError("胡家不能是杠牌玩家本人")
+    if winner not in players:
+        raise ValueError(f"未知的玩家: {winner}")
+    gain = kong['scores'].get(gainer, 0)
+    scores = {p: 0 for p in players}
+    scores[gainer] = -gain
+    scores[winner] = gain
+    return scores, f"{TRANSFER}: {gainer}的杠钱({gain})转给{winner}"
+
+
+def huazhu_fan(mode: str) -> int:
+    """花猪的赔付番数：规则中的 huazhu_fan，未设置时按封顶番数，不封顶时为 DEFAULT_HUAZHU_FAN"""
+    rules = get_rules(mode)
+    if rules.huazhu_fan is not None:
+        return rules.huazhu_fan
+    return rules.cap if rules.cap is not None else DEFAULT_HUAZHU_FAN
+
+
+def huazhu_scores(players: List[str], mode: str, pigs: List[str]) -> Tuple[Dict[str, int], str]:
+    """查花猪：未缺一门的玩家向每个不是花猪的玩家赔付封顶分"""
+    fan = huazhu_fan(mode)
+    final = get_rules(mode).base * (2 ** fan)
+    payees = [p for p in players if p not in pigs]
+    if final * len(payees) > INT64_MAX:
+        raise ValueError("查花猪分数超出范围，请在规则中设置封顶番数")
+    scores = {p: 0 for p in players}
+    for pig in pigs:
+        for p in payees:
+            scores[pig] -= final
+            scores[p] += final
+    return scores, f"{HUAZHU}: {'、'.join(pigs)}未缺一门，按{fan}番赔付"
+
+
+# ---------- 局内账本 ----------
+class RoundLedger:
+    """当前一局的事件与各座位的累计分数
+
+    追加、撤销事件都是 O(1)；按事件类型的汇总在调用 summary() 时才计算并缓存
+    """
+
+    def __init__(self, players: List[str]):
+        self.players = list(players)
+        self.reset()
+
+    def reset(self, round_num: Optional[int] = None):
+        self.round_num = round_num
+        self.events: List[Dict] = []
+        self.totals: List[int] = [0] * len(self.players)
+        self._summary: Optional[Dict] = None
+
+    def rebuild(self, records: List[Dict]):
+        """用某一局已加载的记录重建"""
+        self.reset(records[0]['round'] if records else None)
+        for rec in records:
+            self.append(rec)
+
+    def append(self, rec: Dict):
+        """追加一条记录，属于新的一局时先清空"""
+        if rec['round'] != self.round_num:
+            self.reset(rec['round'])
+        self.events.append(rec)
+        for seat, sc in enumerate(rec['scores'].values()):
+            self.totals[seat] += sc
+        self._summary = None
+
+    def pop(self) -> Optional[Dict]:
+        """撤销最后一条记录，本局已没有记录时返回 None"""
+        if not self.events:
+            return None
+        rec = self.events.pop()
+        for seat, sc in enumerate(rec['scores'].values()):
+            self.totals[seat] -= sc
+        self._summary = None
+        return rec
+
+    def round_scores(self) -> Dict[str, int]:
+        """本局各玩家的得分（按最后一条记录中的玩家姓名）"""
+        if not self.events:
+            return {}
+        return dict(zip(self.events[-1]['scores'], self.totals))
+
+    def last_kong(self) -> Optional[Dict]:
+        """本局最近一次杠，其后已有呼叫转移时返回 None"""
+        for rec in reversed(self.events):
+            kind = event_kind(rec)
+            if kind == TRANSFER:
+                return None
+            if kind in (GUAFENG, XIAYU):
+                return rec
+        return None
+
+    def summary(self) -> Dict:
+        """本局汇总：{'round', 'totals', 'by_kind': {事件类型: 各座位分数}, 'counts', 'text'}"""
+        if self._summary is None:
+            by_kind: Dict[str, List[int]] = {}
+            counts: Dict[str, int] = {}
+            for rec in self.events:
+                kind = event_kind(rec)
+                row = by_kind.setdefault(kind, [0] * len(self.players))
+                for seat, sc in enumerate(rec['scores'].values()):
+                    row[seat] += sc
+                counts[kind] = counts.get(kind, 0) + 1
+            text = ""
+            if self.events:
+                kinds = '、'.join(f"{kind}{n}次" for kind, n in counts.items())
+                totals = ' '.join(f"{p}{sc:+d}" for p, sc in zip(self.players, self.totals))
+                text = f"第{self.round_num}局（{kinds}）: {totals}"
+            self._summary = {
+                'round': self.round_num,
+                'totals': tuple(self.totals),
+                'by_kind': {kind: tuple(row) for kind, row in by_kind.items()},
+                'counts': counts,
+                'text': text,
+            }
+        return self._summary
@@ -0,0 +1,261 @@
+"""
+四川麻将等级分
+多人 Elo：每局结束后按本局得分在每两名玩家之间比较一次（高者胜、相同为平），
+对局中逐局增量更新并可撤销；调整参数后可用NumPy对全部存档一次性重新计算
+"""
+
+import argparse
+import json
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖
+    np = None
+
+RATINGS_FILE = "mahjong_ratings.json"
+# 随快照保存的本场评分最多保留的撤销记录数，
+# 需覆盖启动时加载的尾部（200条）和快照之后的日志中可能撤销的记录（200条）
+SESSION_UNDO = 512
+
+
+class RatingParams(NamedTuple):
+    initial: float = 1500.0   # 新玩家的初始分
+    k: float = 32.0           # 每局最大变动
+    scale: float = 400.0      # 分差为 scale 时，高分一方的期望胜率约为 91%
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("等级分重算需要安装numpy: pip install numpy")
+
+
+def round_changes(ratings: List[float], scores: List[int], params: RatingParams) -> List[float]:
+    """一局各玩家的等级分变化"""
+    n = len(ratings)
+    changes = []
+    for i in range(n):
+        total = 0.0
+        for j in range(n):
+            if i != j:
+                expected = 1 / (1 + 10 ** ((ratings[j] - ratings[i]) / params.scale))
+                actual = 1.0 if scores[i] > scores[j] else 0.5 if scores[i] == scores[j] else 0.0
+                total += actual - expected
+        changes.append(params.k * total / max(n - 1, 1))
+    return changes
+
+
+# ---------- 增量更新 ----------
+class Ratings:
+    """按玩家姓名记录等级分和局数
+
+    每评一局都把变化量压入栈中，撤销时按栈弹出，不需要重新计算
+    """
+
+    def __init__(self, params: RatingParams = RatingParams(),
+                 ratings: Optional[Dict[str, float]] = None,
+                 games: Optional[Dict[str, int]] = None):
+        self.params = params
+        self.ratings: Dict[str, float] = dict(ratings or {})
+        self.games: Dict[str, int] = dict(games or {})
+        self.undo_stack: List[Tuple[int, Dict[str, float]]] = []  # (局号, 变化量)
+        self.dropped = 0  # 恢复时未保留的更早的撤销记录数
+
+    def get(self, player: str) -> float:
+        return self.ratings.get(player, self.params.initial)
+
+    def apply(self, round_num: int, round_scores: Dict[str, int]) -> Dict[str, float]:
+        """按一局的得分更新等级分，返回各玩家的变化"""
+        players = list(round_scores)
+        changes = dict(zip(players, round_changes([self.get(p) for p in players],
+                                                  list(round_scores.values()), self.params)))
+        for p, change in changes.items():
+            self.ratings[p] = self.get(p) + change
+            self.games[p] = self.games.get(p, 0) + 1
+        self.undo_stack.append((round_num, changes))
+        return changes
+
+    def undo(self):
+        """撤销最近一次 apply"""
+        _, changes = self.undo_stack.pop()
+        for p, change in changes.items():
+            self.ratings[p] -= change
+            self.games[p] -= 1
+            if not self.games[p]:
+                del self.ratings[p], self.games[p]
+
+    def last_round(self) -> Optional[int]:
+        return self.undo_stack[-1][0] if self.undo_stack else None
+
+    def commit(self):
+        """当前结果作为新的起点，之后不能再撤销"""
+        self.undo_stack = []
+        self.dropped = 0
+
+    def to_dict(self) -> Dict:
+        return {'params': dict(self.params._asdict()), 'ratings': dict(self.ratings),
+                'games': dict(self.games)}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Ratings':
+        return cls(RatingParams(**data.get('params', {})),
+                   data.get('ratings'), data.get('games'))
+
+
+def replay(ratings: Ratings, history: Iterable[Dict], open_round: Optional[int] = None):
+    """按顺序对历史记录中已结束的各局评分（open_round 为尚未结束的局）"""
+    current, totals = None, {}
+    for rec in history:
+        if rec['round'] != current:
+            if totals:
+                ratings.apply(current, totals)
+            current, totals = rec['round'], {}
+        for p, sc in rec['scores'].items():
+            totals[p] = totals.get(p, 0) + sc
+    if totals and current != open_round:
+        ratings.apply(current, totals)
+
+
+def session_state(ratings: Ratings, base: Dict) -> Dict:
+    """本场的评分状态（随快照保存）：之前各场的等级分、当前结果和最近的撤销记录"""
+    keep = ratings.undo_stack[-SESSION_UNDO:]
+    return {
+        'base': base,
+        'ratings': ratings.to_dict(),
+        'undo': [[round_num, dict(changes)] for round_num, changes in keep],
+        'dropped': ratings.dropped + len(ratings.undo_stack) - len(keep),
+    }
+
+
+def restore_session(base: Ratings, saved: Optional[Dict], history: List[Dict],
+                    skipped: int, open_round: Optional[int] = None) -> Optional[Ratings]:
+    """用保存的本场评分恢复等级分，只回放已加载的尾部 history
+
+    先撤销已加载部分第一局之后的评分，再对之后的记录重新评分；
+    没有保存、之前各场的等级分已改变或撤销记录不够时返回 None，由调用方从头回放
+    """
+    if not saved or not skipped or not history or saved.get('base') != base.to_dict():
+        return None
+    first = history[0]['round']
+    ratings = Ratings.from_dict(saved['ratings'])
+    ratings.undo_stack = [(round_num, changes) for round_num, changes in saved['undo']]
+    ratings.dropped = saved['dropped']
+    while ratings.undo_stack and ratings.last_round() > first:
+        ratings.undo()
+    # 已加载的第一局可能不完整，必须已经评过分
+    if ratings.last_round() != first:
+        return None
+    replay(ratings, (rec for rec in history if rec['round'] > first), open_round)
+    return ratings
+
+
+def load_ratings(path: str = RATINGS_FILE) -> Ratings:
+    if not os.path.exists(path):
+        return Ratings()
+    with open(path, 'r', encoding='utf-8') as f:
+        return Ratings.from_dict(json.load(f))
+
+
+def save_ratings(ratings: Ratings, path: str = RATINGS_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(ratings.to_dict(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+# ---------- 批量重算 ----------
+def archive_rounds(archive):
+    """把存档中的记录按局汇总，返回按时间排序的 (各局座位玩家编号, 各局座位得分)"""
+    _require_numpy()
+    n = len(archive)
+    if not n:
+        width = archive.width
+        return np.zeros((0, width), dtype=np.int64), np.zeros((0, width), dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, (archive.session[1:] != archive.session[:-1]) |
+                                        (archive.round[1:] != archive.round[:-1])])
+    scores = np.add.reduceat(archive.deltas, starts, axis=0)
+    player_ids = archive.session_players[archive.session[starts]]
+    order = np.argsort(archive.time[starts], kind='stable')
+    return player_ids[order], scores[order]
+
+
+def rate_batch(player_ids, scores, n_players: int, params: RatingParams = RatingParams()):
+    """按顺序计算全部局的等级分，返回 (各玩家等级分, 各玩家局数)
+
+    没有共同玩家的局先后顺序不影响结果，因此按"玩家上次出现的批次 + 1"分批，
+    同一批的局一次向量化计算，结果与逐局计算相同
+    """
+    _require_numpy()
+    player_ids = np.asarray(player_ids, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.int64)
+    ratings = np.full(n_players, params.initial, dtype=np.float64)
+    seated = player_ids >= 0
+    games = np.bincount(player_ids[seated], minlength=n_players)
+    if not len(player_ids):
+        return ratings, games
+
+    # 空座位（-1）对应 last 末尾的占位，每局后复位
+    last = [-1] * (n_players + 1)
+    waves = [0] * len(player_ids)
+    for r, ids in enumerate(player_ids.tolist()):
+        wave = 1 + max(map(last.__getitem__, ids))
+        waves[r] = wave
+        for i in ids:
+            last[i] = wave
+        last[-1] = -1
+    waves = np.array(waves, dtype=np.int64)
+    order = np.argsort(waves, kind='stable')
+    bounds = np.searchsorted(waves[order], np.arange(waves.max() + 2))
+
+    # 与等级分无关的部分一次算好：胜负（1/0.5/0）、对手是否在座、对手数
+    width = player_ids.shape[1]
+    pair = seated[:, :, None] & seated[:, None, :] & ~np.eye(width, dtype=bool)
+    actual = np.where(pair, (np.sign(scores[:, :, None] - scores[:, None, :]) + 1) / 2, 0)
+    weight = params.k / np.maximum(pair.sum(axis=2), 1)
+    index = np.where(seated, player_ids, n_players)
+    ratings = np.append(ratings, params.initial)  # 末尾为空座位的占位
+
+    for w in range(len(bounds) - 1):
+        rows = order[bounds[w]:bounds[w + 1]]
+        ids = index[rows]
+        r = ratings[ids]
+        expected = 1 / (1 + 10 ** ((r[:, None, :] - r[:, :, None]) / params.scale))
+        total = (actual[rows] - np.where(pair[rows], expected, 0)).sum(axis=2)
+        ratings[ids] += weight[rows] * total
+        ratings[-1] = params.initial
+    ratings = ratings[:-1]
+    return ratings, games
+
+
+def recompute(archive, params: RatingParams = RatingParams()) -> Ratings:
+    """用新参数从头计算全部存档的等级分"""
+    player_ids, scores = archive_rounds(archive)
+    ratings, games = rate_batch(player_ids, scores, len(archive.players), params)
+    return Ratings(params,
+                   {p: float(r) for p, r, g in zip(archive.players, ratings, games) if g},
+                   {p: int(g) for p, g in zip(archive.players, games) if g})
+
+
+# ---------- 命令行 ----------
+def main():
+    from mahjong_archive import ARCHIVE_DIR, load_archive
+
+    defaults = RatingParams()
+    parser = argparse.ArgumentParser(description="按新参数重新计算全部存档的等级分")
+    parser.add_argument("--dir", default=ARCHIVE_DIR, help="存档目录")
+    parser.add_argument("--initial", type=float, default=defaults.initial)
+    parser.add_argument("--k", type=float, default=defaults.k)
+    parser.add_argument("--scale", type=float, default=defaults.scale)
+    parser.add_argument("--out", default=RATINGS_FILE)
+    args = parser.parse_args()
+
+    ratings = recompute(load_archive(args.dir), RatingParams(args.initial, args.k, args.scale))
+    save_ratings(ratings, args.out)
+    ranked = sorted(ratings.ratings.items(), key=lambda item: item[1], reverse=True)
+    for i, (p, r) in enumerate(ranked, 1):
+        print(f"{i}. {p}: {r:.0f}（{ratings.games[p]}局）")
+
+
+if __name__ == "__main__":
+    main()
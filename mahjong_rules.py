@@ -0,0 +1,269 @@
+"""
+四川麻将规则定义
+每套规则是一份声明式定义（番型番数、互斥、包含关系、底分、封顶、结算方式），
+加载时编译为查表结果和结算函数；俱乐部可在 house_rules 目录中放置JSON文件
+覆盖内置规则或添加新的规则
+"""
+
+import json
+import os
+import warnings
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+HOUSE_RULES_DIR = "house_rules"
+# 查表覆盖全部 2^n 种组合，番型数量需要有上限
+MAX_TYPES = 16
+# 查花猪的赔付番数：规则中没有 huazhu_fan 也没有封顶时使用
+DEFAULT_HUAZHU_FAN = 3
+
+# 内置规则（与 house_rules 中JSON文件的格式相同）
+DEFAULT_RULES: List[Dict] = [
+    {
+        "name": "传统",
+        "types": {
+            "平胡": 1,
+            "碰碰胡": 2,
+            "清一色": 4,
+            "七对": 4,
+            "杠上开花": 2,
+            "抢杠胡": 2,
+            "海底捞月": 2,
+            "自摸": 1,
+        },
+        "exclusions": [],
+        "implications": [],
+        "zimo_type": "自摸",
+        "base": 1,
+        "cap": None,
+        "payout": "single",
+    },
+    {
+        "name": "血流成河",
+        "types": {
+            "平胡": 1,
+            "碰碰胡": 2,
+            "清一色": 4,
+            "七对": 4,
+            "龙七对": 8,
+            "清七对": 8,
+            "清龙七对": 16,
+            "杠上开花": 2,
+            "抢杠胡": 2,
+            "海底捞月": 2,
+            "天胡": 8,
+            "地胡": 8,
+            "自摸": 1,
+        },
+        "exclusions": [
+            {"types": ["七对", "龙七对", "清七对", "清龙七对"],
+             "message": "七对类型互斥，不能同时选择: {selected}"},
+            {"types": ["天胡", "地胡"],
+             "message": "天胡和地胡不能同时选择"},
+        ],
+        "implications": [
+            {"type": "清龙七对", "includes": ["清一色", "龙七对", "七对"],
+             "message": "清龙七对已包含其他七对和清一色，请勿重复选择"},
+            {"type": "清七对", "includes": ["清一色", "七对"],
+             "message": "清七对已包含清一色和七对，请勿重复选择"},
+            {"type": "龙七对", "includes": ["七对"],
+             "message": "龙七对已包含七对，请勿重复选择"},
+        ],
+        "zimo_type": "自摸",
+        "base": 1,
+        "cap": None,
+        "payout": "multi",
+    },
+]
+
+
+class FanEntry(NamedTuple):
+    """番型组合查表结果"""
+    valid: bool
+    total_fan: int
+    description: str
+    error: str
+    is_zimo: bool
+    types: Tuple[str, ...]
+
+
+class RuleSet(NamedTuple):
+    """编译后的规则"""
+    name: str
+    types: Dict[str, int]            # 番型 -> 番数（顺序即界面顺序）
+    bits: Dict[str, int]             # 番型 -> 位
+    table: List[FanEntry]            # 位掩码 -> 查表结果
+    base: int
+    cap: Optional[int]               # 封顶番数，None 表示不封顶
+    payout: str
+    check_winners: Callable          # (winners) -> None，胡家人数不合法时抛出 ValueError
+    settle: Callable                 # (players, winners, final, is_zimo, pao) -> 分数字典
+    huazhu_fan: Optional[int] = None  # 查花猪的赔付番数，None 表示按封顶（或默认值）
+
+
+# ---------- 互斥与包含 ----------
+def _compile_checker(spec: Dict) -> Callable[[Set[str]], str]:
+    """把互斥、包含规则编译为检查函数，返回错误信息（合法时为空）"""
+    exclusions = [(list(rule['types']), rule['message'])
+                  for rule in spec.get('exclusions', [])]
+    implications = [(rule['type'], set(rule['includes']), rule['message'])
+                    for rule in spec.get('implications', [])]
+
+    def check(selected_types: Set[str]) -> str:
+        for group, message in exclusions:
+            selected = [t for t in group if t in selected_types]
+            if len(selected) > 1:
+                return message.format(selected=', '.join(selected))
+        for name, includes, message in implications:
+            if name in selected_types and selected_types & includes:
+                return message
+        return ""
+
+    return check
+
+
+# ---------- 结算方式 ----------
+def _payout_single(name: str) -> Tuple[Callable, Callable]:
+    """一名胡家：自摸时三家各付，点炮时点炮玩家一家付"""
+    def check_winners(winners):
+        if not winners:
+            raise ValueError("请先选择胡牌玩家")
+        if len(winners) > 1:
+            raise ValueError(f"{name}模式只能有一名胡牌玩家")
+
+    def settle(players, winners, final, is_zimo, pao):
+        winner = winners[0]
+        scores = {p: 0 for p in players}
+        if is_zimo or not pao:
+            for p in players:
+                scores[p] = final * (len(players) - 1) if p == winner else -final
+        else:
+            if pao == winner:
+                raise ValueError("点炮玩家不能是胡牌玩家！")
+            scores[winner] = final
+            scores[pao] = -final
+        return scores
+
+    return check_winners, settle
+
+
+def _payout_multi(name: str) -> Tuple[Callable, Callable]:
+    """可多名胡家：自摸时每个胡家从每个未胡家收取，点炮时点炮玩家承担所有胡家"""
+    def check_winners(winners):
+        if not winners:
+            raise ValueError("请至少勾选一名胡家")
+
+    def settle(players, winners, final, is_zimo, pao):
+        losers = [p for p in players if p not in winners]
+        if not losers:
+            raise ValueError(f"{name}模式下不能所有人都胡牌！")
+        if pao and pao in winners:
+            raise ValueError("点炮玩家不能是胡牌玩家！")
+
+        scores = {p: 0 for p in players}
+        if is_zimo or not pao:
+            for winner in winners:
+                scores[winner] = final * len(losers)
+            for loser in losers:
+                scores[loser] = -final * len(winners)
+        else:
+            for winner in winners:
+                scores[winner] = final
+            scores[pao] = -final * len(winners)
+
+        # 验证分数平衡（总和应该为0）
+        total_check = sum(scores.values())
+        if total_check != 0:
+            raise ValueError(f"分数计算错误，总和不为0: {total_check}")
+        return scores
+
+    return check_winners, settle
+
+
+PAYOUT_SCHEMES: Dict[str, Callable[[str], Tuple[Callable, Callable]]] = {
+    "single": _payout_single,
+    "multi": _payout_multi,
+}
+
+
+# ---------- 编译 ----------
+def compile_rules(spec: Dict) -> RuleSet:
+    """把规则定义编译为查表结果和结算函数，定义不合法时抛出 ValueError"""
+    name = spec.get('name')
+    if not name:
+        raise ValueError("规则缺少名称")
+    types = dict(spec.get('types') or {})
+    if not types:
+        raise ValueError(f"规则 {name} 没有定义番型")
+    if len(types) > MAX_TYPES:
+        raise ValueError(f"规则 {name} 的番型过多（最多{MAX_TYPES}种）")
+    if any(not isinstance(fan, int) or fan < 0 for fan in types.values()):
+        raise ValueError(f"规则 {name} 的番数必须为非负整数")
+    payout = spec.get('payout', 'single')
+    if payout not in PAYOUT_SCHEMES:
+        raise ValueError(f"规则 {name} 的结算方式未知: {payout}")
+    mentioned = set()
+    for rule in spec.get('exclusions', []):
+        mentioned.update(rule['types'])
+    for rule in spec.get('implications', []):
+        mentioned.add(rule['type'])
+        mentioned.update(rule['includes'])
+    zimo_type = spec.get('zimo_type', '自摸')
+    unknown = (mentioned | {zimo_type}) - set(types)
+    if unknown:
+        raise ValueError(f"规则 {name} 引用了未定义的番型: {', '.join(sorted(unknown))}")
+    base = spec.get('base', 1)
+    cap = spec.get('cap')
+    if not isinstance(base, int) or base < 1:
+        raise ValueError(f"规则 {name} 的底分必须为正整数")
+    if cap is not None and (not isinstance(cap, int) or cap < 0):
+        raise ValueError(f"规则 {name} 的封顶番数必须为非负整数")
+    huazhu_fan = spec.get('huazhu_fan')
+    if huazhu_fan is not None and (not isinstance(huazhu_fan, int) or huazhu_fan < 0):
+        raise ValueError(f"规则 {name} 的花猪番数必须为非负整数")
+
+    check = _compile_checker(spec)
+    items = list(types.items())
+    table = []
+    for mask in range(1 << len(items)):
+        chosen = [(t, fan) for i, (t, fan) in enumerate(items) if mask >> i & 1]
+        selected = tuple(t for t, _ in chosen)
+        description = ' + '.join(f"{t}({fan}番)" for t, fan in chosen)
+        error = check(set(selected))
+        table.append(FanEntry(not error, sum(fan for _, fan in chosen), description,
+                              error, zimo_type in selected, selected))
+
+    return RuleSet(name, types, {t: 1 << i for i, t in enumerate(types)}, table,
+                   base, cap, payout, *PAYOUT_SCHEMES[payout](name), huazhu_fan=huazhu_fan)
+
+
+def load_rules(path: str) -> RuleSet:
+    """读取并编译一个JSON规则文件"""
+    with open(path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    try:
+        return compile_rules(spec)
+    except (AttributeError, KeyError, TypeError) as e:
+        raise ValueError(f"规则文件格式错误 {path}: {e}") from e
+
+
+def load_rule_sets(directory: Optional[str] = HOUSE_RULES_DIR,
+                   skipped: Optional[List[Tuple[str, str]]] = None) -> Dict[str, RuleSet]:
+    """编译内置规则，再用 directory 中的JSON文件覆盖或添加规则
+
+    无法读取或编译的文件跳过（保留内置规则）并发出警告，
+    (文件, 原因) 同时追加到 skipped 中供界面显示
+    """
+    rule_sets = {spec['name']: compile_rules(spec) for spec in DEFAULT_RULES}
+    if directory and os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith('.json'):
+                path = os.path.join(directory, filename)
+                try:
+                    rules = load_rules(path)
+                except (OSError, ValueError) as e:
+                    warnings.warn(f"已跳过规则文件 {path}: {e}")
+                    if skipped is not None:
+                        skipped.append((path, str(e)))
+                    continue
+                rule_sets[rules.name] = rules
+    return rule_sets
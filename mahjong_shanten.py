@@ -0,0 +1,173 @@
+"""
+四川麻将向听数计算
+按花色预先计算 5^9 种张数组合的查表结果（首次使用时生成并缓存到磁盘），
+用于对局复盘时批量计算存档手牌的向听数（需要安装numpy）
+"""
+
+import os
+from typing import Iterable, Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖
+    np = None
+
+from mahjong_tiles import Hand
+
+SHANTEN_TABLE_FILE = "mahjong_shanten.npy"
+
+# 每种花色的状态数，下标为张数向量的五进制编码
+N_STATES = 5 ** 9
+_POWERS = [5 ** i for i in range(9)]
+
+# 查表列：k 组面子 + p 对将 -> 列 k * 2 + p
+N_COLUMNS = 10
+
+_table = None
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("向听数计算需要安装numpy: pip install numpy")
+
+
+# ---------- 查表 ----------
+def build_table():
+    """计算每种单花色张数组合凑成 k 组面子 + p 对将还缺的张数，返回 (5^9, 10) 的 int8 数组
+
+    先求出"已包含 k 组面子 + p 对将"的状态，再按总张数从多到少递推：
+    缺的张数 = 1 + 补一张牌之后缺的张数的最小值
+    """
+    _require_numpy()
+    index = np.arange(N_STATES, dtype=np.int64)
+    digits = np.stack([(index // p) % 5 for p in _POWERS], axis=1).astype(np.int8)
+
+    melds = []  # (需要的张数条件, 编码偏移)
+    for i in range(9):
+        melds.append((digits[:, i] >= 3, 3 * _POWERS[i]))
+    for i in range(7):
+        cond = (digits[:, i] >= 1) & (digits[:, i + 1] >= 1) & (digits[:, i + 2] >= 1)
+        melds.append((cond, _POWERS[i] + _POWERS[i + 1] + _POWERS[i + 2]))
+    pairs = [(digits[:, i] >= 2, 2 * _POWERS[i]) for i in range(9)]
+
+    def shifted(contain, parts):
+        result = np.zeros(N_STATES, dtype=bool)
+        for cond, offset in parts:
+            result |= cond & contain[np.where(cond, index - offset, 0)]
+        return result
+
+    contain = np.zeros((N_STATES, N_COLUMNS), dtype=bool)
+    contain[:, 0] = True
+    contain[:, 1] = shifted(contain[:, 0], pairs)
+    for k in range(1, 5):
+        contain[:, k * 2] = shifted(contain[:, (k - 1) * 2], melds)
+        contain[:, k * 2 + 1] = shifted(contain[:, k * 2], pairs)
+
+    table = np.full((N_STATES, N_COLUMNS), 99, dtype=np.int8)
+    sums = digits.sum(axis=1)
+    for total in range(36, -1, -1):
+        states = index[sums == total]
+        best = np.full((len(states), N_COLUMNS), 99, dtype=np.int8)
+        for i in range(9):
+            can_add = digits[states, i] < 4
+            nxt = table[np.where(can_add, states + _POWERS[i], 0)]
+            best = np.where(can_add[:, None], np.minimum(best, nxt + 1), best)
+        table[states] = np.where(contain[states], 0, best)
+    return table
+
+
+def load_table(path: Optional[str] = SHANTEN_TABLE_FILE):
+    """读取缓存的查表结果，不存在时生成并写入 path（path 为 None 时不缓存）"""
+    global _table
+    _require_numpy()
+    if _table is not None:
+        return _table
+    if path and os.path.exists(path):
+        table = np.load(path)
+        if table.shape == (N_STATES, N_COLUMNS):
+            _table = table
+            return _table
+    _table = build_table()
+    if path:
+        try:
+            np.save(path, _table)
+        except OSError:
+            pass  # 缓存写不进去时只影响下次启动的速度
+    return _table
+
+
+# ---------- 向听数 ----------
+def _suit_indices(hands):
+    """把手牌转换为 (N, 3) 的花色编码"""
+    counts = np.asarray(hands, dtype=np.int64)
+    if counts.ndim != 3 or counts.shape[1:] != (3, 9):
+        raise ValueError("手牌格式错误：应为三种花色各9种牌的张数")
+    if counts.size and (counts.min() < 0 or counts.max() > 4):
+        raise ValueError("同一种牌最多4张")
+    return counts @ np.array(_POWERS, dtype=np.int64), counts
+
+
+def _combine(left, right, k_max):
+    """合并两组花色的查表结果：(N, k, p) 取所有分配方式的最小值"""
+    result = np.full(left.shape, 99, dtype=np.int16)
+    for k1 in range(k_max + 1):
+        for k2 in range(k_max + 1 - k1):
+            for p1 in range(2):
+                for p2 in range(2 - p1):
+                    result[:, k1 + k2, p1 + p2] = np.minimum(
+                        result[:, k1 + k2, p1 + p2], left[:, k1, p1] + right[:, k2, p2])
+    return result
+
+
+def shanten_batch(hands, melds=0, table=None):
+    """批量计算向听数（-1 表示已胡，0 表示听牌）
+
+    hands 为手牌列表或 (N, 3, 9) 的张数数组，melds 为每手已碰、杠的组数
+    （整数或长度为 N 的数组）。按四川麻将规则计算：必须缺一门，
+    七对只在门前清（melds 为 0）时计入，四张相同算两对
+    """
+    _require_numpy()
+    if table is None:
+        table = load_table()
+    indices, counts = _suit_indices(hands)
+    n = len(indices)
+    melds = np.broadcast_to(np.asarray(melds, dtype=np.int64), (n,))
+    if n and (melds.min() < 0 or melds.max() > 4):
+        raise ValueError("碰、杠的组数应在0到4之间")
+
+    per_suit = [table[indices[:, s]].astype(np.int16).reshape(n, 5, 2) for s in range(3)]
+    needed = 4 - melds
+    best = np.full(n, 99, dtype=np.int16)
+    pairs = counts // 2
+    singles = counts % 2
+
+    for skip in range(3):  # 定缺：放弃其中一门
+        kept = [s for s in range(3) if s != skip]
+        combined = _combine(per_suit[kept[0]], per_suit[kept[1]], 4)
+        standard = combined[np.arange(n), needed, 1]
+        best = np.minimum(best, standard - 1)
+
+        # 七对：每张单牌再摸一张成对，单牌不够时还要先摸到新的牌
+        missing = 7 - np.minimum(pairs[:, kept].sum(axis=(1, 2)), 7)
+        n_singles = singles[:, kept].sum(axis=(1, 2))
+        seven = missing + np.maximum(0, missing - n_singles) - 1
+        seven = np.where(melds == 0, seven, 99)
+        best = np.minimum(best, seven)
+    return best
+
+
+def shanten(hand: Hand, melds: int = 0) -> int:
+    """单手牌的向听数（-1 表示已胡，0 表示听牌）"""
+    return int(shanten_batch([hand], melds)[0])
+
+
+def shanten_iter(hands: Iterable[Hand], melds: int = 0, chunk: int = 100000):
+    """逐块计算任意长度手牌序列的向听数，逐个返回结果"""
+    buffer = []
+    for hand in hands:
+        buffer.append(hand)
+        if len(buffer) >= chunk:
+            yield from shanten_batch(buffer, melds).tolist()
+            buffer = []
+    if buffer:
+        yield from shanten_batch(buffer, melds).tolist()
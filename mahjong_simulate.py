@@ -0,0 +1,348 @@
+"""
+四川麻将蒙特卡洛模拟
+随机发牌，由简单策略的玩家打完整局，按现有计分规则结算，
+统计各座位的积分分布和番型频率，用于调整番数或封顶前评估影响
+"""
+
+import argparse
+import math
+import os
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from mahjong_engine import MODE_TRADITIONAL, MODE_XUELIU, SCORE_TYPES, get_rules, score_hand
+from mahjong_tiles import detect_fans, is_winning, settle_chajiao
+
+SEATS = ["东家", "南家", "西家", "北家"]
+WALL = [(suit, rank) for suit in range(3) for rank in range(9)] * 4
+
+# 每个任务模拟的局数；随机种子按任务编号确定，与进程数无关
+CHUNK_ROUNDS = 2000
+
+
+# ---------- 策略 ----------
+def _hand(counts: List[List[int]]):
+    return tuple(tuple(c) for c in counts)
+
+
+def _win_types(mode: str, counts: List[List[int]], tile, extra: List[str]) -> Optional[List[str]]:
+    """加上 tile 后能胡时返回番型，否则返回 None"""
+    suit, rank = tile
+    if counts[suit][rank] >= 4:
+        return None
+    counts[suit][rank] += 1
+    hand = _hand(counts)
+    counts[suit][rank] -= 1
+    # 先用不依赖规则的快速判断过滤，再按规则识别番型
+    if not is_winning(hand):
+        return None
+    try:
+        return detect_fans(mode, hand, [t for t in extra if t in SCORE_TYPES[mode]])
+    except ValueError:
+        return None  # 规则中没有这种胡法
+
+
+def _choose_discard(counts: List[List[int]], que: int):
+    """先打缺门，其余打与周围牌关联最少的牌"""
+    if any(counts[que]):
+        rank = max(r for r in range(9) if counts[que][r])
+        return que, rank
+
+    best, best_value = None, None
+    for suit in range(3):
+        c = counts[suit]
+        for rank in range(9):
+            if not c[rank]:
+                continue
+            value = 4 * (c[rank] - 1)
+            for offset, weight in ((1, 2), (2, 1)):
+                if rank - offset >= 0:
+                    value += weight * c[rank - offset]
+                if rank + offset <= 8:
+                    value += weight * c[rank + offset]
+            if rank in (0, 8):
+                value -= 1
+            if best_value is None or value < best_value:
+                best, best_value = (suit, rank), value
+    return best
+
+
+# ---------- 单局 ----------
+def _total_fan(mode: str, types: List[str], fan_values: Optional[Dict[str, int]],
+               cap: Optional[int]) -> int:
+    total_fan = sum((fan_values or {}).get(t, SCORE_TYPES[mode][t]) for t in types)
+    if cap is None:
+        cap = get_rules(mode).cap
+    return min(total_fan, cap) if cap is not None else total_fan
+
+
+def _score(mode: str, winners: List[str], types: List[str], pao: str,
+           fan_values: Optional[Dict[str, int]], cap: Optional[int], base: Optional[int]) -> Dict:
+    result = score_hand(SEATS, mode, winners, types, pao, base)
+    if fan_values is None and cap is None:
+        return result
+    # 沿用原有的结算方式，只替换单家分值
+    total_fan = _total_fan(mode, result['types'], fan_values, cap)
+    final = (base or get_rules(mode).base) * (2 ** total_fan)
+    result['scores'] = {p: sc // result['final'] * final for p, sc in result['scores'].items()}
+    result['total_fan'] = total_fan
+    result['final'] = final
+    return result
+
+
+def play_round(rng: random.Random, mode: str, dealer: int = 0,
+               fan_values: Optional[Dict[str, int]] = None,
+               cap: Optional[int] = None, base: Optional[int] = None, chajiao: bool = True) -> Dict:
+    """模拟一局，返回 {'scores': 各座位得分, 'wins': [(胡家, 番型, 是否自摸)]}"""
+    wall = WALL[:]
+    rng.shuffle(wall)
+    hands = [[[0] * 9 for _ in range(3)] for _ in SEATS]
+    for i in range(13 * len(SEATS)):
+        suit, rank = wall[i]
+        hands[i % len(SEATS)][suit][rank] += 1
+    pos = 13 * len(SEATS)
+    ques = [min(range(3), key=lambda s: sum(h[s])) for h in hands]
+
+    scores = [0] * len(SEATS)
+    wins = []
+    won = [False] * len(SEATS)
+    turn = dealer
+    first_draw = True
+
+    def settle(winner_seats, types, pao_seat):
+        result = _score(mode, [SEATS[w] for w in winner_seats], types,
+                        SEATS[pao_seat] if pao_seat is not None else "",
+                        fan_values, cap, base)
+        for seat, p in enumerate(SEATS):
+            scores[seat] += result['scores'][p]
+        for w in winner_seats:
+            wins.append((SEATS[w], result['types'], pao_seat is None))
+
+    while pos < len(wall):
+        tile = wall[pos]
+        pos += 1
+        last_tile = pos == len(wall)
+        counts = hands[turn]
+
+        extra = ['自摸', '海底捞月'] if last_tile else ['自摸']
+        if first_draw and turn == dealer:
+            extra.append('天胡')
+        types = _win_types(mode, counts, tile, extra)
+        if types is not None:
+            settle([turn], types, None)
+            if mode == MODE_TRADITIONAL:
+                break
+            won[turn] = True
+            turn = (turn + 1) % len(SEATS)
+            first_draw = False
+            continue
+        first_draw = False
+
+        # 已胡牌的玩家手牌不再变化，摸到的牌直接打出
+        if won[turn]:
+            discard = tile
+        else:
+            counts[tile[0]][tile[1]] += 1
+            discard = _choose_discard(counts, ques[turn])
+            counts[discard[0]][discard[1]] -= 1
+
+        ron = []
+        extra = ['海底捞月'] if last_tile else []
+        for step in range(1, len(SEATS)):
+            seat = (turn + step) % len(SEATS)
+            types = _win_types(mode, hands[seat], discard, extra)
+            if types is not None:
+                ron.append(seat)
+                # 一炮多响时按各胡家番型分别结算
+                settle([seat], types, turn)
+                if mode == MODE_TRADITIONAL:
+                    break
+        if ron:
+            if mode == MODE_TRADITIONAL:
+                break
+            for seat in ron:
+                won[seat] = True
+            turn = (ron[-1] + 1) % len(SEATS)
+            continue
+
+        turn = (turn + 1) % len(SEATS)
+    else:
+        # 流局查叫：未胡牌的玩家按13张手牌结算
+        if chajiao:
+            remaining = {SEATS[s]: _hand(h) for s, h in enumerate(hands) if not won[s]}
+            if len(remaining) > 1:
+                ready = settle_chajiao(SEATS, mode, remaining, base)['ready']
+                for p, info in ready.items():
+                    final = ((base or get_rules(mode).base)
+                             * (2 ** _total_fan(mode, info['types'], fan_values, cap)))
+                    for loser in remaining:
+                        if loser not in ready:
+                            scores[SEATS.index(p)] += final
+                            scores[SEATS.index(loser)] -= final
+
+    return {'scores': scores, 'wins': wins}
+
+
+# ---------- 统计 ----------
+def _empty_stats() -> Dict:
+    return {
+        'rounds': 0,
+        'draws': 0,
+        'sum': [0] * len(SEATS),
+        'sum_sq': [0] * len(SEATS),
+        'histogram': [Counter() for _ in SEATS],
+        'fan_frequency': Counter(),
+        'total_fan': Counter(),
+        'wins': 0,
+        'zimo': 0,
+    }
+
+
+def _merge(total: Dict, part: Dict):
+    for key in ('rounds', 'draws', 'wins', 'zimo'):
+        total[key] += part[key]
+    for seat in range(len(SEATS)):
+        total['sum'][seat] += part['sum'][seat]
+        total['sum_sq'][seat] += part['sum_sq'][seat]
+        total['histogram'][seat].update(part['histogram'][seat])
+    total['fan_frequency'].update(part['fan_frequency'])
+    total['total_fan'].update(part['total_fan'])
+
+
+def simulate_chunk(chunk: int, rounds: int, mode: str, seed: int,
+                   fan_values: Optional[Dict[str, int]] = None,
+                   cap: Optional[int] = None, base: Optional[int] = None) -> Dict:
+    """模拟一个任务的若干局（进程池中执行），种子由 seed 和任务编号决定"""
+    rng = random.Random(seed * 1000003 + chunk)
+    stats = _empty_stats()
+    for i in range(rounds):
+        result = play_round(rng, mode, (chunk * CHUNK_ROUNDS + i) % len(SEATS),
+                            fan_values, cap, base)
+        stats['rounds'] += 1
+        if not result['wins']:
+            stats['draws'] += 1
+        for seat, sc in enumerate(result['scores']):
+            stats['sum'][seat] += sc
+            stats['sum_sq'][seat] += sc * sc
+            stats['histogram'][seat][sc] += 1
+        for _, types, zimo in result['wins']:
+            stats['wins'] += 1
+            stats['zimo'] += zimo
+            stats['fan_frequency'].update(types)
+            stats['total_fan'][_total_fan(mode, types, fan_values, cap)] += 1
+    return stats
+
+
+def simulate(rounds: int, mode: str = MODE_XUELIU, seed: int = 0,
+             workers: Optional[int] = None,
+             fan_values: Optional[Dict[str, int]] = None,
+             cap: Optional[int] = None, base: Optional[int] = None) -> Dict:
+    """模拟 rounds 局并汇总统计
+
+    fan_values 覆盖部分番型的番数，cap 为封顶番数；workers 为进程数
+    （默认等于CPU核数，1 表示在当前进程中运行）。相同 seed 结果相同，与进程数无关
+    """
+    if mode not in SCORE_TYPES:
+        raise ValueError(f"未知的计分模式: {mode}")
+    unknown = set(fan_values or {}) - set(SCORE_TYPES[mode])
+    if unknown:
+        raise ValueError(f"未知的胡牌类型: {', '.join(sorted(unknown))}")
+
+    chunks = [(i, min(CHUNK_ROUNDS, rounds - i * CHUNK_ROUNDS))
+              for i in range(math.ceil(rounds / CHUNK_ROUNDS))]
+    args = [(chunk, n, mode, seed, fan_values, cap, base) for chunk, n in chunks]
+
+    total = _empty_stats()
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) == 1:
+        for a in args:
+            _merge(total, simulate_chunk(*a))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part in pool.map(simulate_chunk, *zip(*args)):
+                _merge(total, part)
+    return summarize(total)
+
+
+def summarize(stats: Dict) -> Dict:
+    """计算各座位的均值、标准差、分位数"""
+    n = stats['rounds'] or 1
+    players = {}
+    for seat, name in enumerate(SEATS):
+        mean = stats['sum'][seat] / n
+        variance = max(0.0, stats['sum_sq'][seat] / n - mean * mean)
+        hist = stats['histogram'][seat]
+        players[name] = {
+            'mean': mean,
+            'std': math.sqrt(variance),
+            'min': min(hist) if hist else 0,
+            'max': max(hist) if hist else 0,
+            'p5': _percentile(hist, 0.05),
+            'p50': _percentile(hist, 0.5),
+            'p95': _percentile(hist, 0.95),
+        }
+    return {
+        'rounds': stats['rounds'],
+        'draws': stats['draws'],
+        'wins': stats['wins'],
+        'zimo': stats['zimo'],
+        'players': players,
+        'histogram': {name: dict(stats['histogram'][seat]) for seat, name in enumerate(SEATS)},
+        'fan_frequency': dict(stats['fan_frequency'].most_common()),
+        'total_fan': dict(sorted(stats['total_fan'].items())),
+    }
+
+
+def _percentile(hist: Counter, q: float) -> int:
+    total = sum(hist.values())
+    if not total:
+        return 0
+    target = q * total
+    seen = 0
+    for value in sorted(hist):
+        seen += hist[value]
+        if seen >= target:
+            return value
+    return max(hist)
+
+
+def format_report(summary: Dict) -> str:
+    lines = [f"模拟局数: {summary['rounds']}  胡牌次数: {summary['wins']}  "
+             f"自摸: {summary['zimo']}  荒庄: {summary['draws']}", "",
+             "座位    均值      标准差    最小    5%    中位    95%    最大"]
+    for name, p in summary['players'].items():
+        lines.append(f"{name}  {p['mean']:8.2f}  {p['std']:8.2f}  {p['min']:6d}  {p['p5']:5d}  "
+                     f"{p['p50']:5d}  {p['p95']:5d}  {p['max']:6d}")
+    lines += ["", "番型出现次数:"]
+    for name, count in summary['fan_frequency'].items():
+        lines.append(f"  {name}: {count} ({count / max(summary['wins'], 1):.1%})")
+    lines += ["", "总番数分布:"]
+    for fan, count in summary['total_fan'].items():
+        lines.append(f"  {fan}番: {count}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="四川麻将蒙特卡洛模拟")
+    parser.add_argument("rounds", type=int, help="模拟局数")
+    parser.add_argument("--mode", default=MODE_XUELIU, choices=list(SCORE_TYPES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cap", type=int, default=None, help="封顶番数")
+    parser.add_argument("--fan", action="append", default=[], metavar="类型=番数",
+                        help="覆盖番型的番数，可重复，如 --fan 清一色=3")
+    args = parser.parse_args()
+
+    fan_values = {}
+    for item in args.fan:
+        name, _, value = item.partition('=')
+        fan_values[name] = int(value)
+    summary = simulate(args.rounds, args.mode, args.seed, args.workers,
+                       fan_values or None, args.cap)
+    print(format_report(summary))
+
+
+if __name__ == "__main__":
+    main()
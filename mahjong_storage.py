@@ -0,0 +1,649 @@
+"""
+四川麻将数据存储
+默认使用快照 + 追加式日志：每次操作只向日志追加一行事件，定期压缩为快照；
+也可选用SQLite后端
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+# 日志事件数达到该值时压缩为快照
+COMPACT_EVERY = 200
+# 启动时加载的历史记录条数，以及之后每页按需加载的条数
+HISTORY_TAIL = 200
+HISTORY_PAGE = 200
+# 分块读取历史文件时的块大小
+PAGE_BLOCK = 64 * 1024
+
+
+# ---------- 事件回放 ----------
+def apply_event(state: Dict, event: Dict):
+    """把一条日志事件应用到状态字典上（与界面中的操作逻辑一致）"""
+    history: List[Dict] = state['game_history']
+    scores: Dict[str, int] = state['scores']
+    kind = event['type']
+
+    if kind == 'hand':
+        rec = event['record']
+        history.append(rec)
+        for p, sc in rec['scores'].items():
+            scores[p] = scores.get(p, 0) + sc
+        state['current_round'] = rec['round']
+    elif kind == 'undo':
+        rec = history.pop()
+        for p, sc in rec['scores'].items():
+            scores[p] = scores.get(p, 0) - sc
+        if (rec.get('hand_num', 1) == 1 and
+                (not history or history[-1]['round'] != rec['round'])):
+            state['current_round'] -= 1
+    elif kind == 'end_round':
+        for rec in reversed(history):
+            if rec['round'] == event['round']:
+                rec['round_ended'] = True
+            else:
+                break
+    elif kind == 'players':
+        old_players = state['players'] or list(scores)
+        state['players'] = list(event['players'])
+        state['scores'] = {new_p: scores.get(old_players[i], 0)
+                           for i, new_p in enumerate(state['players'])}
+    else:
+        raise ValueError(f"未知的日志事件: {kind}")
+
+
+def needs_older_page(history: List[Dict], skipped: int) -> bool:
+    """已加载的尾部是否还不足以支撑撤销和结束本局
+
+    要求最后一局完整加载，并且至少加载了前一局的一条记录
+    """
+    return skipped > 0 and (not history or history[0]['round'] == history[-1]['round'])
+
+
+def ensure_tail(store, state: Dict):
+    """按需向前加载历史，直到满足 needs_older_page 的要求"""
+    while needs_older_page(state['game_history'], state['history_skipped']):
+        records, state['history_start'] = store.load_page(state['history_start'])
+        if not records:
+            break
+        state['game_history'][:0] = records
+        state['history_skipped'] -= len(records)
+
+
+class PageCache:
+    """只读地按位置读取会话尚未加载的早期历史（供浏览窗口使用）
+
+    从会话已加载部分的起点 start 向前逐页读取，记下每页的起点以便之后直接定位，
+    内存中只保留最近使用的 keep 页；不会改动会话的 game_history。
+    存储每次写入后 generation 都会改变，记下的起点可能已经失效，需重新创建
+    """
+
+    def __init__(self, store, start: int, count: int, page: int = HISTORY_PAGE, keep: int = 16):
+        self.store = store
+        self.generation = store.generation
+        self.count = count          # 覆盖绝对位置 [0, count)
+        self.page = page
+        self.keep = keep
+        self.cursors = [start]      # cursors[k] 为第 k 页（从后往前数）的读取起点
+        self.pages: 'OrderedDict[int, List[Dict]]' = OrderedDict()
+
+    def record(self, pos: int) -> Optional[Dict]:
+        if not 0 <= pos < self.count:
+            return None
+        k = (self.count - 1 - pos) // self.page
+        records = self._load(k)
+        first = self.count - len(records) - k * self.page
+        return records[pos - first] if 0 <= pos - first < len(records) else None
+
+    def _load(self, k: int) -> List[Dict]:
+        if k in self.pages:
+            self.pages.move_to_end(k)
+            return self.pages[k]
+        # 还不知道第 k 页的起点时，先依次读取前面的各页
+        while len(self.cursors) <= k:
+            self._load(len(self.cursors) - 1)
+        records, start = self.store.load_page(self.cursors[k], self.page)
+        if len(self.cursors) == k + 1:
+            self.cursors.append(start)
+        self.pages[k] = records
+        if len(self.pages) > self.keep:
+            self.pages.popitem(last=False)
+        return records
+
+
+class JsonJournalStore:
+    """JSON快照 + JSONL追加日志
+
+    mahjong_scores.json 只保存玩家、积分、局数等快照信息，
+    历史记录逐行保存在快照指向的 mahjong_scores.history.<序号>.jsonl 中，
+    启动时只需从文件末尾读取最近的记录，更早的记录按需分页读取。
+    mahjong_scores.journal.jsonl 逐行记录快照之后的事件。
+    每条事件带递增序号，快照记录已包含的最大序号，
+    因此压缩过程中断时也不会重复回放。
+    旧版把 game_history 内联在快照中的文件仍可读取，下次压缩时自动转换。
+    """
+
+    def __init__(self, data_file: str, compact_every: int = COMPACT_EVERY):
+        self.data_file = data_file
+        self.base_name = os.path.splitext(data_file)[0]
+        self.journal_file = self.base_name + '.journal.jsonl'
+        self.history_file: Optional[str] = None
+        self.compact_every = compact_every
+        self.seq = 0
+        self.pending = 0
+        self.generation = 0  # 每次写入加一，读取位置按旧内容记下的缓存据此失效
+        self.lock = threading.Lock()
+
+    def load(self, tail: Optional[int] = HISTORY_TAIL) -> Optional[Dict]:
+        """读取快照、历史尾部并回放日志，没有任何数据时返回 None
+
+        tail 为启动时加载的历史条数，None 表示全部加载
+        """
+        state = None
+        snapshot_seq = 0
+        self.history_file = None
+        if os.path.exists(self.data_file):
+            with open(self.data_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            state = {
+                'players': data.get('players'),
+                'scores': data.get('scores'),
+                'game_history': data.get('game_history', []),
+                'current_round': data.get('current_round', 0),
+                'history_start': 0,
+                'history_skipped': 0,
+                'ratings': data.get('ratings'),
+            }
+            snapshot_seq = data.get('journal_seq', 0)
+            if data.get('history_file'):
+                self.history_file = os.path.join(os.path.dirname(self.data_file),
+                                                 data['history_file'])
+                size = os.path.getsize(self.history_file)
+                records, start = self.load_page(size, tail)
+                state['game_history'] = records
+                state['history_start'] = start
+                state['history_skipped'] = data.get('history_count', 0) - len(records)
+                ensure_tail(self, state)
+        self.seq = snapshot_seq
+        self.pending = 0
+
+        for event in self._read_journal():
+            if event['seq'] <= snapshot_seq:
+                continue
+            if state is None:
+                raise ValueError("日志存在但缺少快照文件")
+            apply_event(state, event)
+            ensure_tail(self, state)
+            self.seq = event['seq']
+            self.pending += 1
+        return state
+
+    def load_page(self, start: int, count: Optional[int] = HISTORY_PAGE):
+        """读取 start 之前的 count 条历史，返回 (记录列表, 新的起点)
+
+        对JSON存储而言 start 是历史文件中的字节偏移，从后向前分块读取
+        """
+        with self.lock:
+            if not self.history_file or start <= 0:
+                return [], 0
+            with open(self.history_file, 'rb') as f:
+                if count is None:
+                    f.seek(0)
+                    data = f.read(start)
+                    return [json.loads(line) for line in data.splitlines() if line.strip()], 0
+                lines: List[bytes] = []
+                pos = start
+                buf = b''
+                while pos > 0 and len(lines) < count:
+                    step = min(PAGE_BLOCK, pos)
+                    pos -= step
+                    f.seek(pos)
+                    buf = f.read(step) + buf
+                    parts = buf.split(b'\n')
+                    # 第一段可能是不完整的行，留到下一块再处理
+                    buf = parts[0] if pos > 0 else b''
+                    complete = parts[1:] if pos > 0 else parts
+                    lines[:0] = [line for line in complete if line.strip()]
+                keep = lines[-count:]
+                new_start = start - sum(len(line) + 1 for line in keep)
+                return [json.loads(line) for line in keep], max(new_start, 0)
+
+    def iter_history(self, start: int):
+        """按时间顺序逐条读取 start 之前（未加载）的历史记录"""
+        with self.lock:
+            if not self.history_file or start <= 0:
+                return
+            f = open(self.history_file, 'rb')
+        with f:
+            remaining = start
+            for line in f:
+                if remaining <= 0:
+                    break
+                remaining -= len(line)
+                if line.strip():
+                    yield json.loads(line)
+
+    def _read_journal(self):
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, 'rb') as f:
+            lines = f.readlines()
+        offset = 0
+        for i, line in enumerate(lines):
+            try:
+                event = json.loads(line.decode('utf-8')) if line.strip() else None
+            except ValueError:
+                # 写入中途崩溃只会损坏最后一行：截掉残行，后续事件从这里继续追加
+                if i == len(lines) - 1:
+                    with open(self.journal_file, 'r+b') as f:
+                        f.truncate(offset)
+                    return
+                raise
+            offset += len(line)
+            if event is not None:
+                yield event
+
+    def append(self, event: Dict) -> bool:
+        """追加一条事件，返回是否需要压缩"""
+        return self.append_many([event])
+
+    def append_many(self, events: List[Dict]) -> bool:
+        """一次写入并同步多条事件（组提交），返回是否需要压缩"""
+        lines = []
+        for event in events:
+            self.seq += 1
+            lines.append(json.dumps(dict(event, seq=self.seq), ensure_ascii=False) + '\n')
+        self.generation += 1
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        self.pending += len(events)
+        # 尚无快照时立即压缩，保证日志总能在快照基础上回放
+        return self.pending >= self.compact_every or not os.path.exists(self.data_file)
+
+    def save(self, state: Dict):
+        """写入完整快照并清空日志
+
+        新的历史文件 = 旧文件中未加载的前缀（按字节原样复制）+ 已加载的尾部。
+        所有文件都先写临时文件并同步到磁盘，最后原子替换快照，
+        写入中途崩溃时旧快照和它指向的历史文件仍然完整。
+        """
+        history_file = f"{self.base_name}.history.{self.seq}.jsonl"
+        self.generation += 1
+        start = state.get('history_start', 0) if state.get('history_skipped') else 0
+        with open(history_file + '.tmp', 'wb') as f:
+            if start > 0 and self.history_file:
+                with open(self.history_file, 'rb') as old:
+                    remaining = start
+                    while remaining > 0:
+                        chunk = old.read(min(PAGE_BLOCK, remaining))
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        remaining -= len(chunk)
+            for rec in state['game_history']:
+                f.write(json.dumps(rec, ensure_ascii=False).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(history_file + '.tmp', history_file)
+
+        data = {
+            'players': state['players'],
+            'scores': state['scores'],
+            'current_round': state['current_round'],
+            'history_file': os.path.basename(history_file),
+            'history_count': state.get('history_skipped', 0) + len(state['game_history']),
+            'journal_seq': self.seq,
+            'ratings': state.get('ratings'),
+            'last_updated': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        tmp_file = self.data_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        with self.lock:
+            os.replace(tmp_file, self.data_file)
+            old_file, self.history_file = self.history_file, history_file
+        with open(self.journal_file, 'w', encoding='utf-8'):
+            pass
+        self.pending = 0
+
+        if old_file and old_file != history_file:
+            try:
+                os.remove(old_file)
+            except OSError:
+                # Windows下文件仍被读取时无法删除，留到下次压缩
+                pass
+
+    def save_rating_state(self, ratings: Dict):
+        """本场评分只随快照保存，启动时按快照之后的日志回放即可"""
+
+
+class SqliteStore:
+    """SQLite存储：玩家、每手记录和每名玩家的分数变化分表保存
+
+    每手作为一个事务提交，局数、玩家和时间均建有索引。
+    接口与 JsonJournalStore 相同，可直接替换。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS players (
+            seat INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            score INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS hands (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            round INTEGER NOT NULL,
+            hand_num INTEGER NOT NULL,
+            timestamp TEXT NOT NULL,
+            description TEXT,
+            winner TEXT,
+            mode TEXT,
+            types TEXT,
+            pao TEXT,
+            round_ended INTEGER NOT NULL,
+            settlement TEXT
+        );
+        CREATE TABLE IF NOT EXISTS deltas (
+            hand_id INTEGER NOT NULL REFERENCES hands(id) ON DELETE CASCADE,
+            seat INTEGER NOT NULL,
+            player TEXT NOT NULL,
+            delta INTEGER NOT NULL,
+            PRIMARY KEY (hand_id, seat)
+        );
+        CREATE INDEX IF NOT EXISTS idx_hands_round ON hands(round);
+        CREATE INDEX IF NOT EXISTS idx_hands_timestamp ON hands(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_deltas_player ON deltas(player);
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        # 连接在主线程打开，之后由后台写入线程使用
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(self.SCHEMA)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(hands)")]
+        if 'settlement' not in columns:  # 旧版数据库没有结算类型列
+            self.conn.execute("ALTER TABLE hands ADD COLUMN settlement TEXT")
+            self.conn.commit()
+        self.generation = 0  # 每次写入加一；save 会重新编号已加载部分的 id
+        self.lock = threading.Lock()
+
+    def load(self, tail: Optional[int] = HISTORY_TAIL) -> Optional[Dict]:
+        """读取玩家、积分和最近的历史记录，数据库为空时返回 None
+
+        tail 为启动时加载的历史条数，None 表示全部加载
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT name, score FROM players ORDER BY seat").fetchall()
+            if not rows:
+                return None
+            end = self.conn.execute("SELECT MAX(id) FROM hands").fetchone()[0]
+            current_round = self._current_round()
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'ratings'").fetchone()
+        records, start = self.load_page((end or 0) + 1, tail)
+        state = {
+            'players': [name for name, _ in rows],
+            'scores': {name: score for name, score in rows},
+            'game_history': records,
+            'current_round': current_round,
+            'history_start': start,
+            'history_skipped': self._count_before(start),
+            'ratings': json.loads(row[0]) if row else None,
+        }
+        ensure_tail(self, state)
+        return state
+
+    def load_page(self, start: int, count: Optional[int] = HISTORY_PAGE):
+        """读取 id 小于 start 的最近 count 条历史，返回 (记录列表, 新的起点)"""
+        with self.lock:
+            if count is None:
+                hands = self.conn.execute(
+                    "SELECT * FROM hands WHERE id < ? ORDER BY id", (start,)).fetchall()
+            else:
+                hands = self.conn.execute(
+                    "SELECT * FROM hands WHERE id < ? ORDER BY id DESC LIMIT ?",
+                    (start, count)).fetchall()
+                hands.reverse()
+            if not hands:
+                return [], start
+            return self._records(hands), hands[0][0]
+
+    def iter_history(self, start: int):
+        """按时间顺序逐页读取 id 小于 start（未加载）的历史记录"""
+        last_id = 0
+        while True:
+            with self.lock:
+                hands = self.conn.execute(
+                    "SELECT * FROM hands WHERE id > ? AND id < ? ORDER BY id LIMIT ?",
+                    (last_id, start, HISTORY_PAGE)).fetchall()
+                records = self._records(hands) if hands else []
+            if not hands:
+                return
+            last_id = hands[-1][0]
+            yield from records
+
+    def _count_before(self, start: int) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM hands WHERE id < ?",
+                                     (start,)).fetchone()[0]
+
+    def _current_round(self) -> int:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'current_round'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _records(self, hands) -> List[Dict]:
+        deltas: Dict[int, Dict[str, int]] = {}
+        for hand_id, player, delta in self.conn.execute(
+                "SELECT hand_id, player, delta FROM deltas WHERE hand_id BETWEEN ? AND ? "
+                "ORDER BY hand_id, seat", (hands[0][0], hands[-1][0])):
+            deltas.setdefault(hand_id, {})[player] = delta
+        return [self._record(row, deltas.get(row[0], {})) for row in hands]
+
+    @staticmethod
+    def _record(row, scores: Dict[str, int]) -> Dict:
+        (_, round_num, hand_num, timestamp, description,
+         winner, mode, types, pao, round_ended, settlement) = row
+        rec = {
+            'round': round_num,
+            'hand_num': hand_num,
+            'scores': scores,
+            'timestamp': timestamp,
+            'description': description,
+            'winner': winner,
+        }
+        if mode is not None:
+            rec['mode'] = mode
+        if types is not None:
+            rec['types'] = json.loads(types)
+        if pao is not None:
+            rec['pao'] = pao
+        rec['round_ended'] = bool(round_ended)
+        if settlement is not None:
+            rec['settlement'] = settlement
+        return rec
+
+    def _insert_hand(self, rec: Dict):
+        types = rec.get('types')
+        cur = self.conn.execute(
+            "INSERT INTO hands (round, hand_num, timestamp, description, winner, "
+            "mode, types, pao, round_ended, settlement) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (rec['round'], rec.get('hand_num', 1), rec['timestamp'],
+             rec.get('description'), rec.get('winner'), rec.get('mode'),
+             json.dumps(types, ensure_ascii=False) if types is not None else None,
+             rec.get('pao'), int(rec.get('round_ended', True)), rec.get('settlement')))
+        self.conn.executemany(
+            "INSERT INTO deltas (hand_id, seat, player, delta) VALUES (?, ?, ?, ?)",
+            [(cur.lastrowid, seat, p, sc) for seat, (p, sc) in enumerate(rec['scores'].items())])
+
+    def _add_scores(self, deltas: List[int], sign: int):
+        self.conn.executemany(
+            "UPDATE players SET score = score + ? WHERE seat = ?",
+            [(sign * sc, seat) for seat, sc in enumerate(deltas)])
+
+    def _set_current_round(self, round_num: int):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('current_round', ?)",
+            (str(round_num),))
+
+    def append(self, event: Dict) -> bool:
+        """把一条事件作为一个事务写入，返回是否需要写入完整状态"""
+        return self.append_many([event])
+
+    def append_many(self, events: List[Dict]) -> bool:
+        """在同一个事务中写入多条事件（组提交）"""
+        with self.lock:
+            if not self.conn.execute("SELECT 1 FROM players LIMIT 1").fetchone():
+                return True
+            self.generation += 1
+            with self.conn:
+                for event in events:
+                    self._apply(event)
+        return False
+
+    def _apply(self, event: Dict):
+        kind = event['type']
+        if kind == 'hand':
+            rec = event['record']
+            self._insert_hand(rec)
+            self._add_scores(list(rec['scores'].values()), 1)
+            self._set_current_round(rec['round'])
+        elif kind == 'undo':
+            rows = self.conn.execute(
+                "SELECT id, round, hand_num FROM hands ORDER BY id DESC LIMIT 2").fetchall()
+            if not rows:
+                return
+            hand_id, round_num, hand_num = rows[0]
+            removed = [delta for delta, in self.conn.execute(
+                "SELECT delta FROM deltas WHERE hand_id = ? ORDER BY seat", (hand_id,))]
+            self._add_scores(removed, -1)
+            self.conn.execute("DELETE FROM hands WHERE id = ?", (hand_id,))
+            if hand_num == 1 and (len(rows) == 1 or rows[1][1] != round_num):
+                self._set_current_round(self._current_round() - 1)
+        elif kind == 'end_round':
+            self.conn.execute("UPDATE hands SET round_ended = 1 WHERE round = ?",
+                              (event['round'],))
+        elif kind == 'players':
+            self.conn.executemany(
+                "UPDATE players SET name = ? WHERE seat = ?",
+                [(p, seat) for seat, p in enumerate(event['players'])])
+        else:
+            raise ValueError(f"未知的日志事件: {kind}")
+
+    def save(self, state: Dict):
+        """用完整状态覆盖数据库内容，未加载的早期历史保持不变"""
+        with self.lock, self.conn:
+            self.generation += 1
+            if state.get('history_skipped'):
+                self.conn.execute("DELETE FROM hands WHERE id >= ?", (state['history_start'],))
+            else:
+                self.conn.execute("DELETE FROM hands")
+            self.conn.execute("DELETE FROM players")
+            self.conn.executemany(
+                "INSERT INTO players (seat, name, score) VALUES (?, ?, ?)",
+                [(seat, p, state['scores'].get(p, 0)) for seat, p in enumerate(state['players'])])
+            for rec in state['game_history']:
+                self._insert_hand(rec)
+            self._set_current_round(state['current_round'])
+            self._set_ratings(state.get('ratings'))
+
+    def _set_ratings(self, ratings: Optional[Dict]):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('ratings', ?)",
+                          (json.dumps(ratings, ensure_ascii=False),))
+
+    def save_rating_state(self, ratings: Dict):
+        """保存本场评分（快照很少写入，每次修改后单独保存）"""
+        with self.lock, self.conn:
+            self._set_ratings(ratings)
+
+
+class BackgroundWriter:
+    """后台写入线程
+
+    主线程只负责把事件或快照请求放入队列；写入线程把一段时间内的
+    多次修改合并为一次写入（组提交）。需要压缩或出错时，通过
+    schedule（一般为 root.after）回到主线程处理。
+    """
+
+    def __init__(self, store, schedule: Callable, on_error: Callable,
+                 on_compact: Callable, delay: float = 0.05):
+        self.store = store
+        self.schedule = schedule
+        self.on_error = on_error
+        self.on_compact = on_compact
+        self.delay = delay
+        self.queue: "queue.Queue" = queue.Queue()
+        self.compact_requested = False
+        self.thread = threading.Thread(target=self._run, name="mahjong-writer", daemon=True)
+        self.thread.start()
+
+    # ----- 主线程调用 -----
+    def append(self, event: Dict):
+        """记录一条事件（只入队，不阻塞界面）"""
+        self.queue.put(('event', event))
+
+    def snapshot(self, state: Dict):
+        """请求写入完整快照，state 需为调用时刻的副本"""
+        self.queue.put(('snapshot', state))
+
+    def rating_state(self, ratings: Dict):
+        """请求保存本场评分，ratings 需为调用时刻的副本"""
+        self.queue.put(('ratings', ratings))
+
+    def close(self, timeout: float = 5.0):
+        """写完队列中剩余的内容后退出"""
+        self.queue.put(('stop', None))
+        self.thread.join(timeout)
+
+    # ----- 写入线程 -----
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            if batch[0][0] != 'stop':
+                # 稍等片刻，把连续的修改合并为一次写入
+                time.sleep(self.delay)
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = any(kind == 'stop' for kind, _ in batch)
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.schedule(lambda e=e: self.on_error(e))
+            if stop:
+                return
+
+    def _write(self, batch):
+        # 只需写入最后一个快照；它之前的事件已包含在快照中，之后的事件照常追加
+        last = max((i for i, (kind, _) in enumerate(batch) if kind == 'snapshot'), default=-1)
+        before = [item for kind, item in batch[:max(last, 0)] if kind == 'event']
+        after = [item for kind, item in batch[last + 1:] if kind == 'event']
+        # 评分同样只写最后一次；快照之前的已由快照覆盖
+        ratings = [item for kind, item in batch[last + 1:] if kind == 'ratings']
+
+        if last >= 0:
+            if before:
+                self.store.append_many(before)
+            self.store.save(batch[last][1])
+            self.compact_requested = False
+        if after and self.store.append_many(after) and not self.compact_requested:
+            self.compact_requested = True
+            self.schedule(self.on_compact)
+        if ratings:
+            self.store.save_rating_state(ratings[-1])
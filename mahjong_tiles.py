@@ -0,0 +1,281 @@
+"""
+四川麻将牌型识别
+根据实际手牌自动判断胡牌类型，结果可直接交给计分引擎
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from mahjong_engine import INT64_MAX, INT64_MIN, SCORE_TYPES, get_rules
+
+# 花色顺序：万、条、筒
+SUITS = ('万', '条', '筒')
+_SUIT_ALIASES = {'万': 0, 'm': 0, 'w': 0, '条': 1, 's': 1, 't': 1, '筒': 2, 'p': 2}
+
+# 每种花色 9 张牌的张数，一手牌为三种花色
+SuitCounts = Tuple[int, ...]
+Hand = Tuple[SuitCounts, SuitCounts, SuitCounts]
+
+# 只由手牌决定的番型，其余（自摸、杠上开花等）需由操作者勾选
+TILE_TYPES = ('平胡', '碰碰胡', '清一色', '七对', '龙七对', '清七对', '清龙七对')
+
+_TILE_PATTERN = re.compile(r"([1-9]+)\s*([万条筒mwstp])")
+
+
+def parse_tiles(text: str) -> Hand:
+    """解析手牌文字，如 "123万 456条 11筒" 或 "123m456s11p"（杠按三张录入）"""
+    counts = [[0] * 9 for _ in SUITS]
+    pos = 0
+    for match in _TILE_PATTERN.finditer(text):
+        if text[pos:match.start()].strip():
+            raise ValueError(f"无法识别的手牌: {text[pos:match.start()].strip()}")
+        suit = _SUIT_ALIASES[match.group(2)]
+        for digit in match.group(1):
+            counts[suit][int(digit) - 1] += 1
+        pos = match.end()
+    if text[pos:].strip():
+        raise ValueError(f"无法识别的手牌: {text[pos:].strip()}")
+    return tuple(tuple(c) for c in counts)
+
+
+def format_tiles(hand: Hand) -> str:
+    """把手牌格式化为 "123万 456条" 的形式"""
+    parts = []
+    for suit, counts in zip(SUITS, hand):
+        digits = ''.join(str(i + 1) * n for i, n in enumerate(counts))
+        if digits:
+            parts.append(digits + suit)
+    return ' '.join(parts)
+
+
+def check_hand(hand: Hand, size: int = 14):
+    """检查手牌张数，不合法时抛出 ValueError"""
+    if len(hand) != len(SUITS) or any(len(c) != 9 for c in hand):
+        raise ValueError("手牌格式错误：应为三种花色各9种牌的张数")
+    if any(not 0 <= n <= 4 for c in hand for n in c):
+        raise ValueError("同一种牌最多4张")
+    total = sum(map(sum, hand))
+    if total != size:
+        raise ValueError(f"手牌应为{size}张，当前为{total}张")
+
+
+# ---------- 拆牌 ----------
+@lru_cache(maxsize=None)
+def suit_shapes(counts: SuitCounts) -> FrozenSet[Tuple[bool, bool]]:
+    """单一花色的全部拆法，返回 {(是否含将, 是否全为刻子)}，无法拆完时为空集"""
+    i = next((k for k, n in enumerate(counts) if n), None)
+    if i is None:
+        return frozenset({(False, True)})
+
+    shapes = set()
+
+    def extend(rest, pair, triplet):
+        for has_pair, all_triplets in suit_shapes(tuple(rest)):
+            if not (has_pair and pair):
+                shapes.add((has_pair or pair, all_triplets and triplet))
+
+    rest = list(counts)
+    if counts[i] >= 2:
+        rest[i] -= 2
+        extend(rest, True, True)
+        rest[i] += 2
+    if counts[i] >= 3:
+        rest[i] -= 3
+        extend(rest, False, True)
+        rest[i] += 3
+    if i <= 6 and counts[i + 1] and counts[i + 2]:
+        rest[i] -= 1
+        rest[i + 1] -= 1
+        rest[i + 2] -= 1
+        extend(rest, False, False)
+    return frozenset(shapes)
+
+
+def standard_shapes(hand: Hand) -> FrozenSet[bool]:
+    """四组面子加一对将的拆法，返回 {是否碰碰胡}，不能胡时为空集"""
+    combined = {(False, True)}
+    for counts in hand:
+        shapes = suit_shapes(counts)
+        combined = {(p1 or p2, t1 and t2)
+                    for p1, t1 in combined for p2, t2 in shapes if not (p1 and p2)}
+        if not combined:
+            break
+    return frozenset(t for p, t in combined if p)
+
+
+def seven_pairs(hand: Hand) -> Tuple[bool, bool]:
+    """返回 (是否七对, 是否含四张相同即龙七对)"""
+    flat = [n for c in hand for n in c]
+    return all(n % 2 == 0 for n in flat), 4 in flat
+
+
+def suit_count(hand: Hand) -> int:
+    return sum(1 for c in hand if any(c))
+
+
+# ---------- 番型识别 ----------
+def detect_fans(mode: str, hand: Hand, extra: Iterable[str] = ()) -> List[str]:
+    """根据14张手牌识别胡牌类型
+
+    extra 为手牌看不出的番型（自摸、杠上开花等），原样并入结果。
+    返回按界面顺序排列的类型列表，可直接传给 collect_fan_info / score_hand；
+    不能胡牌时抛出 ValueError
+    """
+    if mode not in SCORE_TYPES:
+        raise ValueError(f"未知的计分模式: {mode}")
+    check_hand(hand)
+    suits = suit_count(hand)
+    if suits == 3:
+        raise ValueError("未缺一门，不能胡牌")
+
+    fans = SCORE_TYPES[mode]
+    flush = suits == 1
+    candidates = []
+
+    for pengpeng in standard_shapes(hand):
+        types = ['碰碰胡' if pengpeng and '碰碰胡' in fans else '平胡']
+        if flush and '清一色' in fans:
+            types.append('清一色')
+        candidates.append(types)
+
+    is_pairs, dragon = seven_pairs(hand)
+    if is_pairs:
+        # 规则中有龙七对、清七对等组合番型时使用组合番型，否则按七对另计清一色
+        name = ('清' if flush else '') + ('龙' if dragon else '') + '七对'
+        if name in fans:
+            candidates.append([name])
+        elif '七对' in fans:
+            candidates.append(['七对', '清一色'] if flush and '清一色' in fans else ['七对'])
+
+    if not candidates:
+        raise ValueError("手牌不能胡牌")
+
+    best = max(candidates, key=lambda types: sum(fans[t] for t in types))
+    selected = set(best) | set(extra)
+    unknown = selected - set(fans)
+    if unknown:
+        raise ValueError(f"未知的胡牌类型: {', '.join(sorted(unknown))}")
+    return [name for name in fans if name in selected]
+
+
+# ---------- 听牌与查叫 ----------
+Tile = Tuple[int, int]  # (花色, 点数0-8)
+
+
+def tile_name(tile: Tile) -> str:
+    return f"{tile[1] + 1}{SUITS[tile[0]]}"
+
+
+@lru_cache(maxsize=None)
+def suit_flags(counts: SuitCounts) -> Tuple[bool, bool, bool, bool]:
+    """单一花色的判胡标记：(有牌, 可全拆成面子, 可拆成面子加一对将, 张数全为偶数)"""
+    shapes = suit_shapes(counts)
+    return (any(counts), (False, True) in shapes or (False, False) in shapes,
+            (True, True) in shapes or (True, False) in shapes,
+            all(n % 2 == 0 for n in counts))
+
+
+def is_winning(hand: Hand) -> bool:
+    """14张手牌是否成胡（须缺一门）"""
+    a, b, c = suit_flags(hand[0]), suit_flags(hand[1]), suit_flags(hand[2])
+    if a[0] and b[0] and c[0]:
+        return False
+    if a[3] and b[3] and c[3]:
+        return True  # 七对
+    return ((a[2] and b[1] and c[1]) or (a[1] and b[2] and c[1])
+            or (a[1] and b[1] and c[2]))
+
+
+def add_tile(hand: Hand, tile: Tile) -> Hand:
+    suit, rank = tile
+    counts = list(hand[suit])
+    counts[rank] += 1
+    return tuple(tuple(counts) if s == suit else c for s, c in enumerate(hand))
+
+
+def waiting_tiles(hand: Hand) -> List[Tile]:
+    """13张手牌听的牌，未听牌时为空列表"""
+    check_hand(hand, 13)
+    if suit_count(hand) == 3:
+        return []  # 花猪不能听牌
+    return [(suit, rank) for suit in range(len(SUITS)) for rank in range(9)
+            if hand[suit][rank] < 4 and is_winning(add_tile(hand, (suit, rank)))]
+
+
+def best_wait(mode: str, hand: Hand) -> Tuple[List[Tile], int, List[str]]:
+    """返回 (听的牌, 可能的最大番数, 对应牌型)，未听牌时番数为0
+
+    规则中没有对应番型的胡法（如不计七对的规则）不算听牌
+    """
+    fans = SCORE_TYPES[mode]
+    waits = []
+    best_fan, best_types = 0, []
+    for tile in waiting_tiles(hand):
+        try:
+            types = detect_fans(mode, add_tile(hand, tile))
+        except ValueError:
+            continue
+        waits.append(tile)
+        total_fan = sum(fans[t] for t in types)
+        if total_fan > best_fan:
+            best_fan, best_types = total_fan, types
+    return waits, best_fan, best_types
+
+
+def settle_chajiao(players: List[str], mode: str, hands: Dict[str, Hand],
+                   base: Optional[int] = None) -> Dict:
+    """流局查叫：未听牌的玩家按听牌玩家可能的最大番数赔付
+
+    hands 为仍未胡牌玩家的13张手牌（已胡牌的玩家不参与），底分和封顶按规则。
+    未缺一门的花猪不参与查叫，由查花猪另行赔付。
+    返回结果字典，包含 scores / description / ready / winners / pigs；
+    需要的手牌不合法时抛出 ValueError
+    """
+    rules = get_rules(mode)
+    if base is None:
+        base = rules.base
+    unknown = set(hands) - set(players)
+    if unknown:
+        raise ValueError(f"未知的玩家: {', '.join(sorted(unknown))}")
+
+    ready = {}
+    for p in players:
+        if p in hands:
+            try:
+                waits, total_fan, types = best_wait(mode, hands[p])
+            except ValueError as e:
+                raise ValueError(f"{p}: {e}") from e
+            if waits:
+                ready[p] = {'waits': waits, 'total_fan': total_fan, 'types': types}
+
+    pigs = [p for p in players if p in hands and suit_count(hands[p]) == 3]
+    not_ready = [p for p in players if p in hands and p not in ready and p not in pigs]
+    scores = {p: 0 for p in players}
+    for p, info in ready.items():
+        capped = info['total_fan'] if rules.cap is None else min(info['total_fan'], rules.cap)
+        final = base * (2 ** capped)
+        for loser in not_ready:
+            scores[p] += final
+            scores[loser] -= final
+    if any(not INT64_MIN <= sc <= INT64_MAX for sc in scores.values()):
+        raise ValueError("查叫分数超出范围，请在规则中设置封顶番数")
+
+    parts = []
+    for p in players:
+        if p in ready:
+            info = ready[p]
+            waits = '/'.join(tile_name(t) for t in info['waits'])
+            parts.append(f"{p}听{waits}({' + '.join(info['types'])} {info['total_fan']}番)")
+        elif p in pigs:
+            parts.append(f"{p}花猪")
+        elif p in hands:
+            parts.append(f"{p}未听牌")
+
+    return {
+        'winners': list(ready),
+        'description': "查叫: " + "；".join(parts),
+        'scores': scores,
+        'ready': ready,
+        'pigs': pigs,
+    }
@@ -1,12 +1,30 @@
 import tkinter as tk
-from tkinter import messagebox
-import json
+from tkinter import filedialog, messagebox
+import itertools
 import os
+import sys
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
+
+from mahjong_archive import archive_session
+from mahjong_export import EXPORT_FORMATS, ExportWorker
+from mahjong_engine import (SCORE_TYPES, SKIPPED_RULES, ScoreLedger, score_fan, settle_hand,
+                            type_bits)
+from mahjong_history import PlayerStats, RoundIndex, ScoreTimeline
+from mahjong_ledger import (CHAJIAO, HUAZHU, KONG_TYPES, TRANSFER, RoundLedger, huazhu_scores,
+                            kong_scores, make_event, transfer_scores)
+from mahjong_rating import (RATINGS_FILE, Ratings, load_ratings, replay, restore_session,
+                            save_ratings, session_state)
+from mahjong_tiles import TILE_TYPES, detect_fans, parse_tiles, settle_chajiao
+from mahjong_storage import (HISTORY_PAGE, BackgroundWriter, JsonJournalStore, PageCache,
+                             SqliteStore, needs_older_page)
+
+# 统计卡片的列
+STATS_COLUMNS = ("玩家", "等级分", "胡牌", "点炮", "自摸率", "平均番", "最大番", "最长连胡", "局均分")
+
 
 class SichuanMahjongGUI:
-    def __init__(self):
+    def __init__(self, storage: str = "json"):
         self.root = tk.Tk()
         self.root.title("四川麻将积分系统")
         self.root.geometry("1000x700")
@@ -33,10 +51,39 @@ class SichuanMahjongGUI:
 
         # 基础数据
         self.players: List[str] = ["东家", "南家", "西家", "北家"]
-        self.scores: Dict[str, int] = {p: 0 for p in self.players}
+        self.scores = ScoreLedger(self.players)
         self.game_history: List[Dict] = []
         self.current_round: int = 0
+        # game_history 只保存最近的记录，更早的按需分页加载
+        self.history_start = 0
+        self.history_skipped: int = 0
+        self.round_index = RoundIndex()
+        self.timeline = ScoreTimeline()
+        self.round_ledger = RoundLedger(self.players)  # 最后一局的事件
+        self.stats = PlayerStats()
+        self.stats_rows: List[Dict] = []
+        self.ratings = Ratings()
+        self.ratings_file: str = RATINGS_FILE
+        self.ratings_base: Dict = self.ratings.to_dict()  # 之前各场的等级分（本场的起点）
+        self.saved_ratings: Optional[Dict] = None  # 存档中保存的本场评分
+        self.viewing_round = None  # 回看的局数，None 表示实时积分
+        self.player_cards: List[Dict] = []
+        self.history_shown: Dict[int, str] = {}  # 历史面板中已显示的记录：位置 -> 文本
+        self.history_viewer = None
+        self.score_dialogs: Dict[str, 'ScoreInputDialog'] = {}  # 模式 -> 复用的记分对话框
+        self.export_worker: Optional[ExportWorker] = None
         self.data_file: str = "mahjong_scores.json"
+        self.db_file: str = "mahjong_scores.db"
+        self.storage = storage  # 存储后端（json｜sqlite）
+        if storage == "sqlite":
+            self.store = SqliteStore(self.db_file)
+        else:
+            self.store = JsonJournalStore(self.data_file)
+        # 所有写盘操作都交给后台线程，界面只负责入队
+        self.writer = BackgroundWriter(self.store,
+                                       lambda fn: self.root.after(0, fn),
+                                       self.on_save_error,
+                                       self.save_data)
 
         # 计分模式（传统｜血流成河）
         self.mode = tk.StringVar(value="传统")
@@ -44,7 +91,12 @@ class SichuanMahjongGUI:
         # 构建 UI
         self.create_widgets()
         self.load_data()
+        self.load_ratings()
         self.update_display()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        if SKIPPED_RULES:
+            messagebox.showwarning("规则文件", "以下俱乐部规则文件无法加载，已跳过：\n" +
+                                   "\n".join(f"{path}: {error}" for path, error in SKIPPED_RULES))
 
     def setup_window_style(self):
         """设置窗口样式"""
@@ -127,9 +179,89 @@ class SichuanMahjongGUI:
         separator = tk.Frame(score_container, height=1, bg=self.colors['border'])
         separator.pack(fill='x', padx=20, pady=(0, 15))
         
+        # 回看滑块：拖动查看任意一局结束时的积分
+        timeline_frame = tk.Frame(score_container, bg=self.colors['surface'])
+        timeline_frame.pack(fill='x', padx=20, pady=(0, 10))
+        
+        tk.Label(timeline_frame, text="⏪ 回看",
+                font=('Arial', 10),
+                bg=self.colors['surface'],
+                fg=self.colors['text_secondary']).pack(side='left')
+        
+        self.timeline_scale = tk.Scale(timeline_frame, from_=0, to=0,
+                                      orient='horizontal',
+                                      font=('Arial', 9),
+                                      bg=self.colors['surface'],
+                                      fg=self.colors['text_primary'],
+                                      troughcolor=self.colors['hover'],
+                                      highlightthickness=0,
+                                      command=self.on_timeline_scrub)
+        self.timeline_scale.pack(side='left', fill='x', expand=True, padx=(10, 0))
+        
         # 积分显示区域
         self.score_frame = tk.Frame(score_container, bg=self.colors['surface'])
         self.score_frame.pack(fill='both', expand=True, padx=20, pady=(0, 20))
+        
+        # 统计卡片
+        self.create_stats_card(left_frame)
+
+    def create_stats_card(self, parent):
+        """创建玩家统计卡片（表头固定，每个座位一行）"""
+        stats_card = tk.Frame(parent, bg=self.colors['surface'], relief='solid', bd=1)
+        stats_card.pack(fill='x', pady=(10, 0))
+        
+        title_frame = tk.Frame(stats_card, bg=self.colors['surface'])
+        title_frame.pack(fill='x', padx=20, pady=(10, 5))
+        
+        tk.Label(title_frame, text="📈 数据统计",
+                font=('Arial', 14, 'bold'),
+                bg=self.colors['surface'],
+                fg=self.colors['text_primary']).pack(side='left')
+        
+        self.stats_scope_label = tk.Label(title_frame, text="",
+                                         font=('Arial', 9),
+                                         bg=self.colors['surface'],
+                                         fg=self.colors['text_secondary'])
+        self.stats_scope_label.pack(side='right')
+        
+        self.stats_table = tk.Frame(stats_card, bg=self.colors['surface'])
+        self.stats_table.pack(fill='x', padx=20, pady=(0, 10))
+        for col, heading in enumerate(STATS_COLUMNS):
+            tk.Label(self.stats_table, text=heading,
+                    font=('Arial', 9, 'bold'),
+                    bg=self.colors['surface'],
+                    fg=self.colors['text_secondary']).grid(row=0, column=col, sticky='ew', padx=4)
+            self.stats_table.grid_columnconfigure(col, weight=1)
+
+    def update_stats_card(self):
+        """按座位更新统计表，只改动内容有变化的行"""
+        while len(self.stats_rows) < len(self.players):
+            row = len(self.stats_rows) + 1
+            cells = [tk.Label(self.stats_table, text="",
+                             font=('Arial', 10),
+                             bg=self.colors['surface'],
+                             fg=self.colors['text_primary'])
+                     for _ in STATS_COLUMNS]
+            for col, cell in enumerate(cells):
+                cell.grid(row=row, column=col, sticky='ew', padx=4)
+            self.stats_rows.append({'cells': cells, 'shown': None})
+        
+        for seat, (player, row) in enumerate(zip(self.players, self.stats_rows)):
+            info = self.stats.row(seat)
+            values = (player, f"{self.ratings.get(player):.0f}",
+                      str(info['wins']), str(info['pao']),
+                      f"{info['zimo_rate']:.0%}", f"{info['avg_fan']:.1f}",
+                      str(info['max_fan']), str(info['best_streak']),
+                      f"{info['avg_score']:+.1f}")
+            if row['shown'] != values:
+                row['shown'] = values
+                for cell, text in zip(row['cells'], values):
+                    cell.config(text=text)
+        
+        total = self.history_skipped + len(self.game_history)
+        scope = f"最近{self.stats.hands}手" if self.stats.hands < total else ""
+        if self.stats_scope_label.cget('text') != scope:
+            self.stats_scope_label.config(text=scope)
 
     def create_control_panel(self, parent):
         """创建控制面板"""
@@ -143,6 +275,9 @@ class SichuanMahjongGUI:
         # 操作按钮卡片
         self.create_action_card(right_frame)
         
+        # 杠牌卡片
+        self.create_kong_card(right_frame)
+        
         # 历史记录卡片
         self.create_history_card(right_frame)
 
@@ -228,6 +363,80 @@ class SichuanMahjongGUI:
             
             # 添加简单的悬停效果
             self.add_simple_hover_effect(btn, color)
+        
+        self.export_label = tk.Label(button_container, text="",
+                                     font=('Arial', 9),
+                                     bg=self.colors['surface'],
+                                     fg=self.colors['text_secondary'])
+        self.export_label.pack(fill='x')
+
+    def create_kong_card(self, parent):
+        """创建刮风下雨、呼叫转移的快速记录卡片（不弹出对话框）"""
+        kong_card = tk.Frame(parent, bg=self.colors['surface'], relief='solid', bd=1)
+        kong_card.pack(fill='x', pady=(0, 10))
+        
+        title_frame = tk.Frame(kong_card, bg=self.colors['surface'])
+        title_frame.pack(fill='x', padx=15, pady=(15, 5))
+        
+        tk.Label(title_frame, text="🌧️ 刮风下雨",
+                font=('Arial', 14, 'bold'),
+                bg=self.colors['surface'],
+                fg=self.colors['text_primary']).pack(side='left')
+        
+        self.kong_player = tk.StringVar(value=self.players[0])
+        self.kong_type = tk.StringVar(value=next(iter(KONG_TYPES)))
+        self.kong_target = tk.StringVar(value="")
+        
+        row = tk.Frame(kong_card, bg=self.colors['surface'])
+        row.pack(fill='x', padx=15, pady=2)
+        self.kong_player_menu = tk.OptionMenu(row, self.kong_player, *self.players)
+        self.kong_player_menu.config(font=('Arial', 10), width=6)
+        self.kong_player_menu.pack(side='left')
+        type_menu = tk.OptionMenu(row, self.kong_type, *KONG_TYPES)
+        type_menu.config(font=('Arial', 10), width=4)
+        type_menu.pack(side='left', padx=5)
+        
+        row = tk.Frame(kong_card, bg=self.colors['surface'])
+        row.pack(fill='x', padx=15, pady=2)
+        tk.Label(row, text="点杠/胡牌:",
+                font=('Arial', 10),
+                bg=self.colors['surface'],
+                fg=self.colors['text_secondary']).pack(side='left')
+        self.kong_target_menu = tk.OptionMenu(row, self.kong_target, "", *self.players)
+        self.kong_target_menu.config(font=('Arial', 10), width=6)
+        self.kong_target_menu.pack(side='left', padx=5)
+        
+        row = tk.Frame(kong_card, bg=self.colors['surface'])
+        row.pack(fill='x', padx=15, pady=(4, 5))
+        for text, color, command in (("🀄 记录杠", self.colors['primary'], self.record_kong),
+                                     ("🔀 呼叫转移", self.colors['accent'], self.call_transfer)):
+            btn = tk.Button(row, text=text,
+                          font=('Arial', 10, 'bold'),
+                          bg=color, fg='white',
+                          relief='raised', bd=2,
+                          command=command,
+                          cursor='hand2')
+            btn.pack(side='left', fill='x', expand=True, padx=2)
+            self.add_simple_hover_effect(btn, color)
+        
+        # 本局汇总（按需更新）
+        self.round_summary_label = tk.Label(kong_card, text="",
+                                           font=('Arial', 9),
+                                           bg=self.colors['surface'],
+                                           fg=self.colors['text_secondary'],
+                                           wraplength=280, justify='left')
+        self.round_summary_label.pack(fill='x', padx=15, pady=(0, 10))
+
+    def refresh_kong_menus(self):
+        """玩家变化后更新杠牌卡片中的玩家选项"""
+        for menu, var, options in ((self.kong_player_menu, self.kong_player, self.players),
+                                   (self.kong_target_menu, self.kong_target, [""] + self.players)):
+            items = menu['menu']
+            items.delete(0, 'end')
+            for name in options:
+                items.add_command(label=name, command=tk._setit(var, name))
+            if var.get() not in options:
+                var.set(options[0])
 
     def add_simple_hover_effect(self, button, original_color):
         """添加简单的按钮悬停效果"""
@@ -254,6 +463,13 @@ class SichuanMahjongGUI:
                 bg=self.colors['surface'], 
                 fg=self.colors['text_primary']).pack(side='left')
         
+        tk.Button(title_frame, text="查看全部",
+                 font=('Arial', 9),
+                 bg=self.colors['hover'], fg=self.colors['text_primary'],
+                 relief='raised', bd=1,
+                 cursor='hand2',
+                 command=self.show_full_history).pack(side='right')
+        
         # 历史记录容器
         history_container = tk.Frame(history_card, bg=self.colors['surface'])
         history_container.pack(fill='both', expand=True, padx=15, pady=(0, 15))
@@ -280,23 +496,75 @@ class SichuanMahjongGUI:
 
     # ---------- 数据与显示 ----------
     def update_display(self):
-        # 清空
-        for w in self.score_frame.winfo_children():
-            w.destroy()
+        # 回看时显示该局结束时的积分
+        standings = None
+        if self.viewing_round is not None and self.viewing_round < self.current_round:
+            standings = self.timeline.standings_at_round(self.round_index, self.viewing_round)
+        if standings is None:
+            self.viewing_round = None
+            shown_scores = self.scores
+            pos = None
+            self.round_label.config(text=f"第 {self.current_round} 局")
+        else:
+            shown_scores = dict(zip(self.players, standings))
+            pos = self.round_index.hand_range(self.viewing_round)[1] if self.viewing_round else 0
+            self.round_label.config(text=f"第 {self.viewing_round} 局 · 回看")
+
+        # 完整历史已加载时显示最高/最低积分
+        peak = trough = None
+        if not self.history_skipped:
+            peak, trough = self.timeline.peak_trough(pos)
 
         # 排序显示
-        sorted_players = sorted(self.scores.items(),
+        sorted_players = sorted(shown_scores.items(),
                                 key=lambda x: x[1],
                                 reverse=True)
         
-        for idx, (player, score) in enumerate(sorted_players, 1):
-            self.create_player_card(self.score_frame, idx, player, score)
+        # 卡片按名次固定创建一次，之后只更新文字和颜色
+        while len(self.player_cards) < len(sorted_players):
+            self.player_cards.append(
+                self.create_player_card(self.score_frame, len(self.player_cards) + 1))
+        
+        for card, (player, score) in zip(self.player_cards, sorted_players):
+            detail = "当前积分" if standings is None else "回看积分"
+            if peak is not None and player in self.players:
+                seat = self.players.index(player)
+                detail += f" · 最高 {peak[seat]:+d} / 最低 {trough[seat]:+d}"
+            self.update_player_card(card, player, score, detail)
 
-        self.round_label.config(text=f"第 {self.current_round} 局")
+        self.refresh_timeline()
+        self.update_stats_card()
         self.update_history_display()
+        summary = self.round_ledger.summary()['text']
+        if self.round_summary_label.cget('text') != summary:
+            self.round_summary_label.config(text=summary)
+        if self.history_viewer:
+            self.history_viewer.refresh()
+
+    def refresh_timeline(self):
+        """同步回看滑块的范围和位置"""
+        first_round = self.game_history[0]['round'] if self.history_skipped else 0
+        self.timeline_scale.config(from_=first_round, to=self.current_round)
+        value = self.current_round if self.viewing_round is None else self.viewing_round
+        if self.timeline_scale.get() != value:
+            self.timeline_scale.set(value)
+
+    def on_timeline_scrub(self, value):
+        round_num = int(float(value))
+        viewing = None if round_num >= self.current_round else round_num
+
+        # 滑到已加载范围的最前面时，按需加载更早的一页
+        if (viewing is not None and self.history_skipped and
+                round_num <= self.game_history[0]['round']):
+            self.load_older_history()
+        elif viewing == self.viewing_round:
+            return
 
-    def create_player_card(self, parent, rank, player, score):
-        """创建玩家积分卡片"""
+        self.viewing_round = viewing
+        self.update_display()
+
+    def create_player_card(self, parent, rank):
+        """创建玩家积分卡片（第 rank 名的位置），返回需要更新的控件"""
         # 主卡片
         card = tk.Frame(parent, bg=self.colors['surface'], relief='solid', bd=1)
         card.pack(fill='x', pady=5)
@@ -320,58 +588,148 @@ class SichuanMahjongGUI:
         info_frame.pack(side='left', fill='x', expand=True)
         
         # 玩家名称
-        name_label = tk.Label(info_frame, text=player,
+        name_label = tk.Label(info_frame, text="",
                              font=('Arial', 14, 'bold'),
                              bg=self.colors['surface'], 
                              fg=self.colors['text_primary'])
         name_label.pack(anchor='w')
         
         # 积分变化趋势
-        trend = "📈" if score > 0 else "📉" if score < 0 else "➖"
-        trend_label = tk.Label(info_frame, text=f"{trend} 当前积分",
+        trend_label = tk.Label(info_frame, text="",
                               font=('Arial', 9),
                               bg=self.colors['surface'], 
                               fg=self.colors['text_secondary'])
         trend_label.pack(anchor='w')
         
         # 积分显示
-        score_color = self.colors['success'] if score >= 0 else self.colors['danger']
-        score_label = tk.Label(content_frame, text=f"{score:+d}",
+        score_label = tk.Label(content_frame, text="",
                               font=('Arial', 16, 'bold'),
-                              bg=self.colors['surface'], 
-                              fg=score_color)
+                              bg=self.colors['surface'])
         score_label.pack(side='right', padx=(10, 0))
+        
+        return {'name': name_label, 'trend': trend_label, 'score': score_label, 'shown': None}
+
+    def update_player_card(self, card, player, score, detail="当前积分"):
+        """原地更新卡片内容，内容未变化时不触碰控件"""
+        if card['shown'] == (player, score, detail):
+            return
+        card['shown'] = (player, score, detail)
+        
+        trend = "📈" if score > 0 else "📉" if score < 0 else "➖"
+        score_color = self.colors['success'] if score >= 0 else self.colors['danger']
+        card['name'].config(text=player)
+        card['trend'].config(text=f"{trend} {detail}")
+        card['score'].config(text=f"{score:+d}", fg=score_color)
 
     def update_history_display(self):
-        """更新历史记录显示"""
-        self.history_text.config(state='normal')
-        self.history_text.delete(1.0, tk.END)
+        """更新历史记录显示，只增删发生变化的记录"""
+        text = self.history_text
+        total = self.history_skipped + len(self.game_history)
+        first = max(self.history_skipped, total - 8)  # 只显示最近8条
+        wanted = {pos: self.format_history_entry(self.game_history[pos - self.history_skipped],
+                                                 pos == first)
+                  for pos in range(first, total)}
+        
+        text.config(state='normal')
+        
+        # 删除已不在窗口内或内容有变化的记录
+        for pos in [p for p, shown in self.history_shown.items() if wanted.get(p) != shown]:
+            text.delete(f"rec{pos}.first", f"rec{pos}.last")
+            del self.history_shown[pos]
+        
+        if not total:
+            if not text.tag_ranges('empty'):
+                text.insert(tk.END, "暂无游戏记录\n开始您的第一局游戏吧！ 🎮", ('empty',))
+        elif text.tag_ranges('empty'):
+            text.delete('empty.first', 'empty.last')
+        
+        # 按位置插入缺少的记录
+        for pos, entry in wanted.items():
+            if pos in self.history_shown:
+                continue
+            later = [p for p in self.history_shown if p > pos]
+            index = f"rec{min(later)}.first" if later else tk.END
+            text.insert(index, entry, (f"rec{pos}",))
+            self.history_shown[pos] = entry
+        
+        text.config(state='disabled')
+
+    def format_history_entry(self, rec, first):
+        """格式化一条历史记录，非首条前面带分隔线"""
+        hand_info = ""
+        if rec.get('hand_num', 1) > 1 or not rec.get('round_ended', True):
+            hand_info = f"第{rec.get('hand_num', 1)}手 "
         
-        if not self.game_history:
-            self.history_text.insert(tk.END, "暂无游戏记录\n开始您的第一局游戏吧！ 🎮")
+        status = ""
+        if not rec.get('round_ended', True):
+            status = " 🔄"
         else:
-            for i, rec in enumerate(self.game_history[-8:], 1):  # 只显示最近8条
-                hand_info = ""
-                if rec.get('hand_num', 1) > 1 or not rec.get('round_ended', True):
-                    hand_info = f"第{rec.get('hand_num', 1)}手 "
-                
-                status = ""
-                if not rec.get('round_ended', True):
-                    status = " 🔄"
-                else:
-                    status = " ✅"
-                
-                # 格式化历史记录
-                record_text = f"🎯 第{rec['round']}局{hand_info}\n"
-                record_text += f"   {rec['description']} | 胜者: {rec['winner']}{status}\n"
-                record_text += f"   {rec['timestamp']}\n"
-                
-                if i < len(self.game_history[-8:]):
-                    record_text += "   " + "-" * 25 + "\n"
-                
-                self.history_text.insert(tk.END, record_text)
-        
-        self.history_text.config(state='disabled')
+            status = " ✅"
+        
+        # 格式化历史记录
+        record_text = "" if first else "   " + "-" * 25 + "\n"
+        record_text += f"🎯 第{rec['round']}局{hand_info}\n"
+        record_text += f"   {rec['description']} | 胜者: {rec['winner']}{status}\n"
+        record_text += f"   {rec['timestamp']}\n"
+        return record_text
+
+    # ---------- 历史记录 ----------
+    def show_full_history(self):
+        """打开完整历史窗口（已打开时置于最前）"""
+        if self.history_viewer:
+            self.history_viewer.dialog.lift()
+        else:
+            self.history_viewer = HistoryViewer(self)
+
+    def _append_record(self, rec: Dict):
+        """追加一条历史记录并更新索引"""
+        self.game_history.append(rec)
+        self.round_index.append(rec)
+        self.timeline.append(rec)
+        ledger = self.round_ledger
+        if (ledger.events and rec['round'] != ledger.round_num and
+                self.ratings.last_round() != ledger.round_num):
+            # 上一局未结束就开始了新的一局，按已有记录评分
+            self.ratings.apply(ledger.round_num, ledger.round_scores())
+        ledger.append(rec)
+        self.stats.append(rec)
+        self.sync_rating()
+
+    def _pop_record(self) -> Dict:
+        """撤销最后一条历史记录并更新索引"""
+        rec = self.game_history.pop()
+        self.round_index.pop(rec, self.game_history[-1] if self.game_history else None)
+        self.timeline.pop()
+        self.stats.pop()
+        if not self.stats.hands:
+            # 已撤销到统计范围之前，改为统计已加载的全部记录
+            self.stats.rebuild(self.game_history)
+        self.round_ledger.pop()
+        if not self.round_ledger.events:
+            self.rebuild_round_ledger()
+        self.sync_rating()
+        return rec
+
+    def rebuild_round_ledger(self):
+        """用最后一局已加载的记录重建局内账本"""
+        self.round_ledger = RoundLedger(self.players)
+        if self.game_history:
+            first, end = self.round_index.hand_range(self.game_history[-1]['round'])
+            first = max(first - self.history_skipped, 0)
+            self.round_ledger.rebuild(self.game_history[first:end - self.history_skipped])
+
+    def sync_rating(self):
+        """让等级分与最后一局一致：先撤销该局及之后的评分，该局已结束时按本局得分重新评分"""
+        ledger = self.round_ledger
+        while self.ratings.undo_stack and (ledger.round_num is None or
+                                           self.ratings.last_round() >= ledger.round_num):
+            self.ratings.undo()
+        if not self.ratings.undo_stack and self.ratings.dropped:
+            # 撤销到了启动时未恢复的评分之前，从头回放
+            self.replay_ratings()
+            return
+        if ledger.events and ledger.round_num != self.round_index.open_round:
+            self.ratings.apply(ledger.round_num, ledger.round_scores())
 
     # ---------- 按钮功能 ----------
     def set_players(self):
@@ -382,44 +740,62 @@ class SichuanMahjongGUI:
             self.players = dialog.result
 
             # 更新分数映射
-            new_scores = {}
-            for i, new_p in enumerate(self.players):
-                new_scores[new_p] = old_scores.get(old_players[i], 0)
-            self.scores = new_scores
-            self.save_data()
+            self.scores = ScoreLedger(self.players,
+                                      [old_scores.get(p, 0) for p in old_players])
+            self.rebuild_round_ledger()
+            self.refresh_kong_menus()
+            self.log_event({'type': 'players', 'players': self.players})
             self.update_display()
             messagebox.showinfo("成功", "玩家姓名已更新！")
 
+    def get_score_dialog(self) -> 'ScoreInputDialog':
+        """取当前模式的记分对话框，玩家变化后才重新创建"""
+        mode = self.mode.get()
+        dialog = self.score_dialogs.get(mode)
+        if dialog is None or not dialog.matches(self.players, mode):
+            if dialog is not None and dialog.dialog.winfo_exists():
+                dialog.dialog.destroy()
+            dialog = self.score_dialogs[mode] = ScoreInputDialog(self.root, self.players, mode)
+        return dialog
+
     def add_score(self):
-        dialog = ScoreInputDialog(self.root, self.players, self.mode.get())
-        if dialog.result:
-            winners, desc, round_scores = dialog.result
+        result = self.get_score_dialog().show()
+        if result:
+            winners = result['winners']
+            desc = result['description']
+            round_scores = result['scores']
 
             # 更新积分
-            for player, sc in round_scores.items():
-                self.scores[player] += sc
+            try:
+                self.scores.apply(round_scores)
+            except ValueError as e:
+                messagebox.showerror("错误", str(e))
+                return
 
             # 记录历史
             if self.mode.get() == "血流成河":
                 # 血流成河模式：同一局可以有多次胡牌
-                if not self.game_history or self.game_history[-1].get('round_ended', False):
+                open_round = self.round_index.open_round
+                if open_round is None:
                     # 开始新的一局
                     self.current_round += 1
                     round_num = self.current_round
                     hand_num = 1
                 else:
                     # 同一局的后续胡牌
-                    round_num = self.current_round
-                    last_hand = self.game_history[-1].get('hand_num', 1)
-                    hand_num = last_hand + 1
+                    round_num = open_round
+                    hand_num = self.round_index.hand_count(open_round) + 1
                 
-                self.game_history.append({
+                self._append_record({
                     'round': round_num,
                     'hand_num': hand_num,
                     'scores': round_scores.copy(),
                     'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                     'description': desc,
                     'winner': ','.join(winners),
+                    'mode': self.mode.get(),
+                    'types': result['types'],
+                    'pao': result['pao'],
                     'round_ended': False  # 血流成河局未结束
                 })
                 
@@ -428,24 +804,28 @@ class SichuanMahjongGUI:
                     msg = f"第{round_num}局第{hand_num}手分数已记录！本局继续..."
                 else:
                     # 标记本局结束
-                    if self.game_history:
-                        self.game_history[-1]['round_ended'] = True
+                    self.game_history[-1]['round_ended'] = True
+                    self.round_index.end_round(round_num)
+                    self.sync_rating()
                     msg = f"第{round_num}局已结束！共{hand_num}手"
             else:
                 # 传统模式：一次胡牌结束一局
                 self.current_round += 1
-                self.game_history.append({
+                self._append_record({
                     'round': self.current_round,
                     'hand_num': 1,
                     'scores': round_scores.copy(),
                     'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                     'description': desc,
                     'winner': ','.join(winners),
+                    'mode': self.mode.get(),
+                    'types': result['types'],
+                    'pao': result['pao'],
                     'round_ended': True
                 })
                 msg = f"第{self.current_round}局分数已记录！"
 
-            self.save_data()
+            self.log_event({'type': 'hand', 'record': dict(self.game_history[-1])})
             self.update_display()
             messagebox.showinfo("成功", msg)
 
@@ -464,19 +844,21 @@ class SichuanMahjongGUI:
             msg += f"{p}: {sc:+d}\n"
         
         if messagebox.askyesno("确认撤销", msg):
-            for p, sc in last['scores'].items():
-                self.scores[p] -= sc
-            
+            try:
+                self.scores.apply(last['scores'], -1)
+            except ValueError as e:
+                messagebox.showerror("错误", str(e))
+                return
+
             # 检查是否需要调整局数
-            removed_record = self.game_history.pop()
+            removed_record = self._pop_record()
             
-            # 如果撤销的是第一手，且没有其他记录，则减少局数
-            if (removed_record.get('hand_num', 1) == 1 and 
-                (not self.game_history or 
-                 self.game_history[-1]['round'] != removed_record['round'])):
+            # 如果撤销的是该局唯一的一手，则减少局数
+            if self.round_index.hand_count(removed_record['round']) == 0:
                 self.current_round -= 1
+            self.ensure_history_tail()
             
-            self.save_data()
+            self.log_event({'type': 'undo'})
             self.update_display()
             messagebox.showinfo("成功", "已撤销！")
 
@@ -490,89 +872,298 @@ class SichuanMahjongGUI:
             messagebox.showinfo("提示", "当前没有进行中的游戏")
             return
         
-        last_record = self.game_history[-1]
-        if last_record.get('round_ended', True):
+        round_num = self.round_index.open_round
+        if round_num is None:
             messagebox.showinfo("提示", "当前没有进行中的局")
             return
         
-        round_num = last_record['round']
-        hand_count = sum(1 for rec in self.game_history if rec['round'] == round_num)
+        hand_count = self.round_index.hand_count(round_num)
         
         if messagebox.askyesno("确认结束", f"确认结束第{round_num}局？\n本局共进行了{hand_count}手"):
-            # 标记本局结束
-            for rec in reversed(self.game_history):
-                if rec['round'] == round_num:
-                    rec['round_ended'] = True
-                else:
-                    break
+            # 标记本局结束（本局的手牌总在历史末尾）
+            for rec in self.game_history[-hand_count:]:
+                rec['round_ended'] = True
+            self.round_index.end_round(round_num)
+            self.sync_rating()
             
-            self.save_data()
+            self.log_event({'type': 'end_round', 'round': round_num})
             self.update_display()
             messagebox.showinfo("成功", f"第{round_num}局已结束！共{hand_count}手")
 
+            if messagebox.askyesno("查叫", "是否对未胡牌的玩家进行查叫结算？"):
+                self.settle_chajiao(round_num, hand_count + 1)
+
+    def settle_chajiao(self, round_num: int, hand_num: int):
+        """输入未胡牌玩家的手牌，把查叫、查花猪结果作为本局的结算记录"""
+        mode = self.mode.get()
+        dialog = ChaJiaoDialog(self.root, self.players, mode)
+        result = dialog.result
+        if not result:
+            return
+
+        events = []
+        if any(result['scores'].values()):
+            events.append(make_event(round_num, hand_num, mode, CHAJIAO, result['scores'],
+                                     result['description'], ','.join(result['winners'])))
+        if result['pigs']:
+            try:
+                scores, desc = huazhu_scores(self.players, mode, result['pigs'])
+            except ValueError as e:
+                messagebox.showerror("错误", str(e))
+                return
+            events.append(make_event(round_num, hand_num + len(events), mode, HUAZHU,
+                                     scores, desc))
+        if not events:
+            messagebox.showinfo("提示", "无需查叫赔付")
+            return
+
+        for rec in events:
+            if not self.record_event(rec):
+                return
+        messagebox.showinfo("成功", f"第{round_num}局查叫结算已记录！")
+
+    def next_hand_slot(self):
+        """下一条记录所属的 (局号, 手数)：有未结束的局时接在其后，否则开始新的一局"""
+        open_round = self.round_index.open_round
+        if open_round is None:
+            return self.current_round + 1, 1
+        return open_round, self.round_index.hand_count(open_round) + 1
+
+    def record_event(self, rec: Dict) -> bool:
+        """记录一条局内事件（杠、呼叫转移、查叫等），分数超出范围时返回 False"""
+        try:
+            self.scores.apply(rec['scores'])
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return False
+        self.current_round = max(self.current_round, rec['round'])
+        self._append_record(rec)
+        self.log_event({'type': 'hand', 'record': dict(rec)})
+        self.update_display()
+        return True
+
+    def record_kong(self):
+        """记录一次刮风（明杠）或下雨（暗杠），直接计入本局"""
+        mode = self.mode.get()
+        if mode != "血流成河":
+            messagebox.showinfo("提示", "刮风下雨只在血流成河模式中记录")
+            return
+        player = self.kong_player.get()
+        try:
+            kind, scores, desc = kong_scores(self.players, mode, player,
+                                             self.kong_type.get(), self.kong_target.get())
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+        round_num, hand_num = self.next_hand_slot()
+        self.record_event(make_event(round_num, hand_num, mode, kind, scores, desc, player))
+
+    def call_transfer(self):
+        """呼叫转移：把本局最近一次杠的收入转给胡牌玩家"""
+        open_round = self.round_index.open_round
+        kong = None
+        if open_round is not None and self.round_ledger.round_num == open_round:
+            kong = self.round_ledger.last_kong()
+        if kong is None:
+            messagebox.showinfo("提示", "本局没有可以转移的杠")
+            return
+        try:
+            scores, desc = transfer_scores(self.players, kong, self.kong_target.get())
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+        round_num, hand_num = self.next_hand_slot()
+        self.record_event(make_event(round_num, hand_num, self.mode.get(), TRANSFER,
+                                     scores, desc, self.kong_target.get()))
+
     def reset_game(self):
         if messagebox.askyesno("确认", "重置所有数据？"):
-            self.scores = {p: 0 for p in self.players}
+            # 重置前把本场对局存入跨场次存档（需要numpy）
+            try:
+                older = self.store.iter_history(self.history_start) if self.history_skipped else []
+                archive_session(itertools.chain(older, self.game_history), self.players)
+            except ImportError:
+                pass
+            except Exception as e:
+                messagebox.showerror("错误", f"存档失败，未重置: {e}")
+                return
+            # 未结束的局也计入等级分（与存档重算一致），之后本场的评分不再撤销
+            ledger = self.round_ledger
+            if ledger.events and ledger.round_num == self.round_index.open_round:
+                self.ratings.apply(ledger.round_num, ledger.round_scores())
+            self.ratings.commit()
+            self.ratings_base = self.ratings.to_dict()
+            try:
+                save_ratings(self.ratings, self.ratings_file)
+            except OSError as e:
+                messagebox.showerror("错误", f"保存等级分失败: {e}")
+            self.scores = ScoreLedger(self.players)
             self.game_history = []
             self.current_round = 0
+            self.history_start = 0
+            self.history_skipped = 0
+            self.round_index.rebuild(self.game_history)
+            self.timeline.rebuild(self.game_history, [0] * len(self.players))
+            self.stats.rebuild(self.game_history, len(self.players))
+            self.rebuild_round_ledger()
             self.save_data()
             self.update_display()
             messagebox.showinfo("成功", "已重置！")
 
     def export_results(self):
-        fname = f"mahjong_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-        try:
-            with open(fname, 'w', encoding='utf-8') as f:
-                f.write("四川麻将积分记录\n" + "=" * 30 + "\n")
-                f.write(f"导出时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"总局数: {self.current_round}\n\n")
-                f.write("最终排名:\n")
-                for i, (p, sc) in enumerate(sorted(self.scores.items(), key=lambda x: x[1], reverse=True), 1):
-                    f.write(f"{i}. {p}: {sc}\n")
-                f.write("\n详细记录:\n")
-                for rec in self.game_history:
-                    hand_info = ""
-                    if rec.get('hand_num', 1) > 1:
-                        hand_info = f"第{rec.get('hand_num', 1)}手 "
-                    
-                    status = ""
-                    if not rec.get('round_ended', True):
-                        status = " [进行中]"
-                    
-                    f.write(f"\n第{rec['round']}局{hand_info}- {rec['timestamp']}{status}\n")
-                    f.write(f"类型: {rec['description']}, 胡牌: {rec['winner']}\n")
-                    for p, sc in rec['scores'].items():
-                        f.write(f"  {p}: {sc:+d}\n")
-            messagebox.showinfo("成功", f"已导出到 {fname}")
-        except Exception as e:
-            messagebox.showerror("错误", str(e))
+        """在后台线程中导出，界面只显示进度"""
+        if self.export_worker is not None and self.export_worker.is_alive():
+            messagebox.showinfo("提示", "正在导出，请稍候")
+            return
+        now = datetime.now()
+        path = filedialog.asksaveasfilename(
+            parent=self.root, title="导出结果",
+            initialfile=f"mahjong_results_{now.strftime('%Y%m%d_%H%M%S')}.txt",
+            defaultextension=".txt",
+            filetypes=[("文本", "*.txt"), ("CSV", "*.csv"), ("JSON Lines", "*.jsonl"),
+                       ("HTML报告", "*.html")])
+        if not path:
+            return
+        if os.path.splitext(path)[1].lower() not in EXPORT_FORMATS:
+            messagebox.showerror("错误", f"不支持的导出格式，请使用 {'、'.join(EXPORT_FORMATS)}")
+            return
+
+        meta = {
+            'players': list(self.players),
+            'standings': sorted(self.scores.items(), key=lambda x: x[1], reverse=True),
+            'rounds': self.current_round,
+            'exported_at': now.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        # 已加载的记录先复制一份，导出期间继续记分不影响导出内容
+        older = self.store.iter_history(self.history_start) if self.history_skipped else []
+        records = itertools.chain(older, list(self.game_history))
+        total = self.history_skipped + len(self.game_history)
+
+        def on_progress(count: int):
+            self.export_label.config(text=f"📤 导出中 {count}/{total}")
+
+        def on_done(path: str, count: int):
+            self.export_label.config(text="")
+            messagebox.showinfo("成功", f"已导出{count}条记录到 {path}")
+
+        def on_error(error: Exception):
+            self.export_label.config(text="")
+            messagebox.showerror("错误", f"导出失败: {error}")
+
+        on_progress(0)
+        self.export_worker = ExportWorker(records, path, meta, lambda fn: self.root.after(0, fn),
+                                          on_progress, on_done, on_error)
 
     # ---------- 持久化 ----------
     def load_data(self):
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                self.players = data.get('players', self.players)
-                self.scores = data.get('scores', self.scores)
-                self.game_history = data.get('game_history', [])
-                self.current_round = data.get('current_round', 0)
-            except Exception as e:
-                messagebox.showerror("错误", f"加载数据失败: {e}")
-
-    def save_data(self):
+        migrated = False
         try:
-            data = {
-                'players': self.players,
-                'scores': self.scores,
-                'game_history': self.game_history,
-                'current_round': self.current_round,
-                'last_updated': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            state = self.store.load()
+            if state is None and self.storage == "sqlite" and os.path.exists(self.data_file):
+                # 首次启用SQLite时从JSON存档迁移
+                state = JsonJournalStore(self.data_file).load(tail=None)
+                migrated = True
         except Exception as e:
-            messagebox.showerror("错误", f"保存数据失败: {e}")
+            messagebox.showerror("错误", f"加载数据失败: {e}")
+            return
+        if state:
+            self.players = state['players'] or self.players
+            if state['scores']:
+                self.scores = ScoreLedger(self.players,
+                                          [state['scores'].get(p, 0) for p in self.players])
+            else:
+                self.scores = ScoreLedger(self.players)
+            self.game_history = state['game_history']
+            self.current_round = state['current_round']
+            self.history_start = state['history_start']
+            self.history_skipped = state['history_skipped']
+            self.saved_ratings = state.get('ratings')
+            self.round_index.rebuild(self.game_history, self.history_skipped)
+            self.timeline.rebuild(self.game_history,
+                                  [self.scores.get(p, 0) for p in self.players],
+                                  self.history_skipped)
+            self.stats.rebuild(self.game_history, len(self.players))
+            self.rebuild_round_ledger()
+            self.refresh_kong_menus()
+            if migrated:
+                self.save_data()
+
+    def load_ratings(self):
+        """读取之前各场的等级分，再恢复存档中保存的本场评分，只回放已加载的尾部"""
+        try:
+            base = load_ratings(self.ratings_file)
+        except (OSError, ValueError, TypeError) as e:
+            messagebox.showerror("错误", f"加载等级分失败: {e}")
+            base = Ratings()
+        self.ratings_base = base.to_dict()
+        try:
+            self.ratings = restore_session(base, self.saved_ratings, self.game_history,
+                                           self.history_skipped, self.round_index.open_round)
+        except (AttributeError, KeyError, ValueError, TypeError):
+            self.ratings = None
+        if self.ratings is None:
+            self.replay_ratings()
+            if self.history_skipped:
+                # 保存本场评分，下次启动不必再读取全部历史
+                self.save_data()
+
+    def replay_ratings(self):
+        """从之前各场的等级分开始，依次计入本场已结束的各局（读取全部历史）"""
+        self.ratings = Ratings.from_dict(self.ratings_base)
+        older = self.store.iter_history(self.history_start) if self.history_skipped else []
+        replay(self.ratings, itertools.chain(older, self.game_history),
+               self.round_index.open_round)
+
+    def save_data(self):
+        """请求写入完整快照（同时压缩日志）"""
+        self.writer.snapshot({
+            'players': list(self.players),
+            'scores': dict(self.scores),
+            'game_history': list(self.game_history),
+            'current_round': self.current_round,
+            'history_start': self.history_start,
+            'history_skipped': self.history_skipped,
+            'ratings': session_state(self.ratings, self.ratings_base)
+        })
+
+    def load_older_history(self, count: int = HISTORY_PAGE) -> int:
+        """按需加载更早的一页历史记录，返回加载的条数"""
+        if not self.history_skipped:
+            return 0
+        records, self.history_start = self.store.load_page(self.history_start, count)
+        self.game_history[:0] = records
+        self.history_skipped -= len(records)
+        self.round_index.prepend(records)
+        self.timeline.prepend(records)
+        return len(records)
+
+    def ensure_history_tail(self):
+        """保证最后一局完整加载，撤销和结束本局只依赖已加载的尾部"""
+        loaded = False
+        while needs_older_page(self.game_history, self.history_skipped):
+            if not self.load_older_history():
+                break
+            loaded = True
+        if loaded:
+            if not self.stats.hands:
+                self.stats.rebuild(self.game_history)
+            self.rebuild_round_ledger()
+            self.sync_rating()
+
+    def log_event(self, event: Dict):
+        """向日志追加一条事件，由后台线程写入"""
+        self.writer.append(event)
+        self.writer.rating_state(session_state(self.ratings, self.ratings_base))
+
+    def on_save_error(self, error: Exception):
+        messagebox.showerror("错误", f"保存数据失败: {error}")
+
+    def on_close(self):
+        """关闭前取消未完成的导出，并等待后台线程写完剩余数据"""
+        if self.export_worker is not None:
+            self.export_worker.cancel()
+        self.writer.close()
+        self.root.destroy()
 
     def run(self):
         self.root.mainloop()
@@ -689,26 +1280,205 @@ class PlayerSetupDialog:
         self.dialog.destroy()
 
 
-class ScoreInputDialog:
+class ChaJiaoDialog:
+    """查叫对话框：输入仍未胡牌玩家的13张手牌，已胡牌的玩家留空"""
+
     def __init__(self, parent, players: List[str], mode: str):
         self.players = players
+        self.mode = mode
+        self.result = None
+
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("查叫结算")
+        self.dialog.geometry("520x520")
+        self.dialog.configure(bg='#F8F9FA')
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+
+        # 居中显示
+        self.center_window()
+
+        self.create_ui()
+
+        self.entries[0].focus()
+        self.dialog.wait_window()
+
+    def center_window(self):
+        """窗口居中"""
+        self.dialog.update_idletasks()
+        width = self.dialog.winfo_width()
+        height = self.dialog.winfo_height()
+        x = (self.dialog.winfo_screenwidth() // 2) - (width // 2)
+        y = (self.dialog.winfo_screenheight() // 2) - (height // 2)
+        self.dialog.geometry(f'{width}x{height}+{x}+{y}')
+
+    def create_ui(self):
+        """创建UI"""
+        main_container = tk.Frame(self.dialog, bg='#FFFFFF', relief='solid', bd=1)
+        main_container.pack(fill='both', expand=True, padx=20, pady=20)
+
+        tk.Label(main_container, text="🔍 查叫结算",
+                 font=('Arial', 16, 'bold'),
+                 bg='#FFFFFF',
+                 fg='#2C3E50').pack(pady=(15, 5))
+        tk.Label(main_container, text="输入未胡牌玩家的13张手牌（如 123万 456万 789万 11条 23条），已胡牌的玩家留空",
+                 font=('Arial', 9),
+                 bg='#FFFFFF', fg='#7F8C8D',
+                 wraplength=440).pack(padx=20)
+
+        input_frame = tk.Frame(main_container, bg='#FFFFFF')
+        input_frame.pack(fill='x', padx=20, pady=10)
+
+        self.entries = []
+        for p in self.players:
+            row = tk.Frame(input_frame, bg='#FFFFFF')
+            row.pack(fill='x', pady=4)
+            tk.Label(row, text=p, width=8, anchor='w',
+                     font=('Arial', 11, 'bold'),
+                     bg='#FFFFFF', fg='#2C3E50').pack(side='left')
+            ent = tk.Entry(row, font=('Arial', 11),
+                           bg='#F8F9FA', fg='#2C3E50',
+                           relief='solid', bd=1)
+            ent.pack(side='left', fill='x', expand=True, ipady=3)
+            self.entries.append(ent)
+
+        self.preview_text = tk.Text(main_container, height=7,
+                                    font=('Arial', 10),
+                                    bg='#F8F9FA', fg='#2C3E50',
+                                    relief='solid', bd=1,
+                                    state='disabled',
+                                    wrap='word')
+        self.preview_text.pack(fill='both', expand=True, padx=20, pady=5)
+
+        button_frame = tk.Frame(main_container, bg='#FFFFFF')
+        button_frame.pack(fill='x', padx=20, pady=(5, 15))
+
+        tk.Button(button_frame, text="🧮 计算",
+                  font=('Arial', 11, 'bold'),
+                  bg='#4A90E2', fg='white',
+                  relief='raised', bd=2,
+                  width=10,
+                  command=self.calculate).pack(side='left')
+        tk.Button(button_frame, text="❌ 取消",
+                  font=('Arial', 11, 'bold'),
+                  bg='#E74C3C', fg='white',
+                  relief='raised', bd=2,
+                  width=10,
+                  command=self.cancel).pack(side='right')
+        tk.Button(button_frame, text="✅ 确定记录",
+                  font=('Arial', 11, 'bold'),
+                  bg='#27AE60', fg='white',
+                  relief='raised', bd=2,
+                  width=10,
+                  command=self.ok).pack(side='right', padx=10)
+
+    def calculate(self):
+        """计算查叫结果，返回结果字典，手牌有误时返回 None"""
+        try:
+            hands = {}
+            for p, ent in zip(self.players, self.entries):
+                if ent.get().strip():
+                    try:
+                        hands[p] = parse_tiles(ent.get())
+                    except ValueError as e:
+                        raise ValueError(f"{p}: {e}") from e
+            if not hands:
+                raise ValueError("请至少输入一名未胡牌玩家的手牌")
+            result = settle_chajiao(self.players, self.mode, hands)
+        except ValueError as e:
+            self._set_preview(str(e))
+            return None
+
+        preview = result['description'].replace("查叫: ", "").replace("；", "\n")
+        preview += "\n分配:\n"
+        for p, sc in result['scores'].items():
+            preview += f"  {p}: {sc:+d}\n"
+        self._set_preview(preview)
+        return result
+
+    def _set_preview(self, txt: str):
+        self.preview_text.config(state='normal')
+        self.preview_text.delete(1.0, tk.END)
+        self.preview_text.insert(tk.END, txt)
+        self.preview_text.config(state='disabled')
+
+    def ok(self):
+        result = self.calculate()
+        if result:
+            self.result = result
+            self.dialog.destroy()
+
+    def cancel(self):
+        self.dialog.destroy()
+
+
+class ScoreInputDialog:
+    """记分对话框
+
+    创建后隐藏，由 show() 重置选项并显示；关闭时只隐藏不销毁，
+    同一模式、同一组玩家下次打开时直接复用
+    """
+
+    def __init__(self, parent, players: List[str], mode: str):
+        self.players = list(players)
         self.mode = mode  # "传统" or "血流成河"
         self.result = None
         self.calculated_result = None
+        self.preview_pending = None   # 已排队的预览刷新
+        self.last_selection = None    # 上次计算时的 (胡家, 番型掩码, 点炮)
+        self.fan_cache = None         # ((模式, 番型掩码), score_fan 结果)，只改胡家或点炮时复用
+        self.preview_shown = ""
 
         self.dialog = tk.Toplevel(parent)
+        self.dialog.withdraw()
         self.dialog.title("记录分数")
         self.dialog.geometry("600x700")
         self.dialog.configure(bg='#F8F9FA')
         self.dialog.transient(parent)
-        self.dialog.grab_set()
-        
-        # 居中显示
-        self.center_window()
+        self.dialog.protocol("WM_DELETE_WINDOW", self.cancel_clicked)
+        self.closed = tk.BooleanVar(self.dialog, value=False)
 
         self.create_score_input()
-        self.dialog.wait_window()
-    
+
+    def show(self) -> Optional[Dict]:
+        """重置并显示对话框，关闭后返回结算结果（取消时为 None）"""
+        self.reset()
+        self.dialog.deiconify()
+        self.center_window()
+        self.dialog.grab_set()
+        self.closed.set(False)
+        self.dialog.wait_variable(self.closed)
+        return self.result
+
+    def reset(self):
+        """清空上一次的选择和预览"""
+        if self.mode == "传统":
+            self.winner_var.set("")
+        else:
+            for var in self.winner_vars.values():
+                var.set(False)
+        for _, var in self.score_types.values():
+            var.set(False)
+        self.pao_var.set("")
+        self.tiles_var.set("")
+        self.cancel_preview()
+        self.last_selection = None
+        self.fan_cache = None
+        self.canvas.yview_moveto(0)
+        self._set_preview("")
+        self.result = None
+        self.calculated_result = None
+
+    def matches(self, players: List[str], mode: str) -> bool:
+        """是否可以直接复用（窗口仍在且玩家、模式未变）"""
+        return (self.mode == mode and self.players == list(players)
+                and bool(self.dialog.winfo_exists()))
+
+    def hide(self):
+        self.dialog.grab_release()
+        self.dialog.withdraw()
+        self.closed.set(True)
+
     def center_window(self):
         """窗口居中"""
         self.dialog.update_idletasks()
@@ -736,7 +1506,7 @@ class ScoreInputDialog:
                  fg='#2C3E50').pack(expand=True)
 
         # 创建滚动区域
-        canvas = tk.Canvas(main_container, bg='#FFFFFF', highlightthickness=0)
+        canvas = self.canvas = tk.Canvas(main_container, bg='#FFFFFF', highlightthickness=0)
         scrollbar = tk.Scrollbar(main_container, orient="vertical", command=canvas.yview)
         scrollable_frame = tk.Frame(canvas, bg='#FFFFFF')
 
@@ -835,8 +1605,7 @@ class ScoreInputDialog:
                                    font=('Arial', 11),
                                    bg='#FFFFFF',
                                    fg='#2C3E50',
-                                   selectcolor='#4A90E2',
-                                   command=self.auto_calculate)
+                                   selectcolor='#4A90E2')
                 rb.pack(anchor='w', pady=2)
         else:  # 血流
             self.winner_vars = {p: tk.BooleanVar() for p in self.players}
@@ -846,43 +1615,36 @@ class ScoreInputDialog:
                                    font=('Arial', 11),
                                    bg='#FFFFFF',
                                    fg='#2C3E50',
-                                   selectcolor='#4A90E2',
-                                   command=self.auto_calculate)
+                                   selectcolor='#4A90E2')
                 cb.pack(anchor='w', pady=2)
 
     def create_type_section(self, parent):
         """创建胡牌类型选择区域"""
-        if self.mode == "传统":
-            self.score_types = {
-                '平胡': (1, tk.BooleanVar()),
-                '碰碰胡': (2, tk.BooleanVar()),
-                '清一色': (4, tk.BooleanVar()),
-                '七对': (4, tk.BooleanVar()),
-                '杠上开花': (2, tk.BooleanVar()),
-                '抢杠胡': (2, tk.BooleanVar()),
-                '海底捞月': (2, tk.BooleanVar()),
-                '自摸': (1, tk.BooleanVar())
-            }
-        else:  # 血流成河模式
-            self.score_types = {
-                '平胡': (1, tk.BooleanVar()),
-                '碰碰胡': (2, tk.BooleanVar()),
-                '清一色': (4, tk.BooleanVar()),
-                '七对': (4, tk.BooleanVar()),
-                '龙七对': (8, tk.BooleanVar()),
-                '清七对': (8, tk.BooleanVar()),
-                '清龙七对': (16, tk.BooleanVar()),
-                '杠上开花': (2, tk.BooleanVar()),
-                '抢杠胡': (2, tk.BooleanVar()),
-                '海底捞月': (2, tk.BooleanVar()),
-                '天胡': (8, tk.BooleanVar()),
-                '地胡': (8, tk.BooleanVar()),
-                '自摸': (1, tk.BooleanVar())
-            }
+        self.score_types = {name: (fan, tk.BooleanVar())
+                            for name, fan in SCORE_TYPES[self.mode].items()}
+        self.type_bits = type_bits(self.mode)
+        
+        # 手牌识别：输入14张牌自动勾选牌型
+        tiles_frame = tk.Frame(parent, bg='#FFFFFF')
+        tiles_frame.pack(fill='x', pady=(0, 8))
+        tk.Label(tiles_frame, text="手牌:", font=('Arial', 10),
+                 bg='#FFFFFF', fg='#2C3E50').pack(side='left')
+        self.tiles_var = tk.StringVar()
+        tiles_entry = tk.Entry(tiles_frame, textvariable=self.tiles_var,
+                               font=('Arial', 10), relief='solid', bd=1)
+        tiles_entry.pack(side='left', fill='x', expand=True, padx=5)
+        tiles_entry.bind('<Return>', lambda e: self.detect_from_tiles())
+        tk.Button(tiles_frame, text="识别牌型",
+                  font=('Arial', 10),
+                  bg='#F39C12', fg='white',
+                  relief='raised', bd=1,
+                  command=self.detect_from_tiles).pack(side='left')
         
         # 创建两列布局
-        left_col = tk.Frame(parent, bg='#FFFFFF')
-        right_col = tk.Frame(parent, bg='#FFFFFF')
+        columns = tk.Frame(parent, bg='#FFFFFF')
+        columns.pack(fill='x')
+        left_col = tk.Frame(columns, bg='#FFFFFF')
+        right_col = tk.Frame(columns, bg='#FFFFFF')
         left_col.pack(side='left', fill='both', expand=True, padx=(0, 10))
         right_col.pack(side='left', fill='both', expand=True, padx=(10, 0))
         
@@ -896,10 +1658,22 @@ class ScoreInputDialog:
                                font=('Arial', 10),
                                bg='#FFFFFF',
                                fg='#2C3E50',
-                               selectcolor='#F39C12',
-                               command=self.auto_calculate)
+                               selectcolor='#F39C12')
             cb.pack(anchor='w', pady=1)
 
+    def detect_from_tiles(self):
+        """按输入的手牌勾选牌型，自摸、杠上开花等勾选保持不变"""
+        try:
+            extra = [name for name, (_, var) in self.score_types.items()
+                     if var.get() and name not in TILE_TYPES]
+            detected = detect_fans(self.mode, parse_tiles(self.tiles_var.get()), extra)
+        except ValueError as e:
+            self._show_msg(str(e))
+            self.last_selection = None
+            return
+        for name, (_, var) in self.score_types.items():
+            var.set(name in detected)
+
     def create_pao_section(self, parent):
         """创建点炮玩家选择区域"""
         self.pao_var = tk.StringVar(value="")
@@ -911,8 +1685,7 @@ class ScoreInputDialog:
                            font=('Arial', 11),
                            bg='#FFFFFF',
                            fg='#2C3E50',
-                           selectcolor='#9B59B6',
-                           command=self.auto_calculate)
+                           selectcolor='#9B59B6')
         rb.pack(anchor='w', pady=2)
         
         # 玩家选项
@@ -923,8 +1696,7 @@ class ScoreInputDialog:
                                font=('Arial', 11),
                                bg='#FFFFFF',
                                fg='#2C3E50',
-                               selectcolor='#9B59B6',
-                               command=self.auto_calculate)
+                               selectcolor='#9B59B6')
             rb.pack(anchor='w', pady=2)
 
     def create_rules_section(self, parent):
@@ -1000,17 +1772,27 @@ class ScoreInputDialog:
         cancel_btn.pack(side='right', padx=(10, 0))
 
     def setup_auto_calculate(self):
-        """设置自动计算"""
-        for _, var in self.score_types.values():
-            var.trace_add('write', lambda *args: self.auto_calculate())
+        """设置自动计算：任何选项变化都只排队一次刷新"""
+        variables = [var for _, var in self.score_types.values()] + [self.pao_var]
         if self.mode == "传统":
-            self.winner_var.trace_add('write', lambda *args: self.auto_calculate())
-            self.pao_var.trace_add('write', lambda *args: self.auto_calculate())
+            variables.append(self.winner_var)
         else:
-            for var in self.winner_vars.values():
-                var.trace_add('write', lambda *args: self.auto_calculate())
+            variables.extend(self.winner_vars.values())
+        for var in variables:
+            var.trace_add('write', lambda *args: self.schedule_preview())
+
+    def schedule_preview(self):
+        """同一批事件合并为一次空闲时的计算"""
+        if self.preview_pending is None:
+            self.preview_pending = self.dialog.after_idle(self.auto_calculate)
+
+    def cancel_preview(self):
+        if self.preview_pending is not None:
+            self.dialog.after_cancel(self.preview_pending)
+            self.preview_pending = None
 
     def auto_calculate(self):
+        self.preview_pending = None
         try:
             self.calculate_score()
         except Exception:
@@ -1018,183 +1800,74 @@ class ScoreInputDialog:
 
     # ----- 计算逻辑 -----
     def calculate_score(self):
+        self.cancel_preview()
+        # 选项与上次计算时相同，结果和预览都无需更新
+        selection = self._selection()
+        if selection == self.last_selection:
+            return
+        self.last_selection = selection
+
         if self.mode == "传统":
             self._calculate_traditional()
         else:
             self._calculate_xueliu()
 
-    def _collect_fan_info(self):
-        total_fan = 0
-        desc = []
-        is_zimo = False
-        selected_types = []
-        
-        for name, (fan, var) in self.score_types.items():
-            if var.get():
-                selected_types.append(name)
-                total_fan += fan
-                desc.append(f"{name}({fan}番)")
-                if name == "自摸":
-                    is_zimo = True
-        
-        # 血流成河模式的规则验证
-        if self.mode == "血流成河":
-            # 检查互斥的胡牌类型
-            seven_types = ['七对', '龙七对', '清七对', '清龙七对']
-            selected_seven = [t for t in selected_types if t in seven_types]
-            if len(selected_seven) > 1:
-                raise ValueError(f"七对类型互斥，不能同时选择: {', '.join(selected_seven)}")
-            
-            # 天胡地胡互斥
-            if '天胡' in selected_types and '地胡' in selected_types:
-                raise ValueError("天胡和地胡不能同时选择")
-            
-            # 清龙七对已包含清一色和龙七对，不需要重复计算
-            if '清龙七对' in selected_types:
-                if '清一色' in selected_types or '龙七对' in selected_types or '七对' in selected_types:
-                    raise ValueError("清龙七对已包含其他七对和清一色，请勿重复选择")
-            
-            # 清七对已包含清一色和七对
-            if '清七对' in selected_types:
-                if '清一色' in selected_types or '七对' in selected_types:
-                    raise ValueError("清七对已包含清一色和七对，请勿重复选择")
-            
-            # 龙七对已包含七对
-            if '龙七对' in selected_types and '七对' in selected_types:
-                raise ValueError("龙七对已包含七对，请勿重复选择")
-        
-        return total_fan, desc, is_zimo
+    def _selection(self):
+        if self.mode == "传统":
+            winners = (self.winner_var.get(),)
+        else:
+            winners = tuple(p for p, var in self.winner_vars.items() if var.get())
+        return winners, self._selected_mask(), self.pao_var.get()
 
-    def _calculate_traditional(self):
-        winner = self.winner_var.get()
-        if not winner:
-            self._show_msg("请先选择胡牌玩家")
-            return
+    def _selected_mask(self) -> int:
+        mask = 0
+        for name, (_, var) in self.score_types.items():
+            if var.get():
+                mask |= self.type_bits[name]
+        return mask
 
+    def _score(self, winners: List[str]):
+        key = (self.mode, self._selected_mask())
         try:
-            total_fan, desc, is_zimo = self._collect_fan_info()
+            if self.fan_cache is None or self.fan_cache[0] != key:
+                self.fan_cache = (key, score_fan(*key))
+            return settle_hand(self.players, self.mode, winners,
+                               self.fan_cache[1], self.pao_var.get())
         except ValueError as e:
             self._show_msg(str(e))
-            return
-            
-        if total_fan == 0:
-            self._show_msg("请选择至少一种胡牌类型")
-            return
-
-        base = 1
-        final = base * (2 ** total_fan)
-        round_scores = {p: 0 for p in self.players}
-        pao = self.pao_var.get()
+            return None
 
-        if is_zimo or not pao:
-            for p in self.players:
-                if p == winner:
-                    round_scores[p] = final * 3
-                else:
-                    round_scores[p] = -final
-        else:
-            if pao == winner:
-                self._show_msg("点炮玩家不能是胡牌玩家！")
-                return
-            for p in self.players:
-                if p == winner:
-                    round_scores[p] = final
-                elif p == pao:
-                    round_scores[p] = -final
-                else:
-                    round_scores[p] = 0
+    def _calculate_traditional(self):
+        winner = self.winner_var.get()
+        result = self._score([winner] if winner else [])
+        if result is None:
+            return
 
-        preview = f"胡牌: {winner}\n类型: {' + '.join(desc)}\n"
-        preview += f"单家分值: {final}\n分配:\n"
-        for p, sc in round_scores.items():
+        preview = f"胡牌: {winner}\n类型: {result['description']}\n"
+        preview += f"单家分值: {result['final']}\n分配:\n"
+        for p, sc in result['scores'].items():
             preview += f"  {p}: {sc:+d}\n"
-        
-        self.preview_text.config(state='normal')
-        self.preview_text.delete(1.0, tk.END)
-        self.preview_text.insert(tk.END, preview)
-        self.preview_text.config(state='disabled')
+        self._set_preview(preview)
 
-        self.calculated_result = ([winner], ' + '.join(desc), round_scores)
+        self.calculated_result = result
 
     def _calculate_xueliu(self):
         winners = [p for p, var in self.winner_vars.items() if var.get()]
-        if not winners:
-            self._show_msg("请至少勾选一名胡家")
-            return
-
-        try:
-            total_fan, desc, is_zimo = self._collect_fan_info()
-        except ValueError as e:
-            self._show_msg(str(e))
-            return
-            
-        if total_fan == 0:
-            self._show_msg("请选择至少一种胡牌类型")
+        result = self._score(winners)
+        if result is None:
             return
 
-        # 血流成河计分规则：
-        # 1. 基础分为1分，按番数翻倍
-        # 2. 如果有点炮，点炮玩家承担所有胡家的分数
-        # 3. 如果没有点炮（自摸），每个胡家从每个未胡家收取相应分数
-        base = 1
-        final = base * (2 ** total_fan)
-        round_scores = {p: 0 for p in self.players}
-        pao = self.pao_var.get()
-        
-        # 计算未胡家（查叫的玩家）
+        winners = result['winners']
+        pao = result['pao']
         losers = [p for p in self.players if p not in winners]
-        
-        if len(winners) == len(self.players):
-            # 所有人都胡牌，这种情况下没有输家，分数为0
-            self._show_msg("血流成河模式下不能所有人都胡牌！")
-            return
-        
-        # 检查点炮玩家是否合法
-        if pao and pao in winners:
-            self._show_msg("点炮玩家不能是胡牌玩家！")
-            return
-        
-        if is_zimo or not pao:
-            # 自摸情况：每个胡家从每个未胡家收取分数
-            for winner in winners:
-                # 胡家得分 = 单家分值 × 未胡家人数
-                round_scores[winner] = final * len(losers)
-            
-            for loser in losers:
-                # 未胡家失分 = 单家分值 × 胡家人数
-                round_scores[loser] = -final * len(winners)
-            
-            pao_info = "自摸"
-        else:
-            # 点炮情况：点炮玩家承担所有胡家的分数
-            total_pao_cost = final * len(winners)
-            
-            for winner in winners:
-                # 每个胡家得到单家分值
-                round_scores[winner] = final
-            
-            # 点炮玩家承担所有费用
-            round_scores[pao] = -total_pao_cost
-            
-            # 其他未胡家不用付分
-            for loser in losers:
-                if loser != pao:
-                    round_scores[loser] = 0
-            
-            pao_info = f"点炮: {pao}"
-
-        # 验证分数平衡（总和应该为0）
-        total_check = sum(round_scores.values())
-        if total_check != 0:
-            self._show_msg(f"分数计算错误，总和不为0: {total_check}")
-            return
+        pao_info = f"点炮: {pao}" if pao else "自摸"
 
-        preview = f"胡家: {', '.join(winners)}\n类型: {' + '.join(desc)}\n"
-        preview += f"单家分值: {final}\n"
+        preview = f"胡家: {', '.join(winners)}\n类型: {result['description']}\n"
+        preview += f"单家分值: {result['final']}\n"
         preview += f"胡家人数: {len(winners)}，未胡家人数: {len(losers)}\n"
         preview += f"结算方式: {pao_info}\n"
         preview += "分配:\n"
-        for p, sc in round_scores.items():
+        for p, sc in result['scores'].items():
             if p in winners:
                 status = "胡家"
             elif pao and p == pao:
@@ -1204,34 +1877,184 @@ class ScoreInputDialog:
             else:
                 status = "查叫"
             preview += f"  {p} ({status}): {sc:+d}\n"
-        
-        self.preview_text.config(state='normal')
-        self.preview_text.delete(1.0, tk.END)
-        self.preview_text.insert(tk.END, preview)
-        self.preview_text.config(state='disabled')
+        self._set_preview(preview)
 
-        self.calculated_result = (winners, ' + '.join(desc), round_scores)
+        self.calculated_result = result
 
     # ----- 其他 -----
-    def _show_msg(self, txt: str):
+    def _set_preview(self, txt: str):
+        if txt == self.preview_shown:
+            return
+        self.preview_shown = txt
         self.preview_text.config(state='normal')
         self.preview_text.delete(1.0, tk.END)
         self.preview_text.insert(tk.END, txt)
         self.preview_text.config(state='disabled')
+
+    def _show_msg(self, txt: str):
+        self._set_preview(txt)
         self.calculated_result = None
 
     def ok_clicked(self):
+        # 还在排队的预览先算完，避免记入改选之前的结果
+        self.cancel_preview()
+        try:
+            self.calculate_score()
+        except Exception:
+            self.calculated_result = None
         if self.calculated_result:
             self.result = self.calculated_result
-            self.dialog.destroy()
+            self.hide()
         else:
             messagebox.showwarning("警告", "请先正确计算分数！")
 
     def cancel_clicked(self):
+        self.result = None
+        self.hide()
+
+
+class HistoryViewer:
+    """完整历史窗口
+
+    只为可见区域创建固定数量的行并循环复用，滚动时仅更新文字；
+    会话尚未加载的早期记录由窗口自己的分页缓存读取，不改动会话状态，
+    数万条记录也能流畅滚动
+    """
+
+    ROW_HEIGHT = 22
+
+    def __init__(self, app: SichuanMahjongGUI):
+        self.app = app
+        self.first = 0        # 第一可见行在完整历史中的位置
+        self.follow = True    # 位于底部时自动跟随新记录
+        self.rows = []        # 复用的行：(背景矩形, 文本)
+        self.pages: Optional[PageCache] = None  # 会话未加载部分的只读缓存
+
+        self.dialog = tk.Toplevel(app.root)
+        self.dialog.title("完整历史")
+        self.dialog.geometry("760x520")
+        self.dialog.configure(bg='#F8F9FA')
+        self.dialog.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.create_ui()
+        self.refresh()
+
+    def create_ui(self):
+        """创建UI"""
+        main_container = tk.Frame(self.dialog, bg='#FFFFFF', relief='solid', bd=1)
+        main_container.pack(fill='both', expand=True, padx=15, pady=15)
+
+        self.summary_label = tk.Label(main_container, text="",
+                                      font=('Arial', 11, 'bold'),
+                                      bg='#FFFFFF', fg='#2C3E50')
+        self.summary_label.pack(anchor='w', padx=10, pady=(10, 5))
+
+        list_frame = tk.Frame(main_container, bg='#FFFFFF')
+        list_frame.pack(fill='both', expand=True, padx=10, pady=(0, 10))
+
+        self.scrollbar = tk.Scrollbar(list_frame, orient='vertical', command=self.on_scrollbar)
+        self.scrollbar.pack(side='right', fill='y')
+
+        self.canvas = tk.Canvas(list_frame, bg='#FFFFFF', highlightthickness=0)
+        self.canvas.pack(side='left', fill='both', expand=True)
+
+        self.canvas.bind('<Configure>', lambda e: self.render())
+        self.canvas.bind('<MouseWheel>', self.on_mousewheel)
+        self.canvas.bind('<Button-4>', lambda e: self.scroll_by(-3))
+        self.canvas.bind('<Button-5>', lambda e: self.scroll_by(3))
+
+    # ----- 数据 -----
+    @property
+    def total(self) -> int:
+        return self.app.history_skipped + len(self.app.game_history)
+
+    def visible_count(self) -> int:
+        return max(1, self.canvas.winfo_height() // self.ROW_HEIGHT)
+
+    def record_at(self, pos: int) -> Optional[Dict]:
+        app = self.app
+        if pos >= app.history_skipped:
+            return app.game_history[pos - app.history_skipped]
+        # 缓存按位置覆盖创建时会话未加载的部分；之后会话向前加载只会缩小这个范围。
+        # 存储写入后（SQLite保存时会重新编号）记下的起点可能失效，需重新创建
+        if self.pages is None or self.pages.store is not app.store or \
+                self.pages.generation != app.store.generation or \
+                self.pages.count < app.history_skipped:
+            self.pages = PageCache(app.store, app.history_start, app.history_skipped)
+        return self.pages.record(pos)
+
+    @staticmethod
+    def format_row(rec: Dict) -> str:
+        hand_info = f"第{rec.get('hand_num', 1)}手" if rec.get('hand_num', 1) > 1 else ""
+        status = "✅" if rec.get('round_ended', True) else "🔄"
+        scores = "  ".join(f"{p} {sc:+d}" for p, sc in rec['scores'].items())
+        return (f"第{rec['round']}局{hand_info} {status}  {rec['timestamp']}  "
+                f"{rec['description']} | 胜者: {rec['winner']}  |  {scores}")
+
+    # ----- 滚动 -----
+    def on_scrollbar(self, *args):
+        if args[0] == 'moveto':
+            self.first = int(float(args[1]) * self.total)
+        elif args[0] == 'scroll':
+            step = self.visible_count() if args[2] == 'pages' else 1
+            self.first += int(args[1]) * step
+        self.render()
+
+    def on_mousewheel(self, event):
+        if abs(event.delta) >= 120:
+            self.scroll_by(int(-1 * (event.delta / 120)) * 3)
+        else:  # macOS
+            self.scroll_by(-event.delta)
+
+    def scroll_by(self, rows: int):
+        self.first += rows
+        self.render()
+
+    def refresh(self):
+        """历史有变化时调用：位于底部时跟随到最新记录"""
+        if self.follow:
+            self.first = self.total
+        self.render()
+
+    def render(self):
+        """只渲染可见区域的行"""
+        total = self.total
+        visible = self.visible_count()
+        self.first = max(0, min(self.first, total - visible))
+        self.follow = self.first + visible >= total
+
+        # 行池只在窗口变高时增加
+        width = self.canvas.winfo_width()
+        while len(self.rows) < visible + 1:
+            y = len(self.rows) * self.ROW_HEIGHT
+            bg = '#F8F9FA' if len(self.rows) % 2 else '#FFFFFF'
+            rect = self.canvas.create_rectangle(0, y, width, y + self.ROW_HEIGHT,
+                                                fill=bg, outline='')
+            text = self.canvas.create_text(8, y + self.ROW_HEIGHT // 2, anchor='w',
+                                           font=('Arial', 9), fill='#2C3E50')
+            self.rows.append((rect, text))
+
+        for i, (rect, text) in enumerate(self.rows):
+            y = i * self.ROW_HEIGHT
+            self.canvas.coords(rect, 0, y, width, y + self.ROW_HEIGHT)
+            pos = self.first + i
+            rec = self.record_at(pos) if pos < total else None
+            self.canvas.itemconfig(text, text=self.format_row(rec) if rec else "")
+
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + visible) / total))
+            self.summary_label.config(
+                text=f"共 {total} 条记录 · 第 {self.first + 1}-{min(total, self.first + visible)} 条")
+        else:
+            self.scrollbar.set(0, 1)
+            self.summary_label.config(text="暂无游戏记录")
+
+    def close(self):
+        self.app.history_viewer = None
         self.dialog.destroy()
 
 
 # ---------- main ----------
 if __name__ == "__main__":
-    app = SichuanMahjongGUI()
+    app = SichuanMahjongGUI(storage="sqlite" if "--sqlite" in sys.argv else "json")
     app.run() 
\ No newline at end of file